@@ -14,7 +14,14 @@ from aiortc import (
     RTCSessionDescription,
     VideoStreamTrack,
 )
-from aiortc.contrib.media import MediaBlackhole, MediaPlayer, MediaRecorder, generator_type
+from aiortc.contrib.media import (
+    MediaBlackhole,
+    MediaPlayer,
+    MediaRecorder,
+    generator_type,
+    requires_model,
+    warm_up_model,
+)
 from aiortc.contrib.signaling import BYE, add_signaling_arguments, create_signaling
 
 
@@ -188,6 +195,11 @@ if __name__ == "__main__":
 
     # run event loop
     loop = asyncio.get_event_loop()
+
+    # warm up the shared prediction model before connecting
+    if requires_model(args.enable_prediction):
+        loop.run_until_complete(warm_up_model())
+
     try:
         loop.run_until_complete(
             run(
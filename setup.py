@@ -25,7 +25,7 @@ install_requires = [
     'dataclasses; python_version < "3.7"',
     "google-crc32c>=1.1",
     "pyee>=6.0.0",
-    "pylibsrtp>=0.5.6",
+    "pylibsrtp>=0.10.0",
 ]
 
 extras_require = {
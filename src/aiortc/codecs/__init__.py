@@ -9,12 +9,21 @@ from ..rtcrtpparameters import (
     RTCRtpHeaderExtensionCapability,
     RTCRtpHeaderExtensionParameters,
 )
+from ..rtp import FRAME_INDEX_URI, TRANSPORT_CC_URI
 from .base import Decoder, Encoder
 from .g711 import PcmaDecoder, PcmaEncoder, PcmuDecoder, PcmuEncoder
 from .h264 import H264Decoder, H264Encoder, h264_depayload
 from .opus import OpusDecoder, OpusEncoder
 from .vpx import Vp8Decoder, Vp8Encoder, vp8_depayload
-from .keypointcodec import KeypointsEncoder, KeypointsDecoder
+from .keypointcodec import (
+    DEFAULT_JACOBIAN_BITS,
+    KeypointsBinnedDecoder,
+    KeypointsBinnedEncoder,
+    KeypointsDecoder,
+    KeypointsDeltaDecoder,
+    KeypointsDeltaEncoder,
+    KeypointsEncoder,
+)
 from .keypoints_pb2 import KeypointInfo
 
 PCMU_CODEC = RTCRtpCodecParameters(
@@ -28,6 +37,23 @@ PCMA_CODEC = RTCRtpCodecParameters(
 KEYPOINTS_CODEC = RTCRtpCodecParameters(
     mimeType="keypoints/dummy", clockRate=8000, channels=1, payloadType=8
 )
+KEYPOINTS_DELTA_CODEC = RTCRtpCodecParameters(
+    mimeType="keypoints/delta", clockRate=8000, channels=1, payloadType=120
+)
+KEYPOINTS_BINNED_CODECS = [
+    RTCRtpCodecParameters(
+        mimeType="keypoints/binned",
+        clockRate=8000,
+        channels=1,
+        payloadType=payloadType,
+        parameters=OrderedDict([("jacobian-bits", str(jacobian_bits))]),
+    )
+    for payloadType, jacobian_bits in [(121, 8), (122, 6), (123, 4)]
+]
+# redundant encoding of the keypoints codecs, each block names its codec
+KEYPOINTS_RED_CODEC = RTCRtpCodecParameters(
+    mimeType="keypoints/red", clockRate=8000, channels=1, payloadType=124
+)
 
 CODECS: Dict[str, List[RTCRtpCodecParameters]] = {
     "audio": [
@@ -38,14 +64,15 @@ CODECS: Dict[str, List[RTCRtpCodecParameters]] = {
         PCMA_CODEC,
     ],
     "video": [],
-    "keypoints": [
-        KEYPOINTS_CODEC
-    ],
+    "keypoints": [KEYPOINTS_CODEC, KEYPOINTS_DELTA_CODEC]
+    + KEYPOINTS_BINNED_CODECS
+    + [KEYPOINTS_RED_CODEC],
     "lr_video": [],
 }
 HEADER_EXTENSIONS: Dict[str, List[RTCRtpHeaderExtensionParameters]] = {
     "audio": [
-        RTCRtpHeaderExtensionParameters(id=1, uri="urn:ietf:params:rtp-hdrext:sdes:mid")
+        RTCRtpHeaderExtensionParameters(id=1, uri="urn:ietf:params:rtp-hdrext:sdes:mid"),
+        RTCRtpHeaderExtensionParameters(id=4, uri=TRANSPORT_CC_URI),
     ],
     "video": [
         RTCRtpHeaderExtensionParameters(
@@ -54,9 +81,12 @@ HEADER_EXTENSIONS: Dict[str, List[RTCRtpHeaderExtensionParameters]] = {
         RTCRtpHeaderExtensionParameters(
             id=2, uri="http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time"
         ),
+        RTCRtpHeaderExtensionParameters(id=3, uri=FRAME_INDEX_URI),
+        RTCRtpHeaderExtensionParameters(id=4, uri=TRANSPORT_CC_URI),
     ],
     "keypoints": [
-        RTCRtpHeaderExtensionParameters(id=1, uri="urn:ietf:params:rtp-hdrext:sdes:mid")
+        RTCRtpHeaderExtensionParameters(id=1, uri="urn:ietf:params:rtp-hdrext:sdes:mid"),
+        RTCRtpHeaderExtensionParameters(id=4, uri=TRANSPORT_CC_URI),
     ],
     "lr_video": [
         RTCRtpHeaderExtensionParameters(
@@ -65,6 +95,8 @@ HEADER_EXTENSIONS: Dict[str, List[RTCRtpHeaderExtensionParameters]] = {
         RTCRtpHeaderExtensionParameters(
             id=2, uri="http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time"
         ),
+        RTCRtpHeaderExtensionParameters(id=3, uri=FRAME_INDEX_URI),
+        RTCRtpHeaderExtensionParameters(id=4, uri=TRANSPORT_CC_URI),
     ],
 }
 
@@ -87,6 +119,7 @@ def init_codecs() -> None:
                     RTCRtcpFeedback(type="nack"),
                     RTCRtcpFeedback(type="nack", parameter="pli"),
                     RTCRtcpFeedback(type="goog-remb"),
+                    RTCRtcpFeedback(type="transport-cc"),
                 ],
                 parameters=parameters or OrderedDict(),
             ),
@@ -180,6 +213,10 @@ def get_decoder(codec: RTCRtpCodecParameters) -> Decoder:
         return Vp8Decoder()
     elif mimeType == "keypoints/dummy":
         return KeypointsDecoder()
+    elif mimeType == "keypoints/delta":
+        return KeypointsDeltaDecoder()
+    elif mimeType == "keypoints/binned":
+        return KeypointsBinnedDecoder()
     else:
         raise ValueError(f"No decoder found for MIME type `{mimeType}`")
 
@@ -199,10 +236,20 @@ def get_encoder(codec: RTCRtpCodecParameters) -> Encoder:
         return Vp8Encoder()
     elif mimeType == "keypoints/dummy":
         return KeypointsEncoder()
+    elif mimeType == "keypoints/delta":
+        return KeypointsDeltaEncoder()
+    elif mimeType == "keypoints/binned":
+        return KeypointsBinnedEncoder(
+            int(codec.parameters.get("jacobian-bits", DEFAULT_JACOBIAN_BITS))
+        )
     else:
         raise ValueError(f"No encoder found for MIME type `{mimeType}`")
 
 
+def is_red(codec: Union[RTCRtpCodecCapability, RTCRtpCodecParameters]) -> bool:
+    return codec.name.lower() == "red"
+
+
 def is_rtx(codec: Union[RTCRtpCodecCapability, RTCRtpCodecParameters]) -> bool:
     return codec.name.lower() == "rtx"
 
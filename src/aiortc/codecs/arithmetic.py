@@ -0,0 +1,189 @@
+from typing import List, Tuple
+
+PRECISION = 32
+FULL_RANGE = (1 << PRECISION) - 1
+HALF_RANGE = 1 << (PRECISION - 1)
+QUARTER_RANGE = 1 << (PRECISION - 2)
+
+# adaptive model parameters, the total frequency must stay well below
+# QUARTER_RANGE for the coder to keep enough precision
+MODEL_INCREMENT = 24
+MODEL_MAX_TOTAL = 1 << 16
+
+
+class AdaptiveModel:
+    """
+    Adaptive frequency model over the symbols `0` to `num_symbols - 1`.
+
+    Frequencies are kept in a Fenwick tree so that cumulative frequency
+    lookups and updates are logarithmic in the number of symbols.
+    """
+
+    def __init__(self, num_symbols: int) -> None:
+        self.num_symbols = num_symbols
+        self.reset()
+
+    def reset(self) -> None:
+        self._frequencies = [1] * self.num_symbols
+        self._rebuild()
+
+    @property
+    def total(self) -> int:
+        return self._total
+
+    def cumulative(self, symbol: int) -> Tuple[int, int]:
+        """
+        Return the cumulative frequency range `[low, high)` of `symbol`.
+        """
+        low = 0
+        i = symbol
+        while i > 0:
+            low += self._tree[i]
+            i -= i & -i
+        return low, low + self._frequencies[symbol]
+
+    def find(self, value: int) -> int:
+        """
+        Return the symbol whose cumulative frequency range contains `value`.
+        """
+        symbol = 0
+        step = self._top_bit
+        while step:
+            if symbol + step <= self.num_symbols and self._tree[symbol + step] <= value:
+                symbol += step
+                value -= self._tree[symbol]
+            step >>= 1
+        return symbol
+
+    def update(self, symbol: int) -> None:
+        self._frequencies[symbol] += MODEL_INCREMENT
+        self._total += MODEL_INCREMENT
+        if self._total > MODEL_MAX_TOTAL:
+            self._frequencies = [(f + 1) // 2 for f in self._frequencies]
+            self._rebuild()
+        else:
+            i = symbol + 1
+            while i <= self.num_symbols:
+                self._tree[i] += MODEL_INCREMENT
+                i += i & -i
+
+    def _rebuild(self) -> None:
+        self._tree = [0] + self._frequencies
+        for i in range(1, self.num_symbols + 1):
+            parent = i + (i & -i)
+            if parent <= self.num_symbols:
+                self._tree[parent] += self._tree[i]
+        self._total = sum(self._frequencies)
+        self._top_bit = 1 << (self.num_symbols.bit_length() - 1)
+
+
+class ArithmeticEncoder:
+    """
+    Binary arithmetic (range) encoder driven by an :class:`AdaptiveModel`.
+    """
+
+    def __init__(self) -> None:
+        self._bits: List[int] = []
+        self._low = 0
+        self._high = FULL_RANGE
+        self._pending = 0
+
+    def encode(self, model: AdaptiveModel, symbol: int) -> None:
+        cum_low, cum_high = model.cumulative(symbol)
+        total = model.total
+        span = self._high - self._low + 1
+        self._high = self._low + span * cum_high // total - 1
+        self._low = self._low + span * cum_low // total
+        model.update(symbol)
+
+        while True:
+            if self._high < HALF_RANGE:
+                self._emit(0)
+            elif self._low >= HALF_RANGE:
+                self._emit(1)
+                self._low -= HALF_RANGE
+                self._high -= HALF_RANGE
+            elif self._low >= QUARTER_RANGE and self._high < 3 * QUARTER_RANGE:
+                self._pending += 1
+                self._low -= QUARTER_RANGE
+                self._high -= QUARTER_RANGE
+            else:
+                break
+            self._low <<= 1
+            self._high = (self._high << 1) | 1
+
+    def finish(self) -> bytes:
+        """
+        Flush the encoder state and return the coded bytes.
+        """
+        self._pending += 1
+        self._emit(0 if self._low < QUARTER_RANGE else 1)
+
+        # pad to a whole number of bytes
+        self._bits.extend([0] * (-len(self._bits) % 8))
+        data = bytearray()
+        for i in range(0, len(self._bits), 8):
+            byte = 0
+            for bit in self._bits[i : i + 8]:
+                byte = (byte << 1) | bit
+            data.append(byte)
+        return bytes(data)
+
+    def _emit(self, bit: int) -> None:
+        self._bits.append(bit)
+        self._bits.extend([bit ^ 1] * self._pending)
+        self._pending = 0
+
+
+class ArithmeticDecoder:
+    """
+    Binary arithmetic (range) decoder matching :class:`ArithmeticEncoder`.
+    """
+
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+        self._position = 0
+        self._low = 0
+        self._high = FULL_RANGE
+        self._value = 0
+        for i in range(PRECISION):
+            self._value = (self._value << 1) | self._read_bit()
+
+    def decode(self, model: AdaptiveModel) -> int:
+        total = model.total
+        span = self._high - self._low + 1
+        scaled = ((self._value - self._low + 1) * total - 1) // span
+        symbol = model.find(scaled)
+
+        cum_low, cum_high = model.cumulative(symbol)
+        self._high = self._low + span * cum_high // total - 1
+        self._low = self._low + span * cum_low // total
+        model.update(symbol)
+
+        while True:
+            if self._high < HALF_RANGE:
+                pass
+            elif self._low >= HALF_RANGE:
+                self._low -= HALF_RANGE
+                self._high -= HALF_RANGE
+                self._value -= HALF_RANGE
+            elif self._low >= QUARTER_RANGE and self._high < 3 * QUARTER_RANGE:
+                self._low -= QUARTER_RANGE
+                self._high -= QUARTER_RANGE
+                self._value -= QUARTER_RANGE
+            else:
+                break
+            self._low <<= 1
+            self._high = (self._high << 1) | 1
+            self._value = (self._value << 1) | self._read_bit()
+
+        return symbol
+
+    def _read_bit(self) -> int:
+        # past the end of the data, the stream is implicitly zero-padded
+        byte_index = self._position >> 3
+        bit = 0
+        if byte_index < len(self._data):
+            bit = (self._data[byte_index] >> (7 - (self._position & 7))) & 1
+        self._position += 1
+        return bit
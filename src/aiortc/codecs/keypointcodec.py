@@ -1,31 +1,51 @@
-import audioop
-import fractions
 import numpy as np
 import os
-from typing import List, Optional, Tuple
+from typing import List, Tuple
 
 from ..jitterbuffer import JitterFrame
+from .arithmetic import AdaptiveModel, ArithmeticDecoder, ArithmeticEncoder
 from .base import Decoder, Encoder
 from .keypoints_pb2 import KeypointInfo
-import bitstring
 import math
+import logging
 
 from ..mediastreams import KeypointsFrame
 
+logger = logging.getLogger(__name__)
+
 NUM_KP = 10
 FRAME_SIZE = int(os.environ.get('FRAME_SIZE', 1024))
 NUM_JACOBIAN_BITS = 16
-SCALE_FACTOR = FRAME_SIZE//2
+SCALE_FACTOR = FRAME_SIZE // 2
+KP_BITS = int(math.log(FRAME_SIZE, 2))
 FRAME_INDEX_BITS = 16
 SRC_INDEX_BITS = 16
+HEADER_BITS = FRAME_INDEX_BITS + SRC_INDEX_BITS
 DUMMY_PTS = 5
 
-""" custom codec that uses the protobuf module 
-    to generically serialize and de-serialize 
-    keypoints and associated information
-    (might warrant further optimization, once 
-    we settle on final data format)
-"""
+# temporal delta coding
+KEYFRAME_INTERVAL = int(os.environ.get('KEYPOINTS_KEYFRAME_INTERVAL', 30))
+KEY_FRAME = 0
+DELTA_FRAME = 1
+FRAME_TYPE_BITS = 8
+DELTA_HEADER_BITS = FRAME_TYPE_BITS + HEADER_BITS + FRAME_INDEX_BITS
+
+# entropy coding of binned jacobians
+DEFAULT_JACOBIAN_BITS = 6
+MIN_JACOBIAN_BITS = 3
+MAX_JACOBIAN_BITS = 12
+MODEL_INTERVAL = min(KEYFRAME_INTERVAL, 256)
+BINNED_FIELD_BITS = 8
+BINNED_HEADER_BITS = HEADER_BITS + 3 * BINNED_FIELD_BITS
+BINNED_HEADER_SIZE = (BINNED_HEADER_BITS + 2 * NUM_KP * KP_BITS + 7) // 8
+
+
+# custom codec that uses the protobuf module
+# to generically serialize and de-serialize
+# keypoints and associated information
+# (might warrant further optimization, once
+# we settle on final data format)
+
 
 def keypoint_dict_to_struct(keypoint_dict):
     """ parse a keypoint dictionary form into a keypoint info structure """
@@ -36,7 +56,7 @@ def keypoint_dict_to_struct(keypoint_dict):
             keypoint = keypoint_info_struct.keypoints.add()
             keypoint.xloc = k[0]
             keypoint.yloc = k[1]
-    
+
     if 'jacobians' in keypoint_dict:
         for j in keypoint_dict['jacobians']:
             jacobian = keypoint_info_struct.jacobians.add()
@@ -48,31 +68,121 @@ def keypoint_dict_to_struct(keypoint_dict):
     keypoint_info_struct.pts = keypoint_dict['pts']
     keypoint_info_struct.frame_index = keypoint_dict['frame_index']
     keypoint_info_struct.source_index = keypoint_dict['source_index']
-    
-    return keypoint_info_struct
-
-
-def jacobian_to_float16(jacobian_val):
-    """ convert jacobian to a 16 bit float value """
-    bit_array = bitstring.BitArray(float=jacobian_val, length=32)
-    bit_32 = bit_array.bin
-    sign = bit_32[0]
-    exponent = int(bit_32[1:9], 2) - 127 + 15
-    exponent = max(min(exponent, 30), 1)
-    mantissa = bit_32[9:][:10]
 
-    binary_str = f'{sign}{exponent:05b}{mantissa}'
-    return binary_str
+    return keypoint_info_struct
 
 
-def float16_to_jacobian(float16_bit_str):
-    """ convert a float 16 value to jacobian """
-    sign = float16_bit_str[0]
-    exponent = int(float16_bit_str[1:6], 2) - 15 + 127
-    mantissa = float16_bit_str[6:] + '0000000000000'
-    float32_bitstring = f'0b{sign}{exponent:08b}{mantissa}'
-    bit_array =  bitstring.BitArray(float32_bitstring)
-    return bit_array.float
+def jacobian_to_float16(jacobians):
+    """ convert jacobians to 16 bit float words
+
+        the float32 mantissa is truncated (not rounded) and the
+        exponent clamped to the normal float16 range, so that
+        every word is a valid normal float16 value
+    """
+    bits_32 = np.asarray(jacobians, dtype=np.float32).reshape(-1).view(np.uint32)
+    sign = bits_32 >> 31
+    exponent = ((bits_32 >> 23) & 0xFF).astype(np.int32) - 127 + 15
+    exponent = np.clip(exponent, 1, 30).astype(np.uint32)
+    mantissa = (bits_32 >> 13) & 0x3FF
+    return ((sign << 15) | (exponent << 10) | mantissa).astype(np.uint16)
+
+
+def float16_to_jacobian(float16_words):
+    """ convert 16 bit float words to jacobians """
+    words = np.asarray(float16_words, dtype=np.uint16)
+    return words.view(np.float16).astype(np.float64)
+
+
+def int_to_bits(values, num_bits):
+    """ expand each row of integers into a most significant
+        bit first bit array, one row of bits per row of values
+    """
+    values = np.asarray(values).astype(np.uint32)
+    values = values.reshape(len(values), -1, 1)
+    shifts = np.arange(num_bits - 1, -1, -1, dtype=np.uint32)
+    return ((values >> shifts) & 1).astype(np.uint8).reshape(len(values), -1)
+
+
+def bits_to_int(bits, num_bits):
+    """ collapse each row of most significant bit first bits into integers """
+    weights = np.uint32(1) << np.arange(num_bits - 1, -1, -1, dtype=np.uint32)
+    return bits.reshape(len(bits), -1, num_bits).astype(np.uint32) @ weights
+
+
+def quantize_keypoints(keypoints):
+    """ map keypoint locations onto the integer frame grid,
+        in the precision they were computed in
+    """
+    locations = np.round(np.asarray(keypoints) * SCALE_FACTOR + SCALE_FACTOR)
+    return np.clip(locations, 0, FRAME_SIZE - 1).astype(np.int64)
+
+
+def dequantize_keypoints(locations):
+    """ map integer frame grid locations back to keypoints """
+    return (np.asarray(locations, dtype=np.float64) - SCALE_FACTOR) / float(SCALE_FACTOR)
+
+
+def float16_to_ordered(float16_words):
+    """ map sign-magnitude float16 words onto integers that
+        preserve the ordering of the values they represent
+    """
+    words = np.asarray(float16_words).astype(np.int64)
+    magnitude = words & 0x7FFF
+    return np.where(words >> 15, -magnitude, magnitude)
+
+
+def ordered_to_float16(ordered):
+    """ inverse of float16_to_ordered """
+    ordered = np.asarray(ordered, dtype=np.int64)
+    return (np.abs(ordered) | ((ordered < 0) << 15)).astype(np.uint16)
+
+
+def exp_golomb_encode(values):
+    """ encode signed integers as a flat array of Exp-Golomb code bits """
+    values = np.asarray(values, dtype=np.int64).reshape(-1)
+    codes = ((values << 1) ^ (values >> 63)) + 1
+    num_bits = np.frexp(codes)[1].reshape(-1, 1)
+
+    # each code is num_bits - 1 zeros followed by the num_bits of the value
+    matrix = np.zeros((len(codes), 64), dtype=np.uint8)
+    matrix[:, 32:] = int_to_bits(codes.reshape(-1, 1), 32)
+    column = np.arange(64)
+    mask = ((column >= 33 - num_bits) & (column < 32)) | (column >= 64 - num_bits)
+    return matrix[mask]
+
+
+def exp_golomb_decode(bits, count):
+    """ decode count signed Exp-Golomb codes from the start of a flat bit
+        array, returning the values and the number of bits consumed
+    """
+    # position of the next set bit at or after each position
+    next_one = np.full(len(bits) + 1, len(bits))
+    ones = np.flatnonzero(bits)
+    next_one[ones] = ones
+    next_one = np.minimum.accumulate(next_one[::-1])[::-1].tolist()
+
+    starts = []
+    ends = []
+    pos = 0
+    for _ in range(count):
+        start = next_one[pos]
+        end = 2 * start - pos + 1
+        if end > len(bits):
+            raise ValueError("Exp-Golomb code is truncated")
+        starts.append(start)
+        ends.append(end)
+        pos = end
+
+    if not count:
+        return np.zeros(0, dtype=np.int64), pos
+
+    starts = np.array(starts).reshape(-1, 1)
+    ends = np.array(ends).reshape(-1, 1)
+    width = int((ends - starts).max())
+    index = ends - width + np.arange(width)
+    window = np.where(index >= starts, bits[np.maximum(index, 0)], 0)
+    codes = bits_to_int(window, width).reshape(-1).astype(np.int64) - 1
+    return (codes >> 1) ^ -(codes & 1), pos
 
 
 def keypoint_struct_to_dict(keypoint_info_struct):
@@ -85,7 +195,7 @@ def keypoint_struct_to_dict(keypoint_info_struct):
         for k in keypoints:
             kp_array.append(np.array([k.xloc, k.yloc]))
         keypoint_dict['keypoints'] = np.array(kp_array)
-    
+
     if len(keypoint_info_struct.jacobians) > 0:
         jacobian_array = []
         jacobians = keypoint_info_struct.jacobians
@@ -100,10 +210,9 @@ def keypoint_struct_to_dict(keypoint_info_struct):
     return keypoint_dict
 
 
-""" compute the bin corresponding to the jacobian value
-    based on the Huffman dictionary for the desired
-    number of bins/bits
-"""
+# compute the bin corresponding to the jacobian value
+# based on the Huffman dictionary for the desired
+# number of bins/bits
 def jacobian_to_bin(value, num_bins):
     sign = int(value > 0)
     value = abs(value)
@@ -120,10 +229,9 @@ def jacobian_to_bin(value, num_bins):
     return sign, bin_num
 
 
-""" compute the approximate jacobian from the bin number
-    based on the Huffman dictionary for the desired
-    number of bins/bits
-"""
+# compute the approximate jacobian from the bin number
+# based on the Huffman dictionary for the desired
+# number of bins/bits
 def bin_to_jacobian(bin_num, num_bins):
     if bin_num < num_bins - 3:
         num_intervals = num_bins - 3
@@ -138,114 +246,142 @@ def bin_to_jacobian(bin_num, num_bins):
     return value
 
 
-""" custom encoding for keypoint data using lossless
-    8-bit encoding for keypoint locations and lossy
-    Huffman binning/encoding of jacobians
-"""
+# vectorized jacobian_to_bin over an array of jacobian
+# values, returning the signs and bin numbers
+def jacobians_to_bins(values, num_bins):
+    values = np.asarray(values, dtype=np.float64).reshape(-1)
+    signs = (values > 0).astype(np.int64)
+    magnitudes = np.abs(values)
+    bins = np.select(
+        [magnitudes > 3, magnitudes > 2.5, magnitudes > 2],
+        [num_bins - 1, num_bins - 2, num_bins - 3],
+        (np.minimum(magnitudes, 2) / 2.0 * (num_bins - 3)).astype(np.int64),
+    )
+    return signs, bins
+
+
+# vectorized bin_to_jacobian over arrays of signs
+# and bin numbers, returning signed jacobian values
+def bins_to_jacobians(signs, bins, num_bins):
+    bins = np.asarray(bins)
+    num_intervals = num_bins - 3
+    interval_size = 2.0
+    magnitudes = np.select(
+        [bins < num_bins - 3, bins == num_bins - 3, bins == num_bins - 2],
+        [(interval_size / num_intervals) * (bins + 0.5), 2.25, 2.75],
+        3.0,
+    )
+    return np.where(signs, magnitudes, -magnitudes)
+
+
+# custom encoding for keypoint data using lossless
+# 8-bit encoding for keypoint locations and lossy
+# Huffman binning/encoding of jacobians
 def custom_encode(keypoint_dict):
-    binary_str = ""
-    num_bins = 2 ** (NUM_JACOBIAN_BITS - 1)
-    bit_format = f'0{NUM_JACOBIAN_BITS - 1}b'
-
-    # frame index
-    index = keypoint_dict['frame_index']
-    index_bit_format = f'0{FRAME_INDEX_BITS}b'
-    binary_str += f'{index:{index_bit_format}}'
-
-    # source frame index
-    src_index = keypoint_dict['source_index']
-    index_bit_format = f'0{SRC_INDEX_BITS}b'
-    binary_str += f'{src_index:{index_bit_format}}'
-        
-    kp_bits = int(math.log(FRAME_SIZE, 2))
-    for i, k in enumerate(keypoint_dict['keypoints']):
-        x = min(round(k[0] * SCALE_FACTOR + SCALE_FACTOR), FRAME_SIZE - 1)
-        y = min(round(k[1] * SCALE_FACTOR + SCALE_FACTOR), FRAME_SIZE - 1)
-        binary_str += f'{x:0{kp_bits}b}'
-        binary_str += f'{y:0{kp_bits}b}'
-
-    for j in keypoint_dict['jacobians']:
-        flattened_jacobians = j.flatten()
-        for element in flattened_jacobians:
-            binary_str += jacobian_to_float16(element)
-
-    return int(binary_str, 2).to_bytes(len(binary_str) // 8, byteorder='big')
-
-
-""" custom decoding for keypoint data using lossless
-    decoding for 8-bit keypoint locations and lossy
-    decoding of jacobians based on Huffman bins
-"""
+    return custom_encode_batch([keypoint_dict])[0]
+
+
+# custom encoding of several keypoint dictionaries
+# in a single vectorized pass, returning one payload
+# per dictionary
+def custom_encode_batch(keypoint_dicts):
+    count = len(keypoint_dicts)
+
+    # frame index and source frame index
+    index_bits = int_to_bits([d['frame_index'] for d in keypoint_dicts], FRAME_INDEX_BITS)
+    src_index_bits = int_to_bits([d['source_index'] for d in keypoint_dicts], SRC_INDEX_BITS)
+
+    # keypoint locations
+    keypoints = np.stack([np.asarray(d['keypoints']) for d in keypoint_dicts])
+    kp_bits = int_to_bits(quantize_keypoints(keypoints), KP_BITS)
+
+    # jacobians
+    jacobians = np.stack([np.asarray(d['jacobians']) for d in keypoint_dicts])
+    jacobian_words = jacobian_to_float16(jacobians).reshape(count, -1)
+    jacobian_bits = int_to_bits(jacobian_words, NUM_JACOBIAN_BITS)
+
+    bits = np.concatenate([index_bits, src_index_bits, kp_bits, jacobian_bits], axis=1)
+    return [row.tobytes() for row in np.packbits(bits, axis=1)]
+
+
+# custom decoding for keypoint data using lossless
+# decoding for 8-bit keypoint locations and lossy
+# decoding of jacobians based on Huffman bins
 def custom_decode(serialized_data):
-    num_bins = 2**(NUM_JACOBIAN_BITS - 1)
-    bitstring = ''.join(format(byte, '08b') for byte in serialized_data)
-
-    keypoint_dict = {'jacobians': [], 'keypoints': []}
-    num_read_so_far = 0
-    x, y = 0, 0
-    kp_locations = []
-    jacobians = []
-
-    # frame index
-    index = int(bitstring[:FRAME_INDEX_BITS], 2)
-    keypoint_dict['frame_index'] = index
-    bitstring = bitstring[FRAME_INDEX_BITS:]
-    
-    # source frame index to reconstruct from
-    source_index = int(bitstring[:SRC_INDEX_BITS], 2)
-    keypoint_dict['source_index'] = source_index
-    bitstring = bitstring[SRC_INDEX_BITS:]
-    
-    kp_bits = int(math.log(FRAME_SIZE, 2))
-    while len(bitstring) > 0:
-        num_bits = 16 if num_read_so_far >= 2*NUM_KP else kp_bits
-        word = bitstring[:num_bits]
-        bitstring = bitstring[num_bits:]
-        num_read_so_far += 1
-
-        if num_read_so_far <= 2 * NUM_KP:
-            value = ((int(word, 2) - SCALE_FACTOR) / float(SCALE_FACTOR))
-            if num_read_so_far % 2 == 0:
-                kp_locations.append(value)
-                keypoint_dict['keypoints'].append(np.array(kp_locations))
-                kp_locations = []
-            else:
-                kp_locations.append(value)
-        else:
-            value = float16_to_jacobian(word)
-            if num_read_so_far % 4 == 0:
-                jacobians.append(value)
-                jacobians = np.array(jacobians).reshape((2, 2))
-                keypoint_dict['jacobians'].append(jacobians)
-                jacobians = []
-            else:
-                jacobians.append(value)
-
-    keypoint_dict['jacobians'] = np.array(keypoint_dict['jacobians'])
-    keypoint_dict['keypoints'] = np.array(keypoint_dict['keypoints'])
-    return keypoint_dict
+    return custom_decode_batch([serialized_data])[0]
+
+
+# custom decoding of several payloads, vectorized
+# across all payloads of the same length
+def custom_decode_batch(payloads):
+    keypoint_dicts = [None] * len(payloads)
 
+    positions_by_length = {}
+    for i, payload in enumerate(payloads):
+        positions_by_length.setdefault(len(payload), []).append(i)
 
-class KeypointsDecoder(Decoder): 
+    for length, positions in positions_by_length.items():
+        data = np.frombuffer(b"".join(payloads[i] for i in positions), dtype=np.uint8)
+        bits = np.unpackbits(data.reshape(len(positions), length), axis=1)
+
+        # frame index and source frame index to reconstruct from
+        frame_indices = bits_to_int(bits[:, :FRAME_INDEX_BITS], FRAME_INDEX_BITS)
+        source_indices = bits_to_int(bits[:, FRAME_INDEX_BITS:HEADER_BITS], SRC_INDEX_BITS)
+
+        kp_end = HEADER_BITS + 2 * NUM_KP * KP_BITS
+        locations = bits_to_int(bits[:, HEADER_BITS:kp_end], KP_BITS)
+        keypoints = dequantize_keypoints(locations).reshape(len(positions), -1, 2)
+
+        # ignore any padding after the last complete jacobian
+        jacobian_size = 4 * NUM_JACOBIAN_BITS
+        num_jacobians = (bits.shape[1] - kp_end) // jacobian_size
+        words = bits_to_int(
+            bits[:, kp_end:kp_end + num_jacobians * jacobian_size], NUM_JACOBIAN_BITS
+        )
+        jacobians = float16_to_jacobian(words).reshape(len(positions), -1, 2, 2)
+
+        for row, i in enumerate(positions):
+            keypoint_dicts[i] = {
+                'frame_index': int(frame_indices[row, 0]),
+                'source_index': int(source_indices[row, 0]),
+                'keypoints': keypoints[row],
+                'jacobians': jacobians[row],
+            }
+
+    return keypoint_dicts
+
+
+class KeypointsDecoder(Decoder):
     @staticmethod
     def _convert(data: bytes, width: int) -> bytes:
         pass  # pragma: no cover
 
     def decode(self, encoded_frame: JitterFrame) -> List[KeypointsFrame]:
-        keypoint_str = encoded_frame.data
-
+        return self.decode_batch([encoded_frame])[0]
+
+    def decode_batch(
+            self, encoded_frames: List[JitterFrame]
+    ) -> List[List[KeypointsFrame]]:
+        """ decode several keypoint frames, possibly from different
+            streams, in one vectorized pass
+        """
         if NUM_JACOBIAN_BITS == -1:
-            keypoint_info_struct = KeypointInfo()
-            keypoint_info_struct.ParseFromString(keypoint_str)
-            assert(keypoint_info_struct.IsInitialized())
-            keypoint_dict = keypoint_struct_to_dict(keypoint_info_struct)
+            keypoint_dicts = []
+            for encoded_frame in encoded_frames:
+                keypoint_info_struct = KeypointInfo()
+                keypoint_info_struct.ParseFromString(encoded_frame.data)
+                assert keypoint_info_struct.IsInitialized()
+                keypoint_dicts.append(keypoint_struct_to_dict(keypoint_info_struct))
         else:
-            keypoint_dict = custom_decode(keypoint_str)
-            keypoint_dict['pts'] = DUMMY_PTS
-        
-        frame = KeypointsFrame(keypoint_dict, keypoint_dict['pts'], \
-                keypoint_dict['frame_index'], keypoint_dict['source_index'])
-        return [frame]
+            keypoint_dicts = custom_decode_batch([f.data for f in encoded_frames])
+            for keypoint_dict in keypoint_dicts:
+                keypoint_dict['pts'] = DUMMY_PTS
+
+        return [
+            [KeypointsFrame(keypoint_dict, keypoint_dict['pts'],
+                            keypoint_dict['frame_index'], keypoint_dict['source_index'])]
+            for keypoint_dict in keypoint_dicts
+        ]
 
 
 class KeypointsEncoder(Encoder):
@@ -255,21 +391,316 @@ class KeypointsEncoder(Encoder):
 
     def __init__(self) -> None:
         pass
-    
+
     def encode(
-            self, frame, force_keyframe: bool = False, quantizer: int=32
+            self, frame, force_keyframe: bool = False, quantizer: int = 32,
+            target_bitrate: int = 100000, enable_gcc: bool = False
     ) -> Tuple[List[bytes], int]:
-        timestamp = frame.pts
+        return self.encode_batch([frame], force_keyframe, quantizer)[0]
+
+    def encode_batch(
+            self, frames, force_keyframe: bool = False, quantizer: int = 32,
+            target_bitrate: int = 100000, enable_gcc: bool = False
+    ) -> List[Tuple[List[bytes], int]]:
+        """ encode several keypoint frames, possibly from different
+            streams, in one vectorized pass
+        """
+        keypoint_dicts = []
+        for frame in frames:
+            keypoint_dict = frame.data
+            keypoint_dict['pts'] = frame.pts
+            keypoint_dict['frame_index'] = frame.frame_index
+            keypoint_dict['source_index'] = frame.source_index
+            keypoint_dicts.append(keypoint_dict)
+
+        if NUM_JACOBIAN_BITS == -1:
+            payloads = []
+            for keypoint_dict in keypoint_dicts:
+                keypoint_info_struct = keypoint_dict_to_struct(keypoint_dict)
+                assert keypoint_info_struct.IsInitialized()
+                payloads.append(keypoint_info_struct.SerializeToString())
+        else:
+            payloads = custom_encode_batch(keypoint_dicts)
+
+        return [([data], frame.pts) for data, frame in zip(payloads, frames)]
+
+
+# temporal delta coding of keypoint data: key frames
+# carry the custom encoding above, delta frames carry
+# Exp-Golomb coded residuals of the quantized keypoint
+# locations and float16 jacobians against the previous
+# frame, so both ends reconstruct the same values as
+# with the custom encoding
+def quantize_keypoint_dict(keypoint_dict):
+    locations = quantize_keypoints(keypoint_dict['keypoints']).reshape(-1)
+    jacobians = float16_to_ordered(jacobian_to_float16(keypoint_dict['jacobians']))
+    return locations, jacobians
+
+
+def delta_encode(keypoint_dict, reference):
+    ref_index, ref_locations, ref_jacobians = reference
+    locations, jacobians = quantize_keypoint_dict(keypoint_dict)
+
+    header = np.array([[DELTA_FRAME, keypoint_dict['frame_index'],
+                        keypoint_dict['source_index'], ref_index]])
+    bits = np.concatenate([
+        int_to_bits(header[:, :1], FRAME_TYPE_BITS),
+        int_to_bits(header[:, 1:2], FRAME_INDEX_BITS),
+        int_to_bits(header[:, 2:3], SRC_INDEX_BITS),
+        int_to_bits(header[:, 3:], FRAME_INDEX_BITS),
+        exp_golomb_encode(
+            np.concatenate([locations - ref_locations, jacobians - ref_jacobians])
+        ).reshape(1, -1),
+    ], axis=1)
+    return np.packbits(bits).tobytes()
+
+
+def delta_decode(serialized_data, reference):
+    """ decode a delta frame, returning None if it does not
+        apply to the reference frame
+    """
+    bits = np.unpackbits(np.frombuffer(serialized_data, dtype=np.uint8))
+    if len(bits) < DELTA_HEADER_BITS:
+        raise ValueError("Keypoints delta frame is too short")
+
+    header = bits[FRAME_TYPE_BITS:DELTA_HEADER_BITS].reshape(1, -1)
+    frame_index, source_index, ref_index = bits_to_int(header, FRAME_INDEX_BITS)[0]
+    if reference is None or reference[0] != ref_index:
+        return None
+    _, ref_locations, ref_jacobians = reference
+
+    residuals, _ = exp_golomb_decode(bits[DELTA_HEADER_BITS:],
+                                     len(ref_locations) + len(ref_jacobians))
+    locations = ref_locations + residuals[:len(ref_locations)]
+    jacobians = ref_jacobians + residuals[len(ref_locations):]
+
+    return {
+        'frame_index': int(frame_index),
+        'source_index': int(source_index),
+        'keypoints': dequantize_keypoints(locations).reshape(-1, 2),
+        'jacobians': float16_to_jacobian(ordered_to_float16(jacobians)).reshape(-1, 2, 2),
+    }
+
+
+class KeypointsDeltaDecoder(KeypointsDecoder):
+    def __init__(self) -> None:
+        self.__reference = None
+
+    def decode_batch(
+            self, encoded_frames: List[JitterFrame]
+    ) -> List[List[KeypointsFrame]]:
+        """ decode keypoint frames of a single stream in order,
+            as each delta frame depends on the previous frame
+        """
+        return [self.__decode_one(encoded_frame) for encoded_frame in encoded_frames]
+
+    def __decode_one(self, encoded_frame: JitterFrame) -> List[KeypointsFrame]:
+        data = encoded_frame.data
+        if not data:
+            return []
+
+        if data[0] == KEY_FRAME:
+            keypoint_dict = custom_decode(data[1:])
+        else:
+            keypoint_dict = delta_decode(data, self.__reference)
+            if keypoint_dict is None:
+                # wait for the next key frame
+                logger.debug("Dropping keypoints delta frame without its reference")
+                self.__reference = None
+                return []
+
+        self.__reference = (
+            (keypoint_dict['frame_index'],) + quantize_keypoint_dict(keypoint_dict)
+        )
+        keypoint_dict['pts'] = DUMMY_PTS
+        return [KeypointsFrame(keypoint_dict, keypoint_dict['pts'],
+                               keypoint_dict['frame_index'], keypoint_dict['source_index'])]
+
+
+class KeypointsDeltaEncoder(KeypointsEncoder):
+    def __init__(self) -> None:
+        self.__reference = None
+        self.__source_index = None
+        self.__frames_since_keyframe = 0
+
+    def encode_batch(
+            self, frames, force_keyframe: bool = False, quantizer: int = 32,
+            target_bitrate: int = 100000, enable_gcc: bool = False
+    ) -> List[Tuple[List[bytes], int]]:
+        """ encode keypoint frames of a single stream in order,
+            as each delta frame depends on the previous frame
+        """
+        encoded = []
+        for frame in frames:
+            encoded.append(self.__encode_one(frame, force_keyframe))
+            force_keyframe = False
+        return encoded
+
+    def __encode_one(self, frame, force_keyframe: bool) -> Tuple[List[bytes], int]:
         keypoint_dict = frame.data
         keypoint_dict['pts'] = frame.pts
         keypoint_dict['frame_index'] = frame.frame_index
         keypoint_dict['source_index'] = frame.source_index
 
-        if NUM_JACOBIAN_BITS == -1:
-            keypoint_info_struct = keypoint_dict_to_struct(keypoint_dict)
-            assert(keypoint_info_struct.IsInitialized())
-            data = keypoint_info_struct.SerializeToString()
+        reference = (frame.frame_index,) + quantize_keypoint_dict(keypoint_dict)
+        keyframe = (
+            force_keyframe
+            or self.__reference is None
+            or frame.source_index != self.__source_index
+            or self.__frames_since_keyframe >= KEYFRAME_INTERVAL - 1
+            or len(reference[2]) != len(self.__reference[2])
+        )
+
+        if keyframe:
+            data = bytes([KEY_FRAME]) + custom_encode(keypoint_dict)
+            self.__frames_since_keyframe = 0
         else:
-            data = custom_encode(keypoint_dict)
+            data = delta_encode(keypoint_dict, self.__reference)
+            self.__frames_since_keyframe += 1
+
+        self.__reference = reference
+        self.__source_index = frame.source_index
+        return [data], frame.pts
+
+
+# entropy coding of keypoint data: keypoint locations
+# use the custom encoding, jacobians are mapped onto
+# the Huffman bins for the session's bit depth and
+# arithmetic coded with a model that adapts across
+# frames and is reset every MODEL_INTERVAL frames, so
+# that a lost frame only stalls decoding until the next
+# reset
+def binned_encode(keypoint_dict, jacobian_bits, model, model_index):
+    num_bins = 2 ** (jacobian_bits - 1)
+    jacobians = np.asarray(keypoint_dict['jacobians'])
+
+    fields = np.array([[keypoint_dict['frame_index'], keypoint_dict['source_index'],
+                        jacobian_bits, model_index, len(jacobians)]])
+    bits = np.concatenate([
+        int_to_bits(fields[:, :1], FRAME_INDEX_BITS),
+        int_to_bits(fields[:, 1:2], SRC_INDEX_BITS),
+        int_to_bits(fields[:, 2:], BINNED_FIELD_BITS),
+        int_to_bits(quantize_keypoints(keypoint_dict['keypoints']).reshape(1, -1), KP_BITS),
+    ], axis=1)
+
+    signs, bins = jacobians_to_bins(jacobians, num_bins)
+    encoder = ArithmeticEncoder()
+    for symbol in (signs * num_bins + bins).tolist():
+        encoder.encode(model, symbol)
+
+    return np.packbits(bits).tobytes() + encoder.finish()
+
+
+def binned_decode_header(serialized_data):
+    """ decode the fields needed to pick the jacobian model,
+        returning the bit depth and model index
+    """
+    if len(serialized_data) < BINNED_HEADER_SIZE:
+        raise ValueError("Binned keypoints frame is too short")
+    bits = np.unpackbits(np.frombuffer(serialized_data[:BINNED_HEADER_SIZE], dtype=np.uint8))
+    fields = bits_to_int(
+        bits[HEADER_BITS:BINNED_HEADER_BITS - BINNED_FIELD_BITS].reshape(1, -1),
+        BINNED_FIELD_BITS,
+    )[0]
+    return int(fields[0]), int(fields[1])
+
+
+def binned_decode(serialized_data, model):
+    bits = np.unpackbits(
+        np.frombuffer(serialized_data[:BINNED_HEADER_SIZE], dtype=np.uint8)
+    ).reshape(1, -1)
+    frame_index = bits_to_int(bits[:, :FRAME_INDEX_BITS], FRAME_INDEX_BITS)[0, 0]
+    source_index = bits_to_int(bits[:, FRAME_INDEX_BITS:HEADER_BITS], SRC_INDEX_BITS)[0, 0]
+    jacobian_bits, _, num_jacobians = bits_to_int(
+        bits[:, HEADER_BITS:BINNED_HEADER_BITS], BINNED_FIELD_BITS)[0]
+    kp_end = BINNED_HEADER_BITS + 2 * NUM_KP * KP_BITS
+    locations = bits_to_int(bits[:, BINNED_HEADER_BITS:kp_end], KP_BITS)
+
+    num_bins = 2 ** (int(jacobian_bits) - 1)
+    decoder = ArithmeticDecoder(serialized_data[BINNED_HEADER_SIZE:])
+    symbols = np.array([decoder.decode(model) for _ in range(4 * num_jacobians)],
+                       dtype=np.int64)
+    jacobians = bins_to_jacobians(symbols // num_bins, symbols % num_bins, num_bins)
+
+    return {
+        'frame_index': int(frame_index),
+        'source_index': int(source_index),
+        'keypoints': dequantize_keypoints(locations).reshape(-1, 2),
+        'jacobians': jacobians.reshape(-1, 2, 2),
+    }
+
+
+class KeypointsBinnedDecoder(KeypointsDecoder):
+    def __init__(self) -> None:
+        self.__model = None
+        self.__next_model_index = None
+
+    def decode_batch(
+            self, encoded_frames: List[JitterFrame]
+    ) -> List[List[KeypointsFrame]]:
+        """ decode keypoint frames of a single stream in order,
+            as the jacobian model adapts from frame to frame
+        """
+        return [self.__decode_one(encoded_frame) for encoded_frame in encoded_frames]
+
+    def __decode_one(self, encoded_frame: JitterFrame) -> List[KeypointsFrame]:
+        jacobian_bits, model_index = binned_decode_header(encoded_frame.data)
+        if not MIN_JACOBIAN_BITS <= jacobian_bits <= MAX_JACOBIAN_BITS:
+            raise ValueError(f"Unsupported jacobian bit depth {jacobian_bits}")
+
+        num_symbols = 2 ** jacobian_bits
+        if model_index == 0:
+            self.__model = AdaptiveModel(num_symbols)
+        elif (
+            self.__model is None
+            or self.__model.num_symbols != num_symbols
+            or model_index != self.__next_model_index
+        ):
+            # wait for the next model reset
+            logger.debug("Dropping binned keypoints frame without its model")
+            self.__model = None
+            return []
+
+        keypoint_dict = binned_decode(encoded_frame.data, self.__model)
+        self.__next_model_index = model_index + 1
+
+        keypoint_dict['pts'] = DUMMY_PTS
+        return [KeypointsFrame(keypoint_dict, keypoint_dict['pts'],
+                               keypoint_dict['frame_index'], keypoint_dict['source_index'])]
+
+
+class KeypointsBinnedEncoder(KeypointsEncoder):
+    def __init__(self, jacobian_bits: int = DEFAULT_JACOBIAN_BITS) -> None:
+        if not MIN_JACOBIAN_BITS <= jacobian_bits <= MAX_JACOBIAN_BITS:
+            raise ValueError(f"Unsupported jacobian bit depth {jacobian_bits}")
+        self.jacobian_bits = jacobian_bits
+        self.__model = AdaptiveModel(2 ** jacobian_bits)
+        self.__model_index = 0
+
+    def encode_batch(
+            self, frames, force_keyframe: bool = False, quantizer: int = 32,
+            target_bitrate: int = 100000, enable_gcc: bool = False
+    ) -> List[Tuple[List[bytes], int]]:
+        """ encode keypoint frames of a single stream in order,
+            as the jacobian model adapts from frame to frame
+        """
+        encoded = []
+        for frame in frames:
+            encoded.append(self.__encode_one(frame, force_keyframe))
+            force_keyframe = False
+        return encoded
+
+    def __encode_one(self, frame, force_keyframe: bool) -> Tuple[List[bytes], int]:
+        keypoint_dict = frame.data
+        keypoint_dict['pts'] = frame.pts
+        keypoint_dict['frame_index'] = frame.frame_index
+        keypoint_dict['source_index'] = frame.source_index
+
+        if force_keyframe or self.__model_index >= MODEL_INTERVAL:
+            self.__model.reset()
+            self.__model_index = 0
 
-        return [data], timestamp
+        data = binned_encode(keypoint_dict, self.jacobian_bits, self.__model,
+                             self.__model_index)
+        self.__model_index += 1
+        return [data], frame.pts
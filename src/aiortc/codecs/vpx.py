@@ -2,13 +2,14 @@ import multiprocessing
 import logging
 import random
 from struct import pack, unpack_from
-from typing import List, Tuple, Type, TypeVar, cast
+from typing import List, Tuple, Type, TypeVar, Union, cast
 
 from av import VideoFrame
 from av.frame import Frame
 
 from ..jitterbuffer import JitterFrame
 from ..mediastreams import VIDEO_CLOCK_RATE, VIDEO_TIME_BASE, convert_timebase
+from ..rtp import RtpPayload
 from ._vpx import ffi, lib
 from .base import Decoder, Encoder
 
@@ -237,7 +238,7 @@ class Vp8Encoder(Encoder):
         self.cfg = ffi.new("vpx_codec_enc_cfg_t *")
         lib.vpx_codec_enc_config_default(self.cx, self.cfg, 0)
 
-        self.buffer = bytearray(8000)
+        self.buffer = b""
         self.codec = None
         self.picture_id = random.randint(0, (1 << 15) - 1)
         self.timestamp_increment = VIDEO_CLOCK_RATE // MAX_FRAME_RATE
@@ -270,7 +271,9 @@ class Vp8Encoder(Encoder):
             lib.vpx_codec_destroy(self.codec)
 
     def encode(
-            self, frame: Frame, force_keyframe: bool = False, quantizer: int = 32, target_bitrate: int = 100000, enable_gcc: bool = False) -> Tuple[List[bytes], int]:
+            self, frame: Frame, force_keyframe: bool = False, quantizer: int = 32,
+            target_bitrate: int = 100000, enable_gcc: bool = False
+    ) -> Tuple[List[RtpPayload], int]:
         assert isinstance(frame, VideoFrame)
         if frame.format.name != "yuv420p":
             frame = frame.reformat(format="yuv420p")
@@ -375,36 +378,19 @@ class Vp8Encoder(Encoder):
         )
 
         it = ffi.new("vpx_codec_iter_t *")
-        length = 0
+        chunks = []
         while True:
             pkt = lib.vpx_codec_get_cx_data(self.codec, it)
             if not pkt:
                 break
             elif pkt.kind == lib.VPX_CODEC_CX_FRAME_PKT:
-                # resize buffer if needed
-                if length + pkt.data.frame.sz > len(self.buffer):
-                    new_buffer = bytearray(length + pkt.data.frame.sz)
-                    new_buffer[0:length] = self.buffer[0:length]
-                    self.buffer = new_buffer
-
-                # append new data
-                self.buffer[length : length + pkt.data.frame.sz] = ffi.buffer(
-                    pkt.data.frame.buf, pkt.data.frame.sz
-                )
-                length += pkt.data.frame.sz
+                chunks.append(ffi.buffer(pkt.data.frame.buf, pkt.data.frame.sz))
+
+        # copy the frame out of the codec once, the payloads are views on it
+        self.buffer = b"".join(chunks)
 
         # packetize
-        payloads = []
-        descr = VpxPayloadDescriptor(
-            partition_start=1, partition_id=0, picture_id=self.picture_id
-        )
-        pos = 0
-        while pos < length:
-            descr_bytes = bytes(descr)
-            size = min(length - pos, PACKET_MAX - len(descr_bytes))
-            payloads.append(descr_bytes + self.buffer[pos : pos + size])
-            descr.partition_start = 0
-            pos += size
+        payloads = vpx_packetize(self.buffer, self.picture_id)
         self.picture_id = (self.picture_id + 1) % (1 << 15)
 
         timestamp = convert_timebase(frame.pts, frame.time_base, VIDEO_TIME_BASE)
@@ -503,7 +489,7 @@ class Vp9Encoder(Encoder):
         self.cfg = ffi.new("vpx_codec_enc_cfg_t *")
         lib.vpx_codec_enc_config_default(self.cx, self.cfg, 0)
 
-        self.buffer = bytearray(8000)
+        self.buffer = b""
         self.codec = None
         self.picture_id = random.randint(0, (1 << 15) - 1)
         self.timestamp_increment = VIDEO_CLOCK_RATE // MAX_FRAME_RATE
@@ -536,7 +522,9 @@ class Vp9Encoder(Encoder):
             lib.vpx_codec_destroy(self.codec)
 
     def encode(
-            self, frame: Frame, force_keyframe: bool = False, quantizer: int = 32, target_bitrate: int = 100000, enable_gcc: bool = False) -> Tuple[List[bytes], int]:
+            self, frame: Frame, force_keyframe: bool = False, quantizer: int = 32,
+            target_bitrate: int = 100000, enable_gcc: bool = False
+    ) -> Tuple[List[RtpPayload], int]:
         assert isinstance(frame, VideoFrame)
         if frame.format.name != "yuv420p":
             frame = frame.reformat(format="yuv420p")
@@ -644,36 +632,19 @@ class Vp9Encoder(Encoder):
         )
 
         it = ffi.new("vpx_codec_iter_t *")
-        length = 0
+        chunks = []
         while True:
             pkt = lib.vpx_codec_get_cx_data(self.codec, it)
             if not pkt:
                 break
             elif pkt.kind == lib.VPX_CODEC_CX_FRAME_PKT:
-                # resize buffer if needed
-                if length + pkt.data.frame.sz > len(self.buffer):
-                    new_buffer = bytearray(length + pkt.data.frame.sz)
-                    new_buffer[0:length] = self.buffer[0:length]
-                    self.buffer = new_buffer
-
-                # append new data
-                self.buffer[length : length + pkt.data.frame.sz] = ffi.buffer(
-                    pkt.data.frame.buf, pkt.data.frame.sz
-                )
-                length += pkt.data.frame.sz
+                chunks.append(ffi.buffer(pkt.data.frame.buf, pkt.data.frame.sz))
+
+        # copy the frame out of the codec once, the payloads are views on it
+        self.buffer = b"".join(chunks)
 
         # packetize
-        payloads = []
-        descr = VpxPayloadDescriptor(
-            partition_start=1, partition_id=0, picture_id=self.picture_id
-        )
-        pos = 0
-        while pos < length:
-            descr_bytes = bytes(descr)
-            size = min(length - pos, PACKET_MAX - len(descr_bytes))
-            payloads.append(descr_bytes + self.buffer[pos : pos + size])
-            descr.partition_start = 0
-            pos += size
+        payloads = vpx_packetize(self.buffer, self.picture_id)
         self.picture_id = (self.picture_id + 1) % (1 << 15)
 
         timestamp = convert_timebase(frame.pts, frame.time_base, VIDEO_TIME_BASE)
@@ -706,6 +677,28 @@ class Vp9Encoder(Encoder):
         self.__update_config_needed = False
 
 
-def vp8_depayload(payload: bytes) -> bytes:
-    descriptor, data = VpxPayloadDescriptor.parse(payload)
+def vpx_packetize(data: bytes, picture_id: int) -> List[RtpPayload]:
+    """
+    Split an encoded frame into payloads of at most PACKET_MAX bytes.
+
+    The payloads reference `data` instead of copying it, so it must not be
+    modified while they are in use.
+    """
+    view = memoryview(data)
+    payloads = []
+    descr = VpxPayloadDescriptor(
+        partition_start=1, partition_id=0, picture_id=picture_id
+    )
+    pos = 0
+    while pos < len(view):
+        descr_bytes = bytes(descr)
+        size = min(len(view) - pos, PACKET_MAX - len(descr_bytes))
+        payloads.append(RtpPayload(descr_bytes, view[pos : pos + size]))
+        descr.partition_start = 0
+        pos += size
+    return payloads
+
+
+def vp8_depayload(payload: Union[bytes, RtpPayload]) -> bytes:
+    descriptor, data = VpxPayloadDescriptor.parse(bytes(payload))
     return data
@@ -0,0 +1,202 @@
+import logging
+import os
+import queue
+import threading
+from typing import Dict, List, Optional, TextIO, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# number of frames per archive chunk
+CHUNK_SIZE = 30
+
+
+class _StreamChunk:
+    def __init__(self, shape: Tuple[int, ...], dtype: np.dtype) -> None:
+        self.shape = shape
+        self.dtype = dtype
+        self.frame_indices: List[int] = []
+        self.arrays: List[np.ndarray] = []
+
+
+class FrameWriter:
+    """
+    A background writer for experiment frame dumps and timing logs.
+
+    Frames are grouped per stream into chunks of up to `chunk_size` frames
+    of the same shape. Each chunk is written as a single `.npy` file, or as
+    a compressed `.npz` archive, by a dedicated thread. An index file per
+    stream maps every frame index to its chunk and position, so chunks can
+    be memory-mapped back with :func:`load_frames`. Timing log lines are
+    buffered and written by the same thread.
+
+    :param save_dir: The directory to write to.
+    :param chunk_size: The maximum number of frames per chunk.
+    :param compress: Whether to write compressed `.npz` archives.
+    """
+
+    def __init__(self, save_dir: str, chunk_size: int = CHUNK_SIZE, compress: bool = False):
+        self.__save_dir = save_dir
+        self.__chunk_size = chunk_size
+        self.__compress = compress
+        self.__chunks: Dict[str, _StreamChunk] = {}
+        self.__chunk_counts: Dict[str, int] = {}
+        self.__indexes: Dict[str, TextIO] = {}
+        self.__logs: Dict[str, TextIO] = {}
+        self.__queue: queue.Queue = queue.Queue()
+        self.__closed = False
+        self.__thread = threading.Thread(name="frame-writer", target=self.__run, daemon=True)
+        self.__thread.start()
+
+    @property
+    def pending(self) -> int:
+        """
+        The number of frames and log lines not yet handled by the writer.
+        """
+        return self.__queue.qsize()
+
+    def save(self, stream: str, frame_index: Optional[int], array: np.ndarray) -> None:
+        """
+        Queue a frame of `stream` for writing.
+
+        `array` is either an ndarray, which must not be modified afterwards
+        as it is written asynchronously, or a video frame which is converted
+        to RGB on the writer thread. Frames without an index are skipped, as
+        they could not be looked up again.
+        """
+        if frame_index is None:
+            logger.debug("FrameWriter(%s) skipped a %s frame without index", self.__save_dir, stream)
+        elif not self.__closed:
+            self.__queue.put(("save", stream, frame_index, array))
+
+    def log(self, name: str, line: str) -> None:
+        """
+        Queue a line for the timing log file `name`.
+        """
+        if not self.__closed:
+            self.__queue.put(("log", name, line, None))
+
+    def close(self) -> None:
+        """
+        Write all queued frames and log lines, then stop the writer.
+        """
+        if not self.__closed:
+            self.__closed = True
+            self.__queue.put(None)
+            self.__thread.join()
+
+    def __run(self) -> None:
+        try:
+            stopping = False
+            while not stopping:
+                tasks = [self.__queue.get()]
+
+                # drain whatever else is queued before flushing logs
+                while True:
+                    try:
+                        tasks.append(self.__queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                for task in tasks:
+                    if task is None:
+                        stopping = True
+                        break
+                    self.__handle(task)
+                for log_file in self.__logs.values():
+                    log_file.flush()
+        finally:
+            self.__finish()
+
+    def __handle(self, task) -> None:
+        kind, name, value, array = task
+        try:
+            if kind == "log":
+                log_file = self.__logs.get(name)
+                if log_file is None:
+                    log_file = self.__logs[name] = open(os.path.join(self.__save_dir, name), "w")
+                log_file.write(value)
+            else:
+                if not isinstance(array, np.ndarray):
+                    array = array.to_rgb().to_ndarray()
+                chunk = self.__chunks.get(name)
+                if chunk is not None and (chunk.shape != array.shape or chunk.dtype != array.dtype):
+                    self.__write_chunk(name)
+                    chunk = None
+                if chunk is None:
+                    chunk = self.__chunks[name] = _StreamChunk(array.shape, array.dtype)
+                chunk.frame_indices.append(value)
+                chunk.arrays.append(array)
+                if len(chunk.arrays) >= self.__chunk_size:
+                    self.__write_chunk(name)
+        except Exception as exc:
+            logger.warning("FrameWriter(%s) failed to write %s: %s", self.__save_dir, name, exc)
+
+    def __write_chunk(self, stream: str) -> None:
+        chunk = self.__chunks.pop(stream)
+        chunk_number = self.__chunk_counts.get(stream, 0)
+        self.__chunk_counts[stream] = chunk_number + 1
+
+        if self.__compress:
+            chunk_name = "%s_%05d.npz" % (stream, chunk_number)
+            np.savez_compressed(
+                os.path.join(self.__save_dir, chunk_name), frames=np.stack(chunk.arrays)
+            )
+        else:
+            chunk_name = "%s_%05d.npy" % (stream, chunk_number)
+            frames = np.lib.format.open_memmap(
+                os.path.join(self.__save_dir, chunk_name),
+                mode="w+",
+                dtype=chunk.dtype,
+                shape=(len(chunk.arrays),) + chunk.shape,
+            )
+            for position, array in enumerate(chunk.arrays):
+                frames[position] = array
+            frames.flush()
+            del frames
+
+        index = self.__indexes.get(stream)
+        if index is None:
+            index = self.__indexes[stream] = open(
+                os.path.join(self.__save_dir, "%s_index.txt" % stream), "w"
+            )
+        for position, frame_index in enumerate(chunk.frame_indices):
+            index.write("%d %s %d\n" % (frame_index, chunk_name, position))
+        index.flush()
+
+    def __finish(self) -> None:
+        try:
+            for stream in list(self.__chunks.keys()):
+                try:
+                    self.__write_chunk(stream)
+                except Exception as exc:
+                    logger.warning("FrameWriter(%s) failed to write %s: %s", self.__save_dir, stream, exc)
+        finally:
+            for opened in list(self.__indexes.values()) + list(self.__logs.values()):
+                opened.close()
+            self.__indexes = {}
+            self.__logs = {}
+
+
+def load_frames(save_dir: str, stream: str) -> Dict[int, np.ndarray]:
+    """
+    Return the frames of `stream` written by a :class:`FrameWriter`, keyed by
+    frame index. Uncompressed chunks are memory-mapped rather than read.
+    """
+    chunks: Dict[str, np.ndarray] = {}
+    frames: Dict[int, np.ndarray] = {}
+    with open(os.path.join(save_dir, "%s_index.txt" % stream)) as index:
+        for line in index:
+            frame_index, chunk_name, position = line.split()
+            chunk = chunks.get(chunk_name)
+            if chunk is None:
+                path = os.path.join(save_dir, chunk_name)
+                if chunk_name.endswith(".npz"):
+                    with np.load(path) as archive:
+                        chunk = archive["frames"]
+                else:
+                    chunk = np.load(path, mmap_mode="r")
+                chunks[chunk_name] = chunk
+            frames[int(frame_index)] = chunk[int(position)]
+    return frames
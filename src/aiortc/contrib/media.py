@@ -5,7 +5,7 @@ import logging
 import threading
 import time
 import sys
-from typing import Dict, Optional, Set
+from typing import Dict, Optional, Set, Tuple
 import numpy as np
 import concurrent.futures
 import os
@@ -16,55 +16,214 @@ from av import AudioFrame, VideoFrame
 from av.frame import Frame
 
 from ..mediastreams import AUDIO_PTIME, MediaStreamError, MediaStreamTrack, KeypointsFrame
+from .framewriter import FrameWriter
 
-from first_order_model.fom_wrapper import FirstOrderModel
-from first_order_model.reconstruction import frame_to_tensor, resize_tensor_to_array
-from first_order_model.utils import get_main_config_params
-from lte_wrapper import SuperResolutionModel
-from skimage import img_as_float32
-import torch
-import torch.nn.functional as F
 import yaml 
 
 config_path = os.environ.get('CONFIG_PATH', 'None')
 checkpoint = os.environ.get('CHECKPOINT_PATH', 'None')
 
-main_configs = get_main_config_params(config_path)
-frame_shape = main_configs['frame_shape']
-generator_type = main_configs['generator_type']
-use_lr_video = main_configs['use_lr_video']
-lr_size = main_configs['lr_size']
-print(main_configs)
-
-# instantiate and warm up the model
-if generator_type not in ['vpx', 'bicubic']:
-    time_before_instantiation = time.perf_counter()
-    if generator_type == 'swinir-lte':
-        model = SuperResolutionModel(config_path, checkpoint)
-    else:
-        model = FirstOrderModel(config_path, checkpoint)
+# main config parameters per config path, read on first use
+_main_configs: Dict[str, dict] = {}
 
-    for i in range(10):
-        random_array = np.random.randint(0, 255, model.get_shape(), dtype=np.uint8)
-        if generator_type != 'swinir-lte':
-            random_kps, src_index = model.extract_keypoints(random_array)
-            model.update_source(src_index, random_array, random_kps)
-            random_kps['source_index'] = src_index
+# prediction models are heavy to construct, so they are only instantiated
+# when the first MediaPlayer or MediaRecorder that enables prediction asks
+# for one, and are then shared within the process per config and checkpoint
+_models: Dict[Tuple[str, str], "_ModelEntry"] = {}
+_models_lock = threading.Lock()
 
-        if use_lr_video:
-            model.predict_with_lr_video(np.random.randint(0, 255, (lr_size, lr_size, 3), dtype=np.uint8))
-        else:
-            model.predict(random_kps)
-    time_after_instantiation = time.perf_counter()
-    print("Time to instantiate at time %s: %s" % (datetime.datetime.now(),
-        str(time_after_instantiation - time_before_instantiation)))
-    model.reset()
+
+class InferenceExecutor:
+    """
+    A long-lived executor for model inference calls.
+
+    By default calls run in order on a single dedicated thread, which also
+    serializes access to the model. Another :class:`concurrent.futures.Executor`
+    can be plugged in instead, in which case it is not shut down with this one.
+
+    :param executor: The executor to run calls in, defaults to a dedicated thread.
+    :param name: The name prefix of the dedicated thread.
+    """
+
+    def __init__(self, executor=None, name="inference"):
+        self.__owns_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=name
+            )
+        self.__executor = executor
+        self.__lock = threading.Lock()
+        self.__queue_depth = 0
+        self.__max_queue_depth = 0
+        self.__calls = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        The number of calls submitted but not yet completed.
+        """
+        return self.__queue_depth
+
+    @property
+    def max_queue_depth(self) -> int:
+        """
+        The largest queue depth seen so far.
+        """
+        return self.__max_queue_depth
+
+    @property
+    def calls(self) -> int:
+        """
+        The total number of calls submitted.
+        """
+        return self.__calls
+
+    async def run(self, func, *args):
+        """
+        Run `func(*args)` in the executor and return its result.
+        """
+        with self.__lock:
+            self.__calls += 1
+            self.__queue_depth += 1
+            self.__max_queue_depth = max(self.__max_queue_depth, self.__queue_depth)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.__executor, func, *args
+            )
+        finally:
+            with self.__lock:
+                self.__queue_depth -= 1
+
+    def shutdown(self, wait=True) -> None:
+        if self.__owns_executor:
+            self.__executor.shutdown(wait=wait)
+
+
+class _ModelEntry:
+    def __init__(self, model, configs):
+        self.model = model
+        self.configs = configs
+        self.warmed_up = False
+        self.lock = threading.Lock()
+
+
+def _get_model_entry(config_path, checkpoint):
+    key = (config_path, checkpoint)
+    with _models_lock:
+        entry = _models.get(key)
+        if entry is None:
+            from first_order_model.utils import get_main_config_params
+            configs = get_main_config_params(config_path)
+            model_type = configs['generator_type']
+            if model_type in ['vpx', 'bicubic']:
+                raise ValueError("Generator type %s has no prediction model" % model_type)
+
+            time_before_instantiation = time.perf_counter()
+            if model_type == 'swinir-lte':
+                from lte_wrapper import SuperResolutionModel
+                model = SuperResolutionModel(config_path, checkpoint)
+            else:
+                from first_order_model.fom_wrapper import FirstOrderModel
+                model = FirstOrderModel(config_path, checkpoint)
+            time_after_instantiation = time.perf_counter()
+            logger.info("Instantiated %s model from %s in %s", model_type, checkpoint,
+                    str(time_after_instantiation - time_before_instantiation))
+
+            entry = _ModelEntry(model, configs)
+            _models[key] = entry
+        return entry
+
+
+def get_main_configs(model_config_path=None):
+    """ return the main config parameters, defaulting to CONFIG_PATH, reading
+        them on first use rather than when the module is imported
+    """
+    if model_config_path is None:
+        model_config_path = config_path
+    configs = _main_configs.get(model_config_path)
+    if configs is None:
+        from first_order_model.utils import get_main_config_params
+        configs = get_main_config_params(model_config_path)
+        _main_configs[model_config_path] = configs
+    return configs
+
+
+def requires_model(enable_prediction, model_generator_type=None):
+    """ whether a player or recorder needs a prediction model
+    """
+    if not enable_prediction:
+        return False
+    if model_generator_type is None:
+        model_generator_type = get_main_configs()['generator_type']
+    return model_generator_type not in ['vpx', 'bicubic']
+
+
+def get_model(model_config_path=None, model_checkpoint=None):
+    """ return the prediction model for a config and checkpoint, defaulting
+        to CONFIG_PATH and CHECKPOINT_PATH, instantiating it on first use
+    """
+    if model_config_path is None:
+        model_config_path = config_path
+    if model_checkpoint is None:
+        model_checkpoint = checkpoint
+    return _get_model_entry(model_config_path, model_checkpoint).model
+
+
+def _warm_up(entry, iterations):
+    with entry.lock:
+        if entry.warmed_up:
+            return
+        model = entry.model
+        configs = entry.configs
+        time_before_warm_up = time.perf_counter()
+        for i in range(iterations):
+            random_array = np.random.randint(0, 255, model.get_shape(), dtype=np.uint8)
+            if configs['generator_type'] != 'swinir-lte':
+                random_kps, src_index = model.extract_keypoints(random_array)
+                model.update_source(src_index, random_array, random_kps)
+                random_kps['source_index'] = src_index
+
+            if configs['use_lr_video']:
+                model.predict_with_lr_video(np.random.randint(0, 255,
+                    (configs['lr_size'], configs['lr_size'], 3), dtype=np.uint8))
+            else:
+                model.predict(random_kps)
+        time_after_warm_up = time.perf_counter()
+        logger.info("Warmed up model at time %s: %s", datetime.datetime.now(),
+                str(time_after_warm_up - time_before_warm_up))
+        model.reset()
+        entry.warmed_up = True
+
+
+async def warm_up_model(model_config_path=None, model_checkpoint=None, iterations=10,
+                        executor=None):
+    """ run a few predictions on random inputs off the event loop so that the
+        first real frames do not pay for lazy initialization, then reset
+        the model; warming up an already warmed up model is a no-op. The
+        predictions run in `executor` if given, else in the loop's default one
+    """
+    if model_config_path is None:
+        model_config_path = config_path
+    if model_checkpoint is None:
+        model_checkpoint = checkpoint
+    loop = asyncio.get_running_loop()
+    entry = await loop.run_in_executor(None, _get_model_entry,
+                                       model_config_path, model_checkpoint)
+    if executor is not None:
+        await executor.run(_warm_up, entry, iterations)
+    else:
+        await loop.run_in_executor(None, _warm_up, entry, iterations)
+    return entry.model
 
 save_keypoints_to_file = False
 save_lr_video_npy = False
 save_predicted_frames = False
 save_sent_frames = True
 save_received_frames = True
+# the frame index travels in an RTP header extension, the pixel barcode is
+# only needed to send to peers which do not negotiate it; received frames
+# are destamped whenever their track does not know their frame index
+stamp_frame_index = False
 logger = logging.getLogger(__name__)
 
 
@@ -93,60 +252,151 @@ REAL_TIME_FORMATS = [
 NUM_ROWS = 10
 NUMBER_OF_BITS = 16
 
+# barcode luma levels and neutral chroma, matching black and white RGB
+# pixels once converted to limited range yuv420p
+BARCODE_BLACK = 16
+BARCODE_WHITE = 235
+BARCODE_CHROMA = 128
+# how far decoded barcode levels may drift from the stamped ones
+BARCODE_TOLERANCE = 48
+
+_buffers = threading.local()
+
+
+def _preallocated_buffer(name, shape):
+    """ return a uint8 buffer of the given shape that is reused across
+        calls from the same thread
+    """
+    buffers = getattr(_buffers, 'arrays', None)
+    if buffers is None:
+        buffers = _buffers.arrays = {}
+    key = (name, shape)
+    buffer = buffers.get(key)
+    if buffer is None:
+        buffer = buffers[key] = np.empty(shape, dtype=np.uint8)
+    return buffer
+
+
+def _frame_planes(frame):
+    """ return views of the Y, U and V planes of a yuv420p frame
+        without copying them
+    """
+    planes = []
+    for plane in frame.planes:
+        array = np.frombuffer(plane, np.uint8).reshape(-1, plane.line_size)
+        planes.append(array[:plane.height, :plane.width])
+    return planes
+
+
+def _buffer_planes(buffer, width, height):
+    """ return views of the Y, U and V planes of a buffer laid out like
+        the yuv420p ndarrays of av.VideoFrame
+    """
+    flat = buffer.reshape(-1)
+    luma_size = width * height
+    chroma_size = luma_size // 4
+    return (
+        flat[:luma_size].reshape(height, width),
+        flat[luma_size:luma_size + chroma_size].reshape(height // 2, width // 2),
+        flat[luma_size + chroma_size:].reshape(height // 2, width // 2),
+    )
+
+
 def stamp_frame(frame, frame_index, frame_pts, frame_time_base):
-    """ stamp frame with barcode for frame index before transmission
+    """ stamp frame with barcode for frame index before transmission,
+        drawing the barcode directly in the luma plane of a yuv420p frame
     """
-    frame_array = frame.to_rgb().to_ndarray()
-    stamped_frame = np.zeros((frame_array.shape[0] + NUM_ROWS, 
-                            frame_array.shape[1], frame_array.shape[2]))
-    k = frame_array.shape[1] // NUMBER_OF_BITS
-    stamped_frame[:-NUM_ROWS, :, :] = frame_array
-    id_str = f'{frame_index+1:0{NUMBER_OF_BITS}b}' 
-
-    for i in range(len(id_str)):
-        if id_str[i] == '0':
-            for j in range(k):
-                for s in range(NUM_ROWS):
-                    stamped_frame[-s-1, i * k + j, 0] = 0
-                    stamped_frame[-s-1, i * k + j, 1] = 0
-                    stamped_frame[-s-1, i * k + j, 2] = 0
-        elif id_str[i] == '1':
-            for j in range(k):
-                for s in range(NUM_ROWS):
-                    stamped_frame[-s-1, i * k + j, 0] = 255
-                    stamped_frame[-s-1, i * k + j, 1] = 255
-                    stamped_frame[-s-1, i * k + j, 2] = 255
-
-    stamped_frame = np.uint8(stamped_frame)
-    final_frame = av.VideoFrame.from_ndarray(stamped_frame)
+    if frame.format.name != 'yuv420p':
+        frame = frame.reformat(format='yuv420p')
+    width, height = frame.width, frame.height
+    stamped_height = height + NUM_ROWS
+    k = width // NUMBER_OF_BITS
+
+    stamped_array = _preallocated_buffer('stamp', (stamped_height * 3 // 2, width))
+    stamped_planes = _buffer_planes(stamped_array, width, stamped_height)
+    for stamped_plane, plane in zip(stamped_planes, _frame_planes(frame)):
+        stamped_plane[:plane.shape[0]] = plane
+    stamped_planes[1][height // 2:] = BARCODE_CHROMA
+    stamped_planes[2][height // 2:] = BARCODE_CHROMA
+
+    # the most significant bit is leftmost
+    shifts = np.arange(NUMBER_OF_BITS - 1, -1, -1)
+    bits = ((frame_index + 1) >> shifts) & 1
+    barcode = stamped_planes[0][height:]
+    barcode[:, :NUMBER_OF_BITS * k] = np.repeat(
+        np.where(bits, BARCODE_WHITE, BARCODE_BLACK).astype(np.uint8), k)
+    barcode[:, NUMBER_OF_BITS * k:] = BARCODE_BLACK
+
+    final_frame = av.VideoFrame.from_ndarray(stamped_array, format='yuv420p')
     final_frame.pts = frame_pts
     final_frame.time_base = frame_time_base
     return final_frame
 
 
 def destamp_frame(frame):
-    """ retrieve frame index and original frame from barcoded frame
+    """ retrieve frame index and original frame from barcoded frame,
+        reading the barcode from the luma plane of a yuv420p frame
     """
-    frame_array = frame.to_rgb().to_ndarray()
-    k = frame_array.shape[1] // NUMBER_OF_BITS
-    destamped_frame = frame_array[:-NUM_ROWS]
-
-    frame_id = frame_array[-NUM_ROWS:, :, :]
-    frame_id = frame_id.mean(0)
-    frame_id = frame_id[frame_array.shape[1] - k*NUMBER_OF_BITS:, :]
-
-    frame_id = np.reshape(frame_id, [NUMBER_OF_BITS, k, 3])
-    frame_id = frame_id.mean(axis=(1,2))
-
-    frame_id = (frame_id > (frame_id.max() + frame_id.min()) / 2 * 1.2 ).astype(int)
+    if frame.format.name != 'yuv420p':
+        frame = frame.reformat(format='yuv420p')
+    width, height = frame.width, frame.height
+    destamped_height = height - NUM_ROWS
+    k = width // NUMBER_OF_BITS
+    planes = _frame_planes(frame)
+
+    frame_id = planes[0][destamped_height:, :k * NUMBER_OF_BITS]
+    frame_id = frame_id.reshape(NUM_ROWS, NUMBER_OF_BITS, k).mean(axis=(0, 2))
+    frame_id = (frame_id > (frame_id.max() + frame_id.min()) / 2 * 1.2).astype(int)
     frame_id = ((2 ** (NUMBER_OF_BITS - 1 - np.arange(NUMBER_OF_BITS))) * frame_id).sum()
     frame_id = frame_id - 1
 
-    destamped_frame = np.uint8(destamped_frame)
-    final_frame = av.VideoFrame.from_ndarray(destamped_frame)
+    destamped_array = _preallocated_buffer('destamp', (destamped_height * 3 // 2, width))
+    for destamped_plane, plane in zip(_buffer_planes(destamped_array, width, destamped_height),
+                                      planes):
+        destamped_plane[:] = plane[:destamped_plane.shape[0]]
+
+    final_frame = av.VideoFrame.from_ndarray(destamped_array, format='yuv420p')
     return final_frame, frame_id
 
 
+def is_frame_stamped(frame):
+    """ whether the last rows of a frame hold a frame index barcode, that
+        is bits which are black or white and neutral chroma below them
+    """
+    if frame.format.name != 'yuv420p':
+        frame = frame.reformat(format='yuv420p')
+    width, height = frame.width, frame.height
+    k = width // NUMBER_OF_BITS
+    if height <= NUM_ROWS or k == 0:
+        return False
+    planes = _frame_planes(frame)
+
+    bits = planes[0][height - NUM_ROWS:, :k * NUMBER_OF_BITS]
+    bits = bits.reshape(NUM_ROWS, NUMBER_OF_BITS, k).mean(axis=(0, 2))
+    black = np.abs(bits - BARCODE_BLACK) <= BARCODE_TOLERANCE
+    white = np.abs(bits - BARCODE_WHITE) <= BARCODE_TOLERANCE
+    if not (black | white).all() or not white.any():
+        return False
+
+    chroma_rows = planes[1].shape[0] - (height - NUM_ROWS) // 2
+    for plane in planes[1:]:
+        chroma = plane[plane.shape[0] - chroma_rows:].astype(np.int16)
+        if np.abs(chroma - BARCODE_CHROMA).mean() > BARCODE_TOLERANCE / 2:
+            return False
+    return True
+
+
+def receive_frame_index(track, frame):
+    """ return a received video frame and its frame index, taken from the
+        RTP header extension or, when the track does not know it, from the
+        barcode of a stamped frame; the index is None if neither is there
+    """
+    frame_index = track.frame_index(frame)
+    if frame_index is None and is_frame_stamped(frame):
+        frame, frame_index = destamp_frame(frame)
+    return frame, frame_index
+
+
 async def blackhole_consume(track):
     while True:
         try:
@@ -190,11 +440,33 @@ class MediaBlackhole:
         self.__tracks = {}
 
 
+class SharedVideoFrame:
+    """
+    A decoded video frame shared by the encoder and other consumers.
+
+    The frame stays in its native layout for the encoder. The RGB array is
+    only computed the first time a consumer asks for it, and that single
+    array is then shared by all consumers, which must not modify it.
+    """
+
+    def __init__(self, frame: VideoFrame) -> None:
+        self.frame = frame
+        self.__rgb_array = None
+        self.__lock = threading.Lock()
+
+    def to_rgb_ndarray(self) -> np.ndarray:
+        with self.__lock:
+            if self.__rgb_array is None:
+                self.__rgb_array = self.frame.to_rgb().to_ndarray()
+            return self.__rgb_array
+
+
 def place_frame_in_video_queue(frame, frame_index, loop, video_track, container):
     """ place the attached frame in the video track queue after stamping it 
     """
     frame_time = frame.time
-    frame = stamp_frame(frame, frame_index, frame.pts, frame.time_base)
+    if stamp_frame_index:
+        frame = stamp_frame(frame, frame_index, frame.pts, frame.time_base)
     
     logger.warning(
         "MediaPlayer(%s) Put video frame %s in the queue: %s",
@@ -221,8 +493,9 @@ def requires_updated_reference(keypoints, frame_index, original_frame, lr_frame_
 
 def player_worker(
     loop, container, streams, audio_track, video_track, keypoints_track, lr_video_track,
-    quit_event, throttle_playback, save_dir, enable_prediction, prediction_type, 
+    quit_event, throttle_playback, frame_writer, enable_prediction, prediction_type, 
     reference_update_freq):
+    lr_size = get_main_configs()['lr_size']
     audio_fifo = av.AudioFifo()
     audio_format_name = "s16"
     audio_layout_name = "stereo"
@@ -238,7 +511,13 @@ def player_worker(
     frame_time = None
     display_option = 'synthetic'
     start_time = time.time()
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    # the low resolution stream is computed with torch, which is only
+    # imported when prediction needs it
+    if enable_prediction and prediction_type != "keypoints":
+        from first_order_model.reconstruction import frame_to_tensor, resize_tensor_to_array
+        from skimage import img_as_float32
+        import torch
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
     while not quit_event.is_set():
         try:
@@ -321,11 +600,11 @@ def player_worker(
                 container.name, str(frame.index), str(frame), time.perf_counter()
             )
             
-            frame_array = frame.to_rgb().to_ndarray()
+            # the encoder takes the frame as is, RGB is only computed on demand
+            shared_frame = SharedVideoFrame(frame)
 
-            if save_sent_frames and save_dir is not None:
-                np.save(os.path.join(save_dir, 'sender_frame_%05d.npy' % frame.index),
-                        frame_array)
+            if save_sent_frames and frame_writer is not None:
+                frame_writer.save('sender_frame', frame.index, shared_frame.to_rgb_ndarray())
 
             if enable_prediction:
                 logger.warning(
@@ -334,7 +613,8 @@ def player_worker(
                 )
  
                 if prediction_type != "keypoints":
-                    frame_tensor = frame_to_tensor(img_as_float32(frame_array), device)
+                    frame_tensor = frame_to_tensor(img_as_float32(shared_frame.to_rgb_ndarray()),
+                                                   device)
                     lr_frame_array = resize_tensor_to_array(frame_tensor, lr_size, device)
 
                     lr_frame = av.VideoFrame.from_ndarray(lr_frame_array)
@@ -346,13 +626,11 @@ def player_worker(
                     """
 
                     place_frame_in_video_queue(lr_frame, frame.index, loop, lr_video_track, container)
-                    if save_lr_video_npy and save_dir is not None:
-                        np.save(os.path.join(save_dir,
-                                'sender_lr_frame_%05d.npy' % frame.index),
-                                lr_frame_array)
+                    if save_lr_video_npy and frame_writer is not None:
+                        frame_writer.save('sender_lr_frame', frame.index, lr_frame_array)
 
                 else:
-                    asyncio.run_coroutine_threadsafe(keypoints_track._queue.put((frame_array, frame.time, \
+                    asyncio.run_coroutine_threadsafe(keypoints_track._queue.put((shared_frame, frame.time, \
                             frame.index, frame.pts)), loop)
 
             # Only add video frame is this is meant to be used as a source \
@@ -371,6 +649,8 @@ class PlayerStreamTrack(MediaStreamTrack):
         self._queue = asyncio.Queue()
         self._start = None
         self._fps_factor = fps_factor
+        self.__last_frame = None
+        self.__last_frame_index = None
 
     async def recv(self):
         if self.readyState != "live":
@@ -396,35 +676,38 @@ class PlayerStreamTrack(MediaStreamTrack):
                 await asyncio.sleep(wait)
 
         # record send time just before sending it on wire
-        if self._player._send_times_file is not None:
+        frame_writer = self._player._frame_writer
+        if frame_writer is not None:
             if self._player._enable_prediction and (self.kind == "keypoints" or self.kind == "lr_video"):
-                self._player._send_times_file.write(f'Sent {frame_index} at {datetime.datetime.now()}\n')
+                frame_writer.log("send_times.txt", f'Sent {frame_index} at {datetime.datetime.now()}\n')
             elif self._player._enable_prediction and self.kind == "video":
-                self._player._send_times_file.write(
+                frame_writer.log("send_times.txt",
                         f'Sent {frame_index} at {datetime.datetime.now()} (video) \n')
             elif self.kind == "video":
-                self._player._send_times_file.write(f'Sent {frame_index} at {datetime.datetime.now()}\n')
-            self._player._send_times_file.flush()
+                frame_writer.log("send_times.txt", f'Sent {frame_index} at {datetime.datetime.now()}\n')
         
         # extract keypoints before sending
         if self.kind == "keypoints": 
             try:
-                frame_array = frame 
+                model = await self._player._get_model()
                 time_before_keypoints = time.perf_counter()
-                loop = asyncio.get_running_loop()
-                with concurrent.futures.ThreadPoolExecutor() as pool:
-                    keypoints, source_frame_index = await loop.run_in_executor(pool,
-                                                            model.extract_keypoints, frame_array)
+                # convert to RGB on the inference thread, off the event loop
+                keypoints, source_frame_index = await self._player._inference_executor.run(
+                                                        lambda: model.extract_keypoints(
+                                                            frame.to_rgb_ndarray()))
+                frame_array = frame.to_rgb_ndarray()
                 time_after_keypoints = time.perf_counter()
                 logger.warning(
-                    "Keypoints extraction time for frame index %s in sender: %s",
-                    str(frame_index), str(time_after_keypoints - time_before_keypoints)
+                    "Keypoints extraction time for frame index %s in sender: %s (queue depth %s)",
+                    str(frame_index), str(time_after_keypoints - time_before_keypoints),
+                    self._player._inference_executor.queue_depth
                 )
                 keypoints_frame = KeypointsFrame(keypoints, frame_pts, frame_index, source_frame_index) 
                 
                 if frame_index % self._player._reference_update_freq == 0:
                     time_before_update = time.perf_counter()
-                    model.update_source(frame_index, frame_array, keypoints)
+                    await self._player._inference_executor.run(
+                        model.update_source, frame_index, frame_array, keypoints)
                     time_after_update = time.perf_counter()
                     logger.warning(
                         "Time to update source frame with index %s in sender: %s",
@@ -439,8 +722,15 @@ class PlayerStreamTrack(MediaStreamTrack):
             if keypoints_frame is not None:
                 return keypoints_frame
         else:
+            self.__last_frame = frame
+            self.__last_frame_index = frame_index
             return frame
 
+    def frame_index(self, frame):
+        if frame is self.__last_frame:
+            return self.__last_frame_index
+        return super().frame_index(frame)
+
     def stop(self):
         super().stop()
         self.__log_debug("Stopping %s", self.kind)
@@ -486,10 +776,15 @@ class MediaPlayer:
     :param file: The path to a file, or a file-like object.
     :param format: The format to use, defaults to autodect.
     :param options: Additional options to pass to FFmpeg.
+    :param inference_executor: The :class:`InferenceExecutor` to run the model in,
+                               defaults to one owned by the player and shut
+                               down when it stops. Pass the same one to
+                               players and recorders sharing a model.
     """
 
     def __init__(self, file, enable_prediction=False, prediction_type="keypoints",
-                reference_update_freq=30, fps=None, save_dir=None, format=None, options={}):
+                reference_update_freq=30, fps=None, save_dir=None, format=None, options={},
+                inference_executor=None):
         self.__container = av.open(file=file, format=format, mode="r", options=options)
         self.__thread: Optional[threading.Thread] = None
         self.__thread_quit: Optional[threading.Event] = None
@@ -497,11 +792,21 @@ class MediaPlayer:
         self._enable_prediction = enable_prediction
         self._prediction_type = prediction_type
         self._reference_update_freq = reference_update_freq
-        
+        self._model = None
+        self._inference_executor = inference_executor
+        self.__owns_inference_executor = False
+        if requires_model(enable_prediction) and prediction_type == "keypoints":
+            # only keypoints are extracted on the sender side, with a model
+            # which is resolved off the event loop when the first frame is sent
+            if self._inference_executor is None:
+                self._inference_executor = InferenceExecutor(name="inference-player")
+                self.__owns_inference_executor = True
+
+        # frames and timing logs are written in the background
         if self.__save_dir is not None:
-            self._send_times_file = open(os.path.join(save_dir, "send_times.txt"), "w")
+            self._frame_writer = FrameWriter(save_dir)
         else:
-            self._send_times_file = None
+            self._frame_writer = None
 
         # examine streams
         self.__started: Set[PlayerStreamTrack] = set()
@@ -520,7 +825,7 @@ class MediaPlayer:
                     fps_factor = round(float(stream.base_rate) / fps)
                 else:
                     fps_factor = 1
-                if generator_type not in ['bicubic', 'swinir-lte']:
+                if get_main_configs()['generator_type'] not in ['bicubic', 'swinir-lte']:
                     self.__video = PlayerStreamTrack(self, kind="video", fps_factor=fps_factor)
                     self.__streams.append(stream)
                 if self._enable_prediction:
@@ -561,6 +866,18 @@ class MediaPlayer:
         """
         return self.__lr_video
 
+    @property
+    def inference_executor(self) -> Optional[InferenceExecutor]:
+        """
+        The :class:`InferenceExecutor` running the model, if prediction is enabled.
+        """
+        return self._inference_executor
+
+    async def _get_model(self):
+        if self._model is None:
+            self._model = await warm_up_model(executor=self._inference_executor)
+        return self._model
+
     def _start(self, track: PlayerStreamTrack) -> None:
         self.__started.add(track)
         if self.__thread is None:
@@ -579,7 +896,7 @@ class MediaPlayer:
                     self.__lr_video,
                     self.__thread_quit,
                     self._throttle_playback,
-                    self.__save_dir,
+                    self._frame_writer,
                     self._enable_prediction,
                     self._prediction_type,
                     self._reference_update_freq,
@@ -601,8 +918,13 @@ class MediaPlayer:
             self.__container.close()
             self.__container = None
 
-        if self.__send_times_file is not None:
-            self.__send_times_file.close()
+        if not self.__started and self._frame_writer is not None:
+            self._frame_writer.close()
+            self._frame_writer = None
+
+        if not self.__started and self.__owns_inference_executor:
+            self._inference_executor.shutdown(wait=False)
+            self.__owns_inference_executor = False
 
     def __log_debug(self, msg: str, *args) -> None:
         logger.debug(f"MediaPlayer(%s) {msg}", self.__container.name, *args)
@@ -631,10 +953,15 @@ class MediaRecorder:
     :param file: The path to a file, or a file-like object.
     :param format: The format to use, defaults to autodect.
     :param options: Additional options to pass to FFmpeg.
+    :param inference_executor: The :class:`InferenceExecutor` to run the model in,
+                               defaults to one owned by the recorder and shut
+                               down when it stops. Pass the same one to
+                               players and recorders sharing a model.
     """
 
     def __init__(self, file, enable_prediction=False, prediction_type="keypoints",
-                reference_update_freq=30, output_fps=30, format=None, save_dir=None, options={}):
+                reference_update_freq=30, output_fps=30, format=None, save_dir=None, options={},
+                inference_executor=None):
         self.__container = av.open(file=file, format=format, mode="w", options=options)
         self.__received_keypoints_frame_num = 0
         self.__keypoints_file_name = str(file).split('.')[0] + "_recorded_keypoints.txt"
@@ -652,6 +979,17 @@ class MediaRecorder:
         self.__prediction_type = prediction_type
         self.__reference_update_freq = reference_update_freq
         self.__output_fps = output_fps
+        self.__configs = get_main_configs()
+        self.__generator_type = self.__configs['generator_type']
+        self.__model = None
+        self.__inference_executor = inference_executor
+        self.__owns_inference_executor = False
+        self.__requires_model = requires_model(enable_prediction, self.__generator_type)
+        if self.__requires_model:
+            # the model is resolved off the event loop when the first track runs
+            if self.__inference_executor is None:
+                self.__inference_executor = InferenceExecutor(name="inference-recorder")
+                self.__owns_inference_executor = True
         self.__display_option = "synthetic"
         '''
         __display_option could be:
@@ -659,10 +997,11 @@ class MediaRecorder:
             2. "synthetic": predicted target using keypoint or low-res video
         '''
         
+        # frames and timing logs are written in the background
         if self.__save_dir is not None:
-            self.__recv_times_file = open(os.path.join(save_dir, "recv_times.txt"), "w")
+            self.__frame_writer = FrameWriter(save_dir)
         else:
-            self.__recv_times_file = None
+            self.__frame_writer = None
 
     def addTrack(self, track):
         """
@@ -689,12 +1028,19 @@ class MediaRecorder:
                 stream = self.__container.add_stream("libx264", rate=self.__output_fps)
                 stream.pix_fmt = "yuv420p"
             
-            stream.height = frame_shape[0]
-            stream.width = frame_shape[1]
+            stream.height = self.__configs['frame_shape'][0]
+            stream.width = self.__configs['frame_shape'][1]
         else:
             stream = None
         self.__tracks[track] = MediaRecorderContext(stream)
 
+    @property
+    def inference_executor(self) -> Optional[InferenceExecutor]:
+        """
+        The :class:`InferenceExecutor` running the model, if prediction is enabled.
+        """
+        return self.__inference_executor
+
     async def start(self):
         """
         Start recording.
@@ -721,12 +1067,18 @@ class MediaRecorder:
                 self.__container.close()
                 self.__container = None
 
-        if self.__recv_times_file is not None:
-            self.__recv_times_file.close()
+        if self.__frame_writer is not None:
+            self.__frame_writer.close()
+            self.__frame_writer = None
+
+        if self.__owns_inference_executor:
+            self.__inference_executor.shutdown(wait=False)
+            self.__owns_inference_executor = False
 
     async def __run_track(self, track, context):
         loop = asyncio.get_running_loop()
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        if self.__requires_model and self.__model is None and track.kind != "audio":
+            self.__model = await warm_up_model(executor=self.__inference_executor)
         while True:
             try:
                 frame = await track.recv()
@@ -735,7 +1087,7 @@ class MediaRecorder:
                 return
 
             if track.kind == "video":
-                frame, video_frame_index = destamp_frame(frame)
+                frame, video_frame_index = receive_frame_index(track, frame)
                 self.__frame_height = frame.height
                 self.__frame_width = frame.width
 
@@ -743,17 +1095,18 @@ class MediaRecorder:
                                     frame, video_frame_index, datetime.datetime.now())
                 if self.__enable_prediction:
                     if self.__display_option == 'synthetic' and \
-                            generator_type not in ['bicubic', 'swinir-lte']:
+                            self.__generator_type not in ['bicubic', 'swinir-lte']:
                         # update model related info with most recent source frame
                         source_frame_array = frame.to_rgb().to_ndarray()
                         
                         time_before_keypoints = time.perf_counter()
-                        with concurrent.futures.ThreadPoolExecutor() as pool:
-                            source_keypoints, _  = await loop.run_in_executor(pool, 
-                                                model.extract_keypoints, source_frame_array)
+                        source_keypoints, _  = await self.__inference_executor.run(
+                                            self.__model.extract_keypoints, source_frame_array)
                         time_after_keypoints = time.perf_counter()
-                        self.__log_debug("Source keypoints extraction time in receiver: %s",
-                                        str(time_after_keypoints - time_before_keypoints))
+                        self.__log_debug("Source keypoints extraction time in receiver: %s " \
+                                        "(queue depth %s)",
+                                        str(time_after_keypoints - time_before_keypoints),
+                                        self.__inference_executor.queue_depth)
 
                         asyncio.run_coroutine_threadsafe(self.__reference_frames_queue.put(
                             (source_frame_array, source_keypoints, video_frame_index)), loop)
@@ -765,19 +1118,17 @@ class MediaRecorder:
                                                         , loop)
                 else:
                     # Original aiortc video stream, no prediction
-                    if self.__recv_times_file is not None:
-                        self.__recv_times_file.write(f'Received {video_frame_index} at {datetime.datetime.now()}\n')
-                        self.__recv_times_file.flush()
+                    if self.__frame_writer is not None:
+                        self.__frame_writer.log("recv_times.txt",
+                                f'Received {video_frame_index} at {datetime.datetime.now()}\n')
 
-                    if save_received_frames and self.__save_dir is not None:
-                        frame_array = frame.to_rgb().to_ndarray()
-                        np.save(os.path.join(self.__save_dir,
-                            'receiver_frame_%05d.npy' % video_frame_index), frame_array)
+                    if save_received_frames and self.__frame_writer is not None:
+                        self.__frame_writer.save('receiver_frame', video_frame_index, frame)
 
                     self.__log_debug("Frame displayed at receiver %s", video_frame_index)
                     for packet in context.stream.encode(frame):
                         self.__container.mux(packet)
-                    if video_frame_index % 1000 == 0:
+                    if video_frame_index is not None and video_frame_index % 1000 == 0:
                         print("Displayed ", video_frame_index)
 
             elif track.kind == "audio":
@@ -792,19 +1143,21 @@ class MediaRecorder:
                     frame_index = received_keypoints['frame_index']
 
                     if save_keypoints_to_file:
-                        keypoints_file = open(self.__keypoints_file_name, "a")
-                        keypoints_file.write(str(received_keypoints))
-                        keypoints_file.write("\n")
-                        keypoints_file.close()
+                        if self.__frame_writer is not None:
+                            self.__frame_writer.log(self.__keypoints_file_name,
+                                    str(received_keypoints) + "\n")
+                        else:
+                            keypoints_file = open(self.__keypoints_file_name, "a")
+                            keypoints_file.write(str(received_keypoints))
+                            keypoints_file.write("\n")
+                            keypoints_file.close()
 
                 elif track.kind == "lr_video":
-                    lr_frame, frame_index = destamp_frame(frame)
+                    lr_frame, frame_index = receive_frame_index(track, frame)
                     lr_frame_array = lr_frame.to_rgb().to_ndarray()
                     asyncio.run_coroutine_threadsafe(self.__lr_video_queue.put((lr_frame_array, frame_index)), loop)
-                    if save_lr_video_npy and self.__save_dir is not None:
-                        np.save(os.path.join(self.__save_dir,
-                                'receiver_lr_frame_%05d.npy' % frame_index),
-                                lr_frame_array)
+                    if save_lr_video_npy and self.__frame_writer is not None:
+                        self.__frame_writer.save('receiver_lr_frame', frame_index, lr_frame_array)
  
                 self.__log_debug("%s for frame %s received at time %s",
                                 track.kind, str(frame_index), datetime.datetime.now())
@@ -817,46 +1170,52 @@ class MediaRecorder:
                         elif track.kind == "lr_video":
                             lr_frame_array, frame_index = await self.__lr_video_queue.get()
                         if self.__display_option == "synthetic":
-                            if frame_index % self.__reference_update_freq == 0 and \
-                                    generator_type not in ['bicubic', 'swinir-lte']:
+                            if frame_index is not None and \
+                                    frame_index % self.__reference_update_freq == 0 and \
+                                    self.__generator_type not in ['bicubic', 'swinir-lte']:
                                 source_frame_array, source_keypoints, source_frame_index = await self.__reference_frames_queue.get()
 
                                 time_before_update = time.perf_counter()
-                                model.update_source(source_frame_index, source_frame_array, source_keypoints)
+                                await self.__inference_executor.run(self.__model.update_source,
+                                        source_frame_index, source_frame_array, source_keypoints)
                                 time_after_update = time.perf_counter()
                                 self.__log_debug("Time to update source frame %s in receiver" \
                                         " when receiving %s %s: %s",
                                         source_frame_index, track.kind, frame_index, \
                                         str(time_after_update - time_before_update))
-                                if save_sent_frames and self.__save_dir is not None:
-                                    np.save(os.path.join(self.__save_dir,
-                                        'reference_frame_%05d.npy' % source_frame_index), source_frame_array)
-
-                            with concurrent.futures.ThreadPoolExecutor() as pool:
-                                if generator_type not in ['bicubic', 'swinir-lte']:
-                                    self.__log_debug("Calling predict for frame %s with source frame %s",
-                                                frame_index, source_frame_index)
-                                before_predict_time = time.perf_counter()
-                                if track.kind == "keypoints":
-                                    predicted_target = await loop.run_in_executor(pool, \
-                                            model.predict, received_keypoints)
-                                elif track.kind == "lr_video":
-                                    if generator_type == "bicubic":
-                                        predicted_target = lr_frame.reformat(width=frame_shape[0], height=frame_shape[0],\
-                                                            interpolation='BICUBIC').to_rgb().to_ndarray()
-
-                                    else:
-                                        predicted_target = await loop.run_in_executor(pool, \
-                                                model.predict_with_lr_video, lr_frame_array)
+                                if save_sent_frames and self.__frame_writer is not None:
+                                    self.__frame_writer.save('reference_frame', source_frame_index,
+                                                             source_frame_array)
+
+                            if self.__generator_type not in ['bicubic', 'swinir-lte']:
+                                self.__log_debug("Calling predict for frame %s with source frame %s",
+                                            frame_index, source_frame_index)
+                            before_predict_time = time.perf_counter()
+                            if track.kind == "keypoints":
+                                predicted_target = await self.__inference_executor.run(
+                                        self.__model.predict, received_keypoints)
+                            elif track.kind == "lr_video":
+                                if self.__generator_type == "bicubic":
+                                    predicted_target = lr_frame.reformat(width=self.__configs['frame_shape'][0],
+                                                    height=self.__configs['frame_shape'][0],\
+                                                        interpolation='BICUBIC').to_rgb().to_ndarray()
+
+                                else:
+                                    predicted_target = await self.__inference_executor.run(
+                                            self.__model.predict_with_lr_video, lr_frame_array)
 
                             after_predict_time = time.perf_counter()
                             self.__log_debug("Prediction time for received %s %s: %s at time %s",
                                     track.kind, frame_index, str(after_predict_time - before_predict_time),
                                     after_predict_time)
+                            if self.__inference_executor is not None:
+                                self.__log_debug("Inference queue depth %s, max %s",
+                                        self.__inference_executor.queue_depth,
+                                        self.__inference_executor.max_queue_depth)
 
-                            if self.__recv_times_file is not None:
-                                self.__recv_times_file.write(f'Received {frame_index} at {datetime.datetime.now()}\n')
-                                self.__recv_times_file.flush()
+                            if self.__frame_writer is not None:
+                                self.__frame_writer.log("recv_times.txt",
+                                        f'Received {frame_index} at {datetime.datetime.now()}\n')
 
                             predicted_frame = av.VideoFrame.from_ndarray(np.array(predicted_target))
                             predicted_frame = predicted_frame.reformat(format='yuv420p')
@@ -864,13 +1223,12 @@ class MediaRecorder:
                                                             (predicted_frame, frame_index)),
                                                             loop)
                             #predicted_frame.pts = received_keypoints['pts']
-                            if frame_index % 1000 == 0:
+                            if frame_index is not None and frame_index % 1000 == 0:
                                 print("Predicted!", frame_index)
 
-                            if save_predicted_frames and self.__save_dir is not None:
-                                predicted_array = np.array(predicted_target)
-                                np.save(os.path.join(self.__save_dir,
-                                    'predicted_frame_%05d.npy' % frame_index), predicted_array)
+                            if save_predicted_frames and self.__frame_writer is not None:
+                                self.__frame_writer.save('predicted_frame', frame_index,
+                                                         np.array(predicted_target))
                     except Exception as e:
                         print(e)
                         self.__log_debug("Couldn't predict based on received %s frame %s with error %s",
@@ -891,10 +1249,8 @@ class MediaRecorder:
                 for packet in context.stream.encode(display_frame):
                     self.__container.mux(packet)
 
-                if self.__save_dir is not None and save_received_frames:
-                    display_array = display_frame.to_rgb().to_ndarray()
-                    np.save(os.path.join(self.__save_dir,
-                            'receiver_frame_%05d.npy' % frame_index), display_array)
+                if self.__frame_writer is not None and save_received_frames:
+                    self.__frame_writer.save('receiver_frame', frame_index, display_frame)
 
     def __log_debug(self, msg: str, *args) -> None:
         logger.debug(f"MediaRecorder(%s) {msg}", self.__container.name, *args)
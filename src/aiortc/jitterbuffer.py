@@ -1,22 +1,57 @@
+import time
 from typing import List, Optional, Tuple
 
 from .rtp import RtpPacket
-from .utils import uint16_add
+from .utils import uint16_add, uint16_gt
 import logging
 
 MAX_MISORDER = 100
 
+# adaptive mode: the target playout delay is a multiple of the jitter
+# estimate, bounded to keep interactive latency low
+JITTER_MULTIPLIER = 4
+MIN_TARGET_DELAY_MS = 10
+MAX_TARGET_DELAY_MS = 300
+
 logger = logging.getLogger(__name__)
 
 class JitterFrame:
-    def __init__(self, data: bytes, timestamp: int) -> None:
+    def __init__(
+        self, data: bytes, timestamp: int, frame_index: Optional[int] = None
+    ) -> None:
         self.data = data
         self.timestamp = timestamp
+        self.frame_index = frame_index
 
 
 class JitterBuffer:
+    """
+    Reassembles frames from RTP packets.
+
+    By default frames are only released once complete, and a packet window
+    of `capacity` packets bounds how long a lost packet is waited for.
+
+    In adaptive mode the buffer also estimates the network jitter from the
+    arrival times and RTP timestamps of packets, and derives a target
+    playout delay from it. A frame which is still missing packets when its
+    playout deadline passes is abandoned instead of stalling the stream,
+    either when the next packet arrives or when :meth:`poll` is called at
+    the :attr:`deadline`.
+
+    :param capacity: The number of packets in the window, a power of 2.
+    :param prefetch: The number of complete frames to hold before releasing one.
+    :param is_video: Whether to request keyframes on discontinuities.
+    :param adaptive: Whether to abandon late frames by deadline.
+    :param clock_rate: The RTP clock rate, used in adaptive mode.
+    """
+
     def __init__(
-        self, capacity: int, prefetch: int = 0, is_video: bool = False
+        self,
+        capacity: int,
+        prefetch: int = 0,
+        is_video: bool = False,
+        adaptive: bool = False,
+        clock_rate: int = 90000,
     ) -> None:
         assert capacity & (capacity - 1) == 0, "capacity must be a power of 2"
         self._capacity = capacity
@@ -24,12 +59,104 @@ class JitterBuffer:
         self._packets: List[Optional[RtpPacket]] = [None for i in range(capacity)]
         self._prefetch = prefetch
         self._is_video = is_video
+        self._max_seq: Optional[int] = None
+
+        # adaptive mode state, times are in milliseconds
+        self._adaptive = adaptive
+        self._clock_rate = clock_rate
+        self._last_timestamp: Optional[int] = None
+        self._extended_timestamp = 0
+        self._base_transit: Optional[float] = None
+        self._last_transit: Optional[float] = None
+        self._jitter = 0.0
+        self._current_delay = 0.0
+        self._frames_dropped_late = 0
+
+        # frame assembly state: the number of contiguous packets from the
+        # origin which have already been scanned, and the offsets of the
+        # marker packets among them
+        self._scanned = 0
+        self._markers: List[int] = []
 
     @property
     def capacity(self) -> int:
         return self._capacity
 
-    def add(self, packet: RtpPacket) -> Tuple[bool, Optional[JitterFrame]]:
+    @property
+    def origin(self) -> Optional[int]:
+        """
+        The sequence number of the oldest packet the buffer is waiting for.
+        """
+        return self._origin
+
+    @property
+    def clock_rate(self) -> int:
+        """
+        The RTP clock rate, used in adaptive mode.
+
+        Changing it restarts the jitter estimation, which is expressed in
+        terms of the previous clock.
+        """
+        return self._clock_rate
+
+    @clock_rate.setter
+    def clock_rate(self, clock_rate: int) -> None:
+        if clock_rate != self._clock_rate:
+            self._clock_rate = clock_rate
+            self._last_timestamp = None
+            self._extended_timestamp = 0
+            self._base_transit = None
+            self._last_transit = None
+            self._jitter = 0.0
+
+    @property
+    def jitter(self) -> float:
+        """
+        The estimated network jitter in milliseconds, in adaptive mode.
+        """
+        return self._jitter
+
+    @property
+    def target_delay(self) -> float:
+        """
+        The target playout delay in milliseconds, in adaptive mode.
+        """
+        return min(
+            max(JITTER_MULTIPLIER * self._jitter, MIN_TARGET_DELAY_MS),
+            MAX_TARGET_DELAY_MS,
+        )
+
+    @property
+    def current_delay(self) -> float:
+        """
+        The delay in milliseconds between the expected arrival and the
+        release of the last frame, in adaptive mode.
+        """
+        return self._current_delay
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """
+        The time in milliseconds at which the frame at the origin, which is
+        waiting for a lost packet, is to be abandoned, in adaptive mode.
+        """
+        timestamp = self._late_frame_timestamp()
+        if timestamp is None:
+            return None
+        return self._expected_arrival(timestamp) + self.target_delay
+
+    @property
+    def frames_dropped_late(self) -> int:
+        """
+        The number of frames abandoned because they missed their deadline.
+        """
+        return self._frames_dropped_late
+
+    def add(
+        self, packet: RtpPacket, arrival_time_ms: Optional[float] = None
+    ) -> Tuple[bool, Optional[JitterFrame]]:
+        if self._adaptive and arrival_time_ms is None:
+            arrival_time_ms = time.time() * 1000
         pli_flag = False
         if self._origin is None:
             self._origin = packet.sequence_number
@@ -43,6 +170,8 @@ class JitterBuffer:
             if misorder >= MAX_MISORDER:
                 self.remove(self.capacity)
                 self._origin = packet.sequence_number
+                self._max_seq = None
+                self._reset_scan()
                 if self._is_video:
                     pli_flag = True
                     logger.debug(f"Generating PLI because misorder %s exceeds max %s (Delta %s, capacity %s)", misorder, MAX_MISORDER, delta, self.capacity)
@@ -55,50 +184,165 @@ class JitterBuffer:
             excess = delta - self.capacity + 1
             if self.smart_remove(excess):
                 self._origin = packet.sequence_number
+                self._reset_scan()
             if self._is_video:
                 pli_flag = True
                 logger.debug(f"Generating PLI because delta %s exceeds capacity %s", delta, self.capacity)
 
         pos = packet.sequence_number % self._capacity
         self._packets[pos] = packet
+        if self._max_seq is None or uint16_gt(packet.sequence_number, self._max_seq):
+            self._max_seq = packet.sequence_number
         if self._is_video:
             logger.debug(f"Adding packet with sequence number %s to pos %s", packet.sequence_number, pos)
 
-        return pli_flag, self._remove_frame(packet.sequence_number)
+        if not self._adaptive:
+            return pli_flag, self._remove_frame(packet.sequence_number)
 
-    def _remove_frame(self, sequence_number: int) -> Optional[JitterFrame]:
-        frame = None
-        frames = 0
-        packets = []
+        self._update_jitter(packet.timestamp, arrival_time_ms)
+        frame = self._remove_frame(packet.sequence_number)
+        if frame is None and self._abandon_late_frame(arrival_time_ms):
+            if self._is_video:
+                pli_flag = True
+            frame = self._remove_frame(packet.sequence_number)
+        if frame is not None:
+            self._current_delay = max(
+                0.0, arrival_time_ms - self._expected_arrival(frame.timestamp)
+            )
+        return pli_flag, frame
+
+    def poll(self, now_ms: float) -> Tuple[bool, List[JitterFrame]]:
+        """
+        Abandon the frames whose deadline has passed while no more packets
+        arrived, and return the complete frames this releases.
+        """
+        pli_flag = False
+        frames: List[JitterFrame] = []
+        while self._abandon_late_frame(now_ms):
+            if self._is_video:
+                pli_flag = True
+            frame = self._remove_frame(self._max_seq)
+            while frame is not None:
+                frames.append(frame)
+                frame = self._remove_frame(self._max_seq)
+        if frames:
+            self._current_delay = max(
+                0.0, now_ms - self._expected_arrival(frames[-1].timestamp)
+            )
+        return pli_flag, frames
+
+    def _timestamp_ms(self, timestamp: int) -> float:
+        """
+        Convert an RTP timestamp to milliseconds, accounting for wrap-around.
+        """
+        if self._last_timestamp is None:
+            self._last_timestamp = timestamp
+        delta = (timestamp - self._last_timestamp) & 0xFFFFFFFF
+        if delta >= 0x80000000:
+            delta -= 0x100000000
+        extended = self._extended_timestamp + delta
+        if delta > 0:
+            self._last_timestamp = timestamp
+            self._extended_timestamp = extended
+        return extended * 1000 / self._clock_rate
+
+    def _expected_arrival(self, timestamp: int) -> float:
+        return self._timestamp_ms(timestamp) + self._base_transit
+
+    def _update_jitter(self, timestamp: int, arrival_time_ms: float) -> None:
+        transit = arrival_time_ms - self._timestamp_ms(timestamp)
+
+        # the base transit time follows the fastest packets, drifting up
+        # slowly to follow clock skew
+        if self._base_transit is None or transit < self._base_transit:
+            self._base_transit = transit
+        else:
+            self._base_transit += (transit - self._base_transit) / 1024
+
+        # interarrival jitter as in RFC 3550
+        if self._last_transit is not None:
+            self._jitter += (abs(transit - self._last_transit) - self._jitter) / 16
+        self._last_transit = transit
+
+    def _late_frame_timestamp(self) -> Optional[int]:
+        """
+        Return the timestamp of the frame at the origin if it is waiting for
+        a lost packet, in adaptive mode.
+        """
+        if not self._adaptive or self._origin is None or self._max_seq is None:
+            return None
+
+        # packets are still arriving in order, the frame is not late yet
+        last = uint16_add(self._max_seq, -self._origin)
+        if last < self._scanned or last >= self._capacity:
+            return None
+
+        # find the timestamp of the first buffered packet
+        for count in range(last + 1):
+            packet = self._packets[(self._origin + count) % self._capacity]
+            if packet is not None:
+                return packet.timestamp
+        return None
+
+    def _abandon_late_frame(self, now_ms: float) -> bool:
+        """
+        Abandon the frame at the origin if it is waiting for a lost packet
+        and its playout deadline has passed.
+        """
+        timestamp = self._late_frame_timestamp()
+        if timestamp is None:
+            return False
+        if now_ms < self._expected_arrival(timestamp) + self.target_delay:
+            return False
+
+        # drop the late frame along with the gaps in it, up to the first
+        # packet of the next frame
+        last = uint16_add(self._max_seq, -self._origin)
         remove = 0
+        while remove <= last:
+            packet = self._packets[(self._origin + remove) % self._capacity]
+            if packet is not None and packet.timestamp != timestamp:
+                break
+            remove += 1
+        if self._is_video:
+            logger.debug("Abandoning late frame %s, removing %s packets", timestamp, remove)
+        self.remove(remove)
+        self._frames_dropped_late += 1
+        return True
 
-        for count in range(self.capacity):
-            pos = (self._origin + count) % self._capacity
-            packet = self._packets[pos]
+    def _remove_frame(self, sequence_number: int) -> Optional[JitterFrame]:
+        # extend the run of contiguous packets from the origin, each packet
+        # is only scanned once while it is in the buffer
+        while self._scanned < self._capacity:
+            packet = self._packets[(self._origin + self._scanned) % self._capacity]
             if packet is None:
                 break
-            packets.append(packet)
-
             if packet.marker == 1:
-                # we now have a complete frame, only store the first one
-                if frame is None:
-                    frame = JitterFrame(
-                        data=b"".join([x._data for x in packets]), timestamp=packet.timestamp
-                    )
-                    remove = count + 1
-
-                # check we have prefetched enough
-                frames += 1
-                if frames >= self._prefetch:
-                    if self._is_video:
-                        logger.debug(f"removing %s packets from origin %s", remove, self._origin)
-                    self.remove(remove)
-                    return frame
-
-                # start a new frame
-                packets = []
+                self._markers.append(self._scanned)
+            self._scanned += 1
 
-        return None
+        # check we have prefetched enough complete frames
+        if not self._markers or len(self._markers) < self._prefetch:
+            return None
+
+        # only return the first complete frame
+        remove = self._markers[0] + 1
+        packets = [
+            self._packets[(self._origin + i) % self._capacity] for i in range(remove)
+        ]
+        frame = JitterFrame(
+            data=b"".join([x._data for x in packets]),
+            timestamp=packets[-1].timestamp,
+            frame_index=packets[-1].extensions.frame_index,
+        )
+        if self._is_video:
+            logger.debug(f"removing %s packets from origin %s", remove, self._origin)
+        self.remove(remove)
+        return frame
+
+    def _reset_scan(self) -> None:
+        self._scanned = 0
+        self._markers = []
 
     def remove(self, count: int) -> None:
         assert count <= self._capacity
@@ -107,6 +351,10 @@ class JitterBuffer:
             self._packets[pos] = None
             self._origin = uint16_add(self._origin, 1)
 
+        # the scanned packets move towards the new origin
+        self._scanned = max(0, self._scanned - count)
+        self._markers = [x - count for x in self._markers if x >= count]
+
     def smart_remove(self, count: int) -> bool:
         """
         smart_remove makes sure that all packages belonging to the same frame are removed
@@ -123,8 +371,10 @@ class JitterBuffer:
             self._packets[pos] = None
             self._origin = uint16_add(self._origin, 1)
             if i == self._capacity - 1:
+                self._reset_scan()
                 return True
 
+        self._reset_scan()
         if self._is_video:
             logger.debug(f"Smart remove resulting in false with origin %s", self._origin)
         return False
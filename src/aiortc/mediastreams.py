@@ -3,7 +3,7 @@ import fractions
 import time
 import uuid
 from abc import ABCMeta, abstractmethod
-from typing import Tuple
+from typing import Optional, Tuple
 
 from av import AudioFrame, VideoFrame
 from av.frame import Frame
@@ -63,6 +63,13 @@ class MediaStreamTrack(AsyncIOEventEmitter, metaclass=ABCMeta):
         Receive the next :class:`~av.audio.frame.AudioFrame` or :class:`~av.video.frame.VideoFrame`.
         """
 
+    def frame_index(self, frame) -> Optional[int]:
+        """
+        Return the application frame index of the frame last returned by
+        :meth:`recv`, if it is known.
+        """
+        return getattr(frame, "frame_index", None)
+
     def stop(self) -> None:
         if not self.__ended:
             self.__ended = True
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# packets are sent at the target bitrate multiplied by the pacing factor,
+# so that the encoder output does not build up in the pacer
+PACING_FACTOR = 2.5
+PACER_INTERVAL = 0.005
+PACER_MAX_QUEUE_TIME = 0.5
+PACER_MIN_BITRATE = 100000
+
+# priority classes, lower values are sent first
+PRIORITY_HIGH = 0
+PRIORITY_RETRANSMISSION = 1
+PRIORITY_VIDEO = 2
+
+Prepare = Callable[[bytes], bytes]
+
+
+def get_priority(kind: str) -> int:
+    """
+    Return the priority class of the packets of a media `kind`.
+    """
+    if kind in ["audio", "keypoints"]:
+        return PRIORITY_HIGH
+    return PRIORITY_VIDEO
+
+
+class Pacer:
+    """
+    Leaky bucket pacer for the RTP packets sent on a transport.
+
+    The sending rate is the sum of the target bitrates of the senders
+    multiplied by the pacing factor, so large frames are spread over time
+    instead of being sent as a burst. High priority packets, such as audio
+    and keypoints, are sent straight away but still use up the budget.
+    Other packets are queued by priority, retransmissions ahead of video,
+    and may be updated just before they are sent, for instance to set
+    their send time header extension.
+
+    :param transport: The :class:`RTCDtlsTransport` to send packets on.
+    :param pacing_factor: The multiplier applied to the target bitrate.
+    """
+
+    def __init__(self, transport, pacing_factor: float = PACING_FACTOR) -> None:
+        self.__bitrates: Dict[int, int] = {}
+        self.__budget = 0.0
+        self.__error: Optional[Exception] = None
+        self.__last_time: Optional[float] = None
+        self.__pacing_factor = pacing_factor
+        self.__queue_bytes = 0
+        self.__queues: List[Deque[Tuple[bytes, float, Optional[Prepare]]]] = [
+            deque() for i in range(PRIORITY_VIDEO + 1)
+        ]
+        self.__task: Optional[asyncio.Future[None]] = None
+        self.__transport = transport
+        self.__wakeup = asyncio.Event()
+
+        # stats
+        self.max_queue_delay = 0.0
+        self.packets_paced = 0
+
+    @property
+    def pacing_rate(self) -> float:
+        """
+        The current sending rate in bytes per second.
+        """
+        bitrate = max(sum(self.__bitrates.values()), PACER_MIN_BITRATE)
+        rate = bitrate * self.__pacing_factor / 8
+
+        # drain the queue in time even if the target bitrate is too low
+        if self.__queue_bytes:
+            oldest = min(queue[0][1] for queue in self.__queues if queue)
+            remaining = PACER_MAX_QUEUE_TIME - (time.monotonic() - oldest)
+            rate = max(rate, self.__queue_bytes / max(remaining, PACER_INTERVAL))
+        return rate
+
+    @property
+    def queue_bytes(self) -> int:
+        return self.__queue_bytes
+
+    @property
+    def queue_packets(self) -> int:
+        return sum(len(queue) for queue in self.__queues)
+
+    def set_bitrate(self, ssrc: int, bitrate: Optional[int]) -> None:
+        """
+        Set the target bitrate of the sender of `ssrc`, or remove it.
+        """
+        if bitrate is None:
+            self.__bitrates.pop(ssrc, None)
+        else:
+            self.__bitrates[ssrc] = bitrate
+
+    async def send(
+        self, data: bytes, priority: int, prepare: Optional[Prepare] = None
+    ) -> None:
+        """
+        Send an RTP packet, or queue it to be sent when the budget allows.
+
+        :param data: The serialized packet.
+        :param priority: The priority class of the packet.
+        :param prepare: A function applied to the packet right before it
+                        is sent.
+        """
+        await self.send_batch([data], priority, prepare)
+
+    async def send_batch(
+        self, packets: List[bytes], priority: int, prepare: Optional[Prepare] = None
+    ) -> None:
+        """
+        Send the RTP packets of a frame, or queue them to be sent when the
+        budget allows.
+
+        :param packets: The serialized packets.
+        :param priority: The priority class of the packets.
+        :param prepare: A function applied to each packet right before it
+                        is sent.
+        """
+        if self.__error is not None:
+            raise ConnectionError(str(self.__error))
+
+        # high priority packets skip the queues to keep their latency low,
+        # but they are charged to the budget, which may go negative, so the
+        # queued packets wait until the overall rate is back on target
+        if priority == PRIORITY_HIGH:
+            self.__refill(time.monotonic())
+            self.__budget -= sum(len(data) for data in packets)
+            if prepare is not None:
+                packets = [prepare(data) for data in packets]
+            await self.__transport._send_rtp_batch(packets)
+            return
+
+        now = time.monotonic()
+        for data in packets:
+            self.__queues[priority].append((data, now, prepare))
+            self.__queue_bytes += len(data)
+        if self.__task is None:
+            self.__task = asyncio.ensure_future(self.__run())
+        self.__wakeup.set()
+
+    def stop(self) -> None:
+        """
+        Stop sending, dropping the queued packets.
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+        for queue in self.__queues:
+            queue.clear()
+        self.__queue_bytes = 0
+
+    def __pop(self) -> Optional[Tuple[bytes, float, Optional[Prepare]]]:
+        for queue in self.__queues:
+            if queue:
+                item = queue.popleft()
+                self.__queue_bytes -= len(item[0])
+                return item
+        return None
+
+    def __refill(self, now: float) -> None:
+        rate = self.pacing_rate
+        if self.__last_time is None:
+            self.__budget = rate * PACER_INTERVAL
+        else:
+            self.__budget = min(
+                self.__budget + rate * (now - self.__last_time),
+                rate * PACER_INTERVAL,
+            )
+        self.__last_time = now
+
+    async def __run(self) -> None:
+        try:
+            while True:
+                if not self.__queue_bytes:
+                    self.__wakeup.clear()
+                    await self.__wakeup.wait()
+
+                # send what the budget allows as a single batch
+                now = time.monotonic()
+                self.__refill(now)
+                packets = []
+                while self.__budget > 0:
+                    item = self.__pop()
+                    if item is None:
+                        break
+                    data, queued, prepare = item
+                    self.__budget -= len(data)
+                    self.max_queue_delay = max(self.max_queue_delay, now - queued)
+                    self.packets_paced += 1
+                    if prepare is not None:
+                        try:
+                            data = prepare(data)
+                        except Exception as exc:
+                            logger.warning("Pacer failed to prepare packet: %s", exc)
+                            continue
+                    packets.append(data)
+                if packets:
+                    # a failed batch is dropped, the pacer keeps running
+                    try:
+                        await self.__transport._send_rtp_batch(packets)
+                    except ConnectionError:
+                        raise
+                    except Exception as exc:
+                        logger.warning(
+                            "Pacer failed to send %d packets: %s", len(packets), exc
+                        )
+
+                if self.__queue_bytes:
+                    await asyncio.sleep(PACER_INTERVAL)
+        except asyncio.CancelledError:
+            pass
+        except ConnectionError as exc:
+            logger.debug("Pacer stopped: %s", exc)
+            self.__error = exc
+            self.__task = None
@@ -2,6 +2,7 @@ import math
 from enum import Enum
 from typing import Dict, List, Optional, Tuple
 
+from aiortc.rtp import pack_transport_cc_fci
 from aiortc.utils import uint32_add, uint32_gt
 
 BURST_DELTA_THRESHOLD_MS = 5
@@ -19,6 +20,19 @@ INTER_ARRIVAL_SHIFT = 26
 TIMESTAMP_GROUP_LENGTH_MS = 5
 TIMESTAMP_TO_MS = 1000.0 / (1 << INTER_ARRIVAL_SHIFT)
 
+# transport-wide feedback
+TRANSPORT_CC_MAX_STATUS_COUNT = 1000
+
+# send-side estimator
+SEND_SIDE_HISTORY_SIZE = 8192
+SEND_SIDE_START_BITRATE = 500000
+SEND_SIDE_MIN_BITRATE = 30000
+SEND_SIDE_MAX_BITRATE = 30000000
+LOSS_HIGH_THRESHOLD = 0.1
+LOSS_LOW_THRESHOLD = 0.02
+LOSS_DECREASE_INTERVAL_MS = 300
+LOSS_INCREASE_FACTOR = 1.05
+
 
 class BandwidthUsage(Enum):
     NORMAL = 0
@@ -577,3 +591,198 @@ class RemoteBitrateEstimator:
                 return target_bitrate, list(self.ssrcs.keys())
 
         return None
+
+
+class TransportFeedbackGenerator:
+    """
+    Transport-wide congestion control feedback generator.
+
+    Records the arrival time of each packet carrying a transport-wide
+    sequence number and reports them, along with the packets which were
+    not received, in transport-cc feedback.
+    """
+
+    def __init__(self) -> None:
+        self.__arrival_times: Dict[int, int] = {}
+        self.__feedback_count = 0
+        self.__last_sequence_number: Optional[int] = None
+        self.__next_sequence_number: Optional[int] = None
+        self.__origin_ms: Optional[int] = None
+
+    def add(self, sequence_number: int, arrival_time_ms: int) -> None:
+        if self.__last_sequence_number is None:
+            self.__next_sequence_number = sequence_number
+            self.__origin_ms = arrival_time_ms
+            unwrapped = sequence_number
+        else:
+            delta = (sequence_number - self.__last_sequence_number) & 0xFFFF
+            if delta >= 0x8000:
+                delta -= 0x10000
+            unwrapped = self.__last_sequence_number + delta
+
+        # the packet was already reported as not received
+        if unwrapped < self.__next_sequence_number:
+            return
+
+        if (
+            self.__last_sequence_number is None
+            or unwrapped > self.__last_sequence_number
+        ):
+            self.__last_sequence_number = unwrapped
+        self.__arrival_times[unwrapped] = (arrival_time_ms - self.__origin_ms) * 1000
+
+    def feedback(self) -> Optional[bytes]:
+        """
+        Return the FCI reporting the packets since the previous feedback,
+        or `None` if no packet arrived since.
+        """
+        while self.__arrival_times:
+            base = self.__next_sequence_number
+            end = min(
+                self.__last_sequence_number + 1, base + TRANSPORT_CC_MAX_STATUS_COUNT
+            )
+            arrival_times = [
+                self.__arrival_times.pop(seq, None) for seq in range(base, end)
+            ]
+            self.__next_sequence_number = end
+
+            try:
+                fci = pack_transport_cc_fci(
+                    base & 0xFFFF, self.__feedback_count, arrival_times
+                )
+            except ValueError:
+                # arrival times too far apart to be reported, skip them
+                continue
+            self.__feedback_count = (self.__feedback_count + 1) & 0xFF
+            return fci
+        return None
+
+
+class SendSideBandwidthEstimator:
+    """
+    Send-side bandwidth estimator driven by transport-cc feedback.
+
+    The delay-based estimate runs the inter-arrival filter, overuse
+    estimator and detector over the send and arrival times of the packets,
+    while the loss-based estimate backs off when more than 10% of the
+    packets are lost. The target bitrate is the lowest of the two.
+    """
+
+    def __init__(
+        self,
+        start_bitrate: int = SEND_SIDE_START_BITRATE,
+        min_bitrate: int = SEND_SIDE_MIN_BITRATE,
+        max_bitrate: int = SEND_SIDE_MAX_BITRATE,
+    ) -> None:
+        self.acknowledged_bitrate = RateCounter(1000, 8000)
+        self.inter_arrival = InterArrival(TIMESTAMP_GROUP_LENGTH_MS, 1.0)
+        self.estimator = OveruseEstimator()
+        self.detector = OveruseDetector()
+        self.rate_control = AimdRateControl()
+        self.fraction_lost = 0.0
+        self.target_bitrate = start_bitrate
+
+        self.__last_decrease_ms: Optional[int] = None
+        self.__last_update_ms: Optional[int] = None
+        self.__loss_bitrate = start_bitrate
+        self.__max_bitrate = max_bitrate
+        self.__min_bitrate = min_bitrate
+        self.__sent: Dict[int, Tuple[int, int]] = {}
+
+    def add_packet(self, sequence_number: int, send_time_ms: int, size: int) -> None:
+        """
+        Make note of a packet sent with a transport-wide sequence number.
+        """
+        self.__sent.pop(sequence_number, None)
+        self.__sent[sequence_number] = (send_time_ms, size)
+        if len(self.__sent) > SEND_SIDE_HISTORY_SIZE:
+            del self.__sent[next(iter(self.__sent))]
+
+    def on_feedback(
+        self,
+        packets: List[Tuple[int, Optional[int]]],
+        now_ms: int,
+        rtt_ms: Optional[int] = None,
+    ) -> Optional[int]:
+        """
+        Update the estimate with the arrival times reported by transport-cc
+        feedback and return the new target bitrate.
+        """
+        arrival_time_ms = None
+        lost = 0
+        received = 0
+        for sequence_number, arrival_time_us in packets:
+            sent = self.__sent.pop(sequence_number, None)
+            if sent is None:
+                continue
+            if arrival_time_us is None:
+                lost += 1
+                continue
+
+            received += 1
+            send_time_ms, size = sent
+            arrival_time_ms = arrival_time_us // 1000
+            self.acknowledged_bitrate.add(size, arrival_time_ms)
+
+            # calculate inter-arrival deltas
+            deltas = self.inter_arrival.compute_deltas(
+                send_time_ms & 0xFFFFFFFF, arrival_time_us / 1000, size
+            )
+            if deltas is not None:
+                self.estimator.update(
+                    deltas.arrival_time,
+                    deltas.timestamp,
+                    deltas.size,
+                    self.detector.state(),
+                    now_ms,
+                )
+                self.detector.detect(
+                    self.estimator.offset(),
+                    deltas.timestamp,
+                    self.estimator.num_of_deltas(),
+                    now_ms,
+                )
+
+        if not lost and not received:
+            return None
+        self.fraction_lost = lost / (lost + received)
+        if rtt_ms is not None:
+            self.rate_control.rtt = rtt_ms
+
+        # delay-based estimate
+        if not self.rate_control.current_bitrate_initialized:
+            self.rate_control.set_estimate(self.target_bitrate, now_ms)
+        throughput = None
+        if arrival_time_ms is not None:
+            throughput = self.acknowledged_bitrate.rate(arrival_time_ms)
+        delay_bitrate = self.rate_control.update(
+            self.detector.state(), throughput, now_ms
+        )
+
+        # loss-based estimate
+        if self.fraction_lost > LOSS_HIGH_THRESHOLD:
+            if (
+                self.__last_decrease_ms is None
+                or now_ms - self.__last_decrease_ms
+                >= LOSS_DECREASE_INTERVAL_MS + self.rate_control.rtt
+            ):
+                self.__loss_bitrate = int(
+                    self.target_bitrate * (1 - 0.5 * self.fraction_lost)
+                )
+                self.__last_decrease_ms = now_ms
+        elif (
+            self.fraction_lost < LOSS_LOW_THRESHOLD
+            and self.__last_update_ms is not None
+        ):
+            elapsed_ms = min(now_ms - self.__last_update_ms, 1000)
+            self.__loss_bitrate = int(
+                self.__loss_bitrate * pow(LOSS_INCREASE_FACTOR, elapsed_ms / 1000)
+            )
+        self.__loss_bitrate = min(self.__loss_bitrate, self.__max_bitrate)
+        self.__last_update_ms = now_ms
+
+        self.target_bitrate = max(
+            self.__min_bitrate,
+            min(delay_bitrate, self.__loss_bitrate, self.__max_bitrate),
+        )
+        return self.target_bitrate
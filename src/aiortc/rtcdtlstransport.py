@@ -19,9 +19,16 @@ from pyee import AsyncIOEventEmitter
 from pylibsrtp import Policy, Session
 
 from . import clock, rtp
+from .pacer import Pacer
+from .rate import (
+    SEND_SIDE_MIN_BITRATE,
+    SendSideBandwidthEstimator,
+    TransportFeedbackGenerator,
+)
 from .rtcicetransport import RTCIceTransport
 from .rtcrtpparameters import RTCRtpReceiveParameters, RTCRtpSendParameters
 from .rtp import (
+    RTCP_RTPFB_TRANSPORT_CC,
     AnyRtcpPacket,
     RtcpByePacket,
     RtcpPacket,
@@ -31,16 +38,21 @@ from .rtp import (
     RtcpSrPacket,
     RtpPacket,
     is_rtcp,
+    unpack_transport_cc_fci,
 )
 from .stats import RTCStatsReport, RTCTransportStats
+from .utils import uint16_add
 
 binding = Binding()
 binding.init_static_locks()
 ffi = binding.ffi
 lib = binding.lib
 
-SRTP_KEY_LEN = 16
-SRTP_SALT_LEN = 14
+# interval in seconds between transport-cc feedback packets
+TRANSPORT_CC_FEEDBACK_INTERVAL = 0.05
+
+# maximum number of queued datagrams handled in one go
+RECV_BATCH_SIZE = 64
 
 CERTIFICATE_T = TypeVar("CERTIFICATE_T", bound="RTCCertificate")
 
@@ -120,15 +132,76 @@ def get_error_queue() -> List[Tuple[str, str, str]]:
     return errors
 
 
-def get_srtp_key_salt(src, idx: int) -> bytes:
-    key_start = idx * SRTP_KEY_LEN
-    salt_start = 2 * SRTP_KEY_LEN + idx * SRTP_SALT_LEN
+@dataclass
+class SRTPProtectionProfile:
+    """
+    An SRTP protection profile which can be negotiated by DTLS-SRTP.
+    """
+
+    name: str
+    "The name of the profile, as used in the DTLS-SRTP extension."
+    libsrtp_profile: int
+    "The matching libsrtp profile."
+    key_length: int
+    "The length of the master key in bytes."
+    salt_length: int
+    "The length of the master salt in bytes."
+
+    @property
+    def openssl_profile(self) -> bytes:
+        return ("SRTP_" + self.name).encode("ascii")
+
+
+SRTP_AEAD_AES_128_GCM = SRTPProtectionProfile(
+    name="AEAD_AES_128_GCM",
+    libsrtp_profile=Policy.SRTP_PROFILE_AEAD_AES_128_GCM,
+    key_length=16,
+    salt_length=12,
+)
+SRTP_AEAD_AES_256_GCM = SRTPProtectionProfile(
+    name="AEAD_AES_256_GCM",
+    libsrtp_profile=Policy.SRTP_PROFILE_AEAD_AES_256_GCM,
+    key_length=32,
+    salt_length=12,
+)
+SRTP_AES128_CM_SHA1_80 = SRTPProtectionProfile(
+    name="AES128_CM_SHA1_80",
+    libsrtp_profile=Policy.SRTP_PROFILE_AES128_CM_SHA1_80,
+    key_length=16,
+    salt_length=14,
+)
+
+# the SRTP protection profiles we offer, in order of preference: AES-GCM
+# encrypts and authenticates in a single pass, so it is preferred when the
+# remote party supports it
+SRTP_PROFILES = [SRTP_AEAD_AES_128_GCM, SRTP_AEAD_AES_256_GCM, SRTP_AES128_CM_SHA1_80]
+
+
+def get_srtp_key_salt(
+    src, idx: int, profile: SRTPProtectionProfile = SRTP_AES128_CM_SHA1_80
+) -> bytes:
+    """
+    Return the master key and salt of one side from the keying material
+    exported by DTLS-SRTP for the protection `profile`.
+    """
+    key_start = idx * profile.key_length
+    salt_start = 2 * profile.key_length + idx * profile.salt_length
     return (
-        src[key_start : key_start + SRTP_KEY_LEN]
-        + src[salt_start : salt_start + SRTP_SALT_LEN]
+        src[key_start : key_start + profile.key_length]
+        + src[salt_start : salt_start + profile.salt_length]
     )
 
 
+def get_srtp_profile(name: bytes) -> SRTPProtectionProfile:
+    """
+    Return the SRTP protection profile selected by OpenSSL.
+    """
+    for profile in SRTP_PROFILES:
+        if profile.openssl_profile == name:
+            return profile
+    raise DtlsError(f"DTLS-SRTP negotiated an unknown profile {name!r}")
+
+
 @ffi.callback("int(int, X509_STORE_CTX *)")
 def verify_callback(x, y):
     return 1
@@ -212,7 +285,10 @@ class RTCCertificate:
         _openssl_assert(lib.SSL_CTX_use_PrivateKey(ctx, self._key._evp_pkey) == 1)  # type: ignore
         _openssl_assert(lib.SSL_CTX_set_cipher_list(ctx, b"HIGH:!CAMELLIA:!aNULL") == 1)
         _openssl_assert(
-            lib.SSL_CTX_set_tlsext_use_srtp(ctx, b"SRTP_AES128_CM_SHA1_80") == 0
+            lib.SSL_CTX_set_tlsext_use_srtp(
+                ctx, b":".join(profile.openssl_profile for profile in SRTP_PROFILES)
+            )
+            == 0
         )
         _openssl_assert(lib.SSL_CTX_set_read_ahead(ctx, 1) == 0)
 
@@ -351,11 +427,15 @@ class RTCDtlsTransport(AsyncIOEventEmitter):
         certificate = certificates[0]
 
         super().__init__()
+        self._bandwidth_estimator = SendSideBandwidthEstimator()
         self.encrypted = False
         self._data_receiver = None
         self._role = "auto"
         self._rtp_header_extensions_map = rtp.HeaderExtensionsMap()
+        self._pacer = Pacer(self)
         self._rtp_router = RtpRouter()
+        # round-trip time in seconds estimated by the senders, if any
+        self._rtt: Optional[float] = None
         self._state = State.NEW
         self._stats_id = "transport_" + str(id(self))
         self._task: Optional[asyncio.Future[None]] = None
@@ -367,7 +447,14 @@ class RTCDtlsTransport(AsyncIOEventEmitter):
         self.__tx_bytes = 0
         self.__tx_packets = 0
 
+        # transport-wide congestion control
+        self.__transport_feedback = TransportFeedbackGenerator()
+        self.__transport_feedback_ssrc = 0
+        self.__transport_feedback_task: Optional[asyncio.Future[None]] = None
+        self.__transport_sequence_number = 0
+
         # SRTP
+        self._srtp_profile: Optional[SRTPProtectionProfile] = None
         self._rx_srtp: Session = None
         self._tx_srtp: Session = None
 
@@ -476,8 +563,14 @@ class RTCDtlsTransport(AsyncIOEventEmitter):
             self._set_state(State.FAILED)
             return
 
-        # generate keying material
-        buf = ffi.new("unsigned char[]", 2 * (SRTP_KEY_LEN + SRTP_SALT_LEN))
+        # generate keying material for the negotiated SRTP profile
+        selected = lib.SSL_get_selected_srtp_profile(self.ssl)
+        _openssl_assert(selected != ffi.NULL)
+        profile = get_srtp_profile(ffi.string(selected.name))
+        self._srtp_profile = profile
+        buf = ffi.new(
+            "unsigned char[]", 2 * (profile.key_length + profile.salt_length)
+        )
         extractor = b"EXTRACTOR-dtls_srtp"
         _openssl_assert(
             lib.SSL_export_keying_material(
@@ -488,24 +581,32 @@ class RTCDtlsTransport(AsyncIOEventEmitter):
 
         view = ffi.buffer(buf)
         if self._role == "server":
-            srtp_tx_key = get_srtp_key_salt(view, 1)
-            srtp_rx_key = get_srtp_key_salt(view, 0)
+            srtp_tx_key = get_srtp_key_salt(view, 1, profile)
+            srtp_rx_key = get_srtp_key_salt(view, 0, profile)
         else:
-            srtp_tx_key = get_srtp_key_salt(view, 0)
-            srtp_rx_key = get_srtp_key_salt(view, 1)
+            srtp_tx_key = get_srtp_key_salt(view, 0, profile)
+            srtp_rx_key = get_srtp_key_salt(view, 1, profile)
 
-        rx_policy = Policy(key=srtp_rx_key, ssrc_type=Policy.SSRC_ANY_INBOUND)
+        rx_policy = Policy(
+            key=srtp_rx_key,
+            ssrc_type=Policy.SSRC_ANY_INBOUND,
+            srtp_profile=profile.libsrtp_profile,
+        )
         rx_policy.allow_repeat_tx = True
         rx_policy.window_size = 1024
         self._rx_srtp = Session(rx_policy)
 
-        tx_policy = Policy(key=srtp_tx_key, ssrc_type=Policy.SSRC_ANY_OUTBOUND)
+        tx_policy = Policy(
+            key=srtp_tx_key,
+            ssrc_type=Policy.SSRC_ANY_OUTBOUND,
+            srtp_profile=profile.libsrtp_profile,
+        )
         tx_policy.allow_repeat_tx = True
         tx_policy.window_size = 1024
         self._tx_srtp = Session(tx_policy)
 
         # start data pump
-        self.__log_debug("- DTLS handshake complete")
+        self.__log_debug("- DTLS handshake complete (SRTP profile %s)", profile.name)
         self._set_state(State.CONNECTED)
         self._task = asyncio.ensure_future(self.__run())
 
@@ -516,6 +617,10 @@ class RTCDtlsTransport(AsyncIOEventEmitter):
         if self._task is not None:
             self._task.cancel()
             self._task = None
+        if self.__transport_feedback_task is not None:
+            self.__transport_feedback_task.cancel()
+            self.__transport_feedback_task = None
+        self._pacer.stop()
 
         if self._state in [State.CONNECTING, State.CONNECTED]:
             lib.SSL_shutdown(self.ssl)
@@ -554,6 +659,9 @@ class RTCDtlsTransport(AsyncIOEventEmitter):
                 bytesReceived=self.__rx_bytes,
                 iceRole=self.transport.role,
                 dtlsState=self.state,
+                srtpCipher=(
+                    self._srtp_profile.name if self._srtp_profile is not None else None
+                ),
             )
         )
         return report
@@ -566,21 +674,54 @@ class RTCDtlsTransport(AsyncIOEventEmitter):
             return
 
         for packet in packets:
+            # transport-cc feedback is about the whole transport
+            if (
+                isinstance(packet, RtcpRtpfbPacket)
+                and packet.fmt == RTCP_RTPFB_TRANSPORT_CC
+            ):
+                self.__handle_transport_feedback(packet)
+                continue
+
             # route RTCP packet
             for recipient in self._rtp_router.route_rtcp(packet):
                 await recipient._handle_rtcp_packet(packet)
 
     async def _handle_rtp_data(self, data: bytes, arrival_time_ms: int) -> None:
-        try:
-            packet = RtpPacket.parse(data, self._rtp_header_extensions_map)
-        except ValueError as exc:
-            self.__log_debug("x RTP parsing failed: %s", exc)
-            return
+        await self._handle_rtp_batch([(data, arrival_time_ms)])
 
-        # route RTP packet
-        receiver = self._rtp_router.route_rtp(packet)
-        if receiver is not None:
-            await receiver._handle_rtp_packet(packet, arrival_time_ms=arrival_time_ms)
+    async def _handle_rtp_batch(self, datagrams: List[Tuple[bytes, int]]) -> None:
+        """
+        Parse and route decrypted RTP datagrams, given with their arrival
+        times, then hand each receiver its packets as a single batch.
+        """
+        batches: Dict[Any, List[Tuple[RtpPacket, int]]] = {}
+        for data, arrival_time_ms in datagrams:
+            try:
+                packet = RtpPacket.parse(data, self._rtp_header_extensions_map)
+            except ValueError as exc:
+                self.__log_debug("x RTP parsing failed: %s", exc)
+                continue
+
+            # make note of the arrival time for transport-cc feedback, reading
+            # the sequence number from the raw bytes to keep decoding lazy
+            transport_sequence_number = (
+                self._rtp_header_extensions_map.get_transport_sequence_number(data)
+            )
+            if transport_sequence_number is not None:
+                self.__transport_feedback.add(transport_sequence_number, arrival_time_ms)
+                self.__transport_feedback_ssrc = packet.ssrc
+                if self.__transport_feedback_task is None:
+                    self.__transport_feedback_task = asyncio.ensure_future(
+                        self.__run_transport_feedback()
+                    )
+
+            # route RTP packet
+            receiver = self._rtp_router.route_rtp(packet)
+            if receiver is not None:
+                batches.setdefault(receiver, []).append((packet, arrival_time_ms))
+
+        for receiver, packets in batches.items():
+            await receiver._handle_rtp_packets(packets)
 
     async def _recv_next(self) -> None:
         # get timeout
@@ -594,42 +735,55 @@ class RTCDtlsTransport(AsyncIOEventEmitter):
         # receive next datagram
         if timeout is not None:
             try:
-                data = await asyncio.wait_for(self.transport._recv(), timeout=timeout)
+                received = await asyncio.wait_for(
+                    self.transport._recv_timed(), timeout=timeout
+                )
             except asyncio.TimeoutError:
                 self.__log_debug("x DTLS handling timeout")
                 lib.DTLSv1_handle_timeout(self.ssl)
                 await self._write_ssl()
                 return
         else:
-            data = await self.transport._recv()
-
-        self.__rx_bytes += len(data)
-        self.__rx_packets += 1
-
-        first_byte = data[0]
-        if first_byte > 19 and first_byte < 64:
-            # DTLS
-            lib.BIO_write(self.read_bio, data, len(data))
-            result = lib.SSL_read(self.ssl, self.read_cdata, len(self.read_cdata))
-            await self._write_ssl()
-            if result == 0:
-                self.__log_debug("- DTLS shutdown by remote party")
-                raise ConnectionError
-            elif result > 0 and self._data_receiver:
-                data = ffi.buffer(self.read_cdata)[0:result]
-                await self._data_receiver._handle_data(data)
-        elif first_byte > 127 and first_byte < 192 and self._rx_srtp:
-            # SRTP / SRTCP
-            arrival_time_ms = clock.current_ms()
-            try:
-                if is_rtcp(data):
-                    data = self._rx_srtp.unprotect_rtcp(data)
-                    await self._handle_rtcp_data(data)
-                else:
-                    data = self._rx_srtp.unprotect(data)
-                    await self._handle_rtp_data(data, arrival_time_ms=arrival_time_ms)
-            except pylibsrtp.Error as exc:
-                self.__log_debug("x SRTP unprotect failed: %s", exc)
+            received = await self.transport._recv_timed()
+
+        # once SRTP is running, handle the datagrams which are already queued
+        # too, each with the time it arrived
+        datagrams = [received]
+        if self._rx_srtp is not None:
+            datagrams += self.transport._recv_pending(RECV_BATCH_SIZE - 1)
+
+        rtp_datagrams: List[Tuple[bytes, int]] = []
+        for data, arrival_time_ms in datagrams:
+            self.__rx_bytes += len(data)
+            self.__rx_packets += 1
+
+            first_byte = data[0]
+            if first_byte > 19 and first_byte < 64:
+                # DTLS
+                lib.BIO_write(self.read_bio, data, len(data))
+                result = lib.SSL_read(self.ssl, self.read_cdata, len(self.read_cdata))
+                await self._write_ssl()
+                if result == 0:
+                    self.__log_debug("- DTLS shutdown by remote party")
+                    raise ConnectionError
+                elif result > 0 and self._data_receiver:
+                    data = ffi.buffer(self.read_cdata)[0:result]
+                    await self._data_receiver._handle_data(data)
+            elif first_byte > 127 and first_byte < 192 and self._rx_srtp:
+                # SRTP / SRTCP
+                try:
+                    if is_rtcp(data):
+                        data = self._rx_srtp.unprotect_rtcp(data)
+                        await self._handle_rtcp_data(data)
+                    else:
+                        rtp_datagrams.append(
+                            (self._rx_srtp.unprotect(data), arrival_time_ms)
+                        )
+                except pylibsrtp.Error as exc:
+                    self.__log_debug("x SRTP unprotect failed: %s", exc)
+
+        if rtp_datagrams:
+            await self._handle_rtp_batch(rtp_datagrams)
 
     def _register_data_receiver(self, receiver) -> None:
         assert self._data_receiver is None
@@ -668,11 +822,30 @@ class RTCDtlsTransport(AsyncIOEventEmitter):
         if is_rtcp(data):
             data = self._tx_srtp.protect_rtcp(data)
         else:
-            data = self._tx_srtp.protect(data)
+            data = self.__protect_rtp(data)
         await self.transport._send(data)
         self.__tx_bytes += len(data)
         self.__tx_packets += 1
 
+    async def _send_rtp_batch(self, packets: List[bytes]) -> None:
+        """
+        Protect RTP packets, for instance those of an encoded frame, then
+        send them back to back.
+        """
+        if self._state != State.CONNECTED:
+            raise ConnectionError("Cannot send encrypted RTP, not connected")
+
+        # protect the whole batch before sending any of it
+        datagrams = [self.__protect_rtp(data) for data in packets]
+
+        # aioice has no vectored send and Python has no sendmmsg, but sending
+        # a datagram on the nominated pair does not suspend, so the batch
+        # still leaves in a single pass
+        for data in datagrams:
+            await self.transport._send(data)
+        self.__tx_bytes += sum(len(data) for data in datagrams)
+        self.__tx_packets += len(datagrams)
+
     def _set_role(self, role: str) -> None:
         self._role = role
 
@@ -705,6 +878,86 @@ class RTCDtlsTransport(AsyncIOEventEmitter):
             self.__tx_bytes += result
             self.__tx_packets += 1
 
+    def __allocate_bitrate(self, bitrate: int) -> None:
+        """
+        Share the estimated bitrate between the senders on the transport.
+
+        Senders whose encoder has no target bitrate, such as audio and
+        keypoints, keep the bitrate they currently send at. The others share
+        the rest in proportion to their current target bitrate.
+        """
+        now_ms = clock.current_ms()
+        adaptive = []
+        for sender in set(self._rtp_router.senders.values()):
+            target_bitrate = sender._get_encoder_bitrate()
+            if target_bitrate:
+                adaptive.append((sender, target_bitrate))
+            else:
+                bitrate -= sender._get_sent_bitrate(now_ms)
+
+        available = max(bitrate, SEND_SIDE_MIN_BITRATE)
+        total = sum(target_bitrate for sender, target_bitrate in adaptive)
+        for sender, target_bitrate in adaptive:
+            sender._set_encoder_bitrate(available * target_bitrate // total)
+
+    def __handle_transport_feedback(self, packet: RtcpRtpfbPacket) -> None:
+        try:
+            packets = unpack_transport_cc_fci(packet.fci)[2]
+        except ValueError as exc:
+            self.__log_debug("x RTCP transport-cc parsing failed: %s", exc)
+            return
+
+        rtt_ms = round(self._rtt * 1000) if self._rtt is not None else None
+        bitrate = self._bandwidth_estimator.on_feedback(
+            packets, clock.current_ms(), rtt_ms
+        )
+        if bitrate is not None:
+            self.__log_debug(
+                "- send-side estimated bitrate %d bps, fraction lost %.3f",
+                bitrate,
+                self._bandwidth_estimator.fraction_lost,
+            )
+            self.__allocate_bitrate(bitrate)
+
+    async def __run_transport_feedback(self) -> None:
+        try:
+            while True:
+                await asyncio.sleep(TRANSPORT_CC_FEEDBACK_INTERVAL)
+                fci = self.__transport_feedback.feedback()
+                while fci is not None:
+                    packet = RtcpRtpfbPacket(
+                        fmt=RTCP_RTPFB_TRANSPORT_CC,
+                        ssrc=next(iter(self._rtp_router.senders), 0),
+                        media_ssrc=self.__transport_feedback_ssrc,
+                        fci=fci,
+                    )
+                    await self._send_rtp(bytes(packet))
+                    fci = self.__transport_feedback.feedback()
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+
+    def __protect_rtp(self, data: bytes) -> bytes:
+        # the transport-wide sequence number is set in place, then the packet
+        # is copied once, as pylibsrtp only accepts bytes
+        if not isinstance(data, bytearray):
+            data = bytearray(data)
+        self.__stamp_transport_sequence_number(data)
+        return self._tx_srtp.protect(bytes(data))
+
+    def __stamp_transport_sequence_number(self, data: bytearray) -> None:
+        # sequence numbers are assigned in the order packets leave, so that
+        # retransmissions and paced packets are reported as sent
+        if not self._rtp_header_extensions_map.set_transport_sequence_number(
+            data, self.__transport_sequence_number
+        ):
+            return
+        self._bandwidth_estimator.add_packet(
+            self.__transport_sequence_number, clock.current_ms(), len(data)
+        )
+        self.__transport_sequence_number = uint16_add(
+            self.__transport_sequence_number, 1
+        )
+
     def __log_debug(self, msg: str, *args) -> None:
         logger.debug(f"RTCDtlsTransport(%s) {msg}", self._role, *args)
 
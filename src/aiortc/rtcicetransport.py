@@ -2,11 +2,12 @@ import asyncio
 import logging
 import re
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from aioice import Candidate, Connection, ConnectionClosed
 from pyee import AsyncIOEventEmitter
 
+from . import clock
 from .exceptions import InvalidStateError
 from .rtcconfiguration import RTCIceServer
 
@@ -246,8 +247,12 @@ class RTCIceTransport(AsyncIOEventEmitter):
         self._connection = gatherer._connection
         self._role_set = False
 
-        # expose recv / send methods
-        self._recv = self._connection.recv
+        # datagrams are queued here along with their arrival time, instead of
+        # in aioice, so that those handled together keep their own timing
+        self.__received: asyncio.Queue = asyncio.Queue()
+        self._connection.data_received = self.__data_received
+
+        # expose send method
         self._send = self._connection.send
 
     @property
@@ -348,6 +353,46 @@ class RTCIceTransport(AsyncIOEventEmitter):
                     self.__setState("failed")
                 return
 
+    async def _recv(self) -> bytes:
+        """
+        Receive the next datagram.
+        """
+        data, arrival_time_ms = await self._recv_timed()
+        return data
+
+    async def _recv_timed(self) -> Tuple[bytes, int]:
+        """
+        Receive the next datagram and the time at which it arrived, in
+        milliseconds.
+        """
+        if self.state in ["new", "checking", "failed", "closed"]:
+            raise ConnectionError("Cannot receive data, not connected")
+
+        data, arrival_time_ms = await self.__received.get()
+        if data is None:
+            # let the next receive report it too
+            self.__received.put_nowait((data, arrival_time_ms))
+            raise ConnectionError("Connection lost while receiving data")
+        return data, arrival_time_ms
+
+    def _recv_pending(self, limit: int) -> List[Tuple[bytes, int]]:
+        """
+        Return up to `limit` datagrams which have already been received,
+        along with their arrival times, without waiting for more.
+        """
+        datagrams: List[Tuple[bytes, int]] = []
+        while len(datagrams) < limit and not self.__received.empty():
+            data, arrival_time_ms = self.__received.get_nowait()
+            if data is None:
+                # the connection was lost, let the next receive report it
+                self.__received.put_nowait((data, arrival_time_ms))
+                break
+            datagrams.append((data, arrival_time_ms))
+        return datagrams
+
+    def __data_received(self, data: Optional[bytes], component: int) -> None:
+        self.__received.put_nowait((data, clock.current_ms()))
+
     def __log_debug(self, msg: str, *args) -> None:
         logger.debug(f"RTCIceTransport(%s) {msg}", self.role, *args)
 
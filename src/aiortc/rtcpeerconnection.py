@@ -109,6 +109,11 @@ def find_common_codecs(
                             parameters_compatible = False
                     if not parameters_compatible:
                         continue
+                elif codec.mimeType.lower() == "keypoints/binned":
+                    if c.parameters.get("jacobian-bits") != codec.parameters.get(
+                        "jacobian-bits"
+                    ):
+                        continue
 
                 codec = copy.deepcopy(codec)
                 if c.payloadType in rtp.DYNAMIC_PAYLOAD_TYPES:
@@ -1,17 +1,19 @@
 import asyncio
 import datetime
 import logging
+import os
 import queue
 import random
 import threading
 import time
+from collections import deque
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Set
+from typing import Deque, Dict, List, Optional, Set, Tuple
 
 from av.frame import Frame
 
 from . import clock
-from .codecs import depayload, get_capabilities, get_decoder, is_rtx
+from .codecs import depayload, get_capabilities, get_decoder, is_red, is_rtx
 from .exceptions import InvalidStateError
 from .jitterbuffer import JitterBuffer
 from .mediastreams import MediaStreamError, MediaStreamTrack
@@ -36,6 +38,7 @@ from .rtp import (
     RtpPacket,
     clamp_packets_lost,
     pack_remb_fci,
+    unpack_red_payload,
     unwrap_rtx,
 )
 from .stats import (
@@ -43,67 +46,314 @@ from .stats import (
     RTCRemoteOutboundRtpStreamStats,
     RTCStatsReport,
 )
-from .utils import uint16_add, uint16_gt
+from .utils import DropOldestQueue, uint16_add, uint16_gt, uint32_add
 
 logger = logging.getLogger(__name__)
 
+# abandon late video and keypoints frames based on the estimated jitter
+# instead of waiting for the packet window to fill up
+adaptive_jitter_buffer = False
 
-def decoder_worker(loop, input_q, output_q):
-    codec_name = None
-    decoder = None
+# maximum number of encoded video and keypoints frames waiting for the
+# decoder, and of decoded ones waiting to be read from the track, before the
+# oldest are dropped; audio frames are never dropped at either stage
+DECODER_QUEUE_SIZE = 8
+TRACK_QUEUE_SIZE = 8
 
-    while True:
-        task = input_q.get()
+# decode the streams of all receivers on a process-wide pool of threads
+# instead of a dedicated thread per receiver
+shared_decoder_pool = False
+
+# number of frames of a stream decoded by a pool thread before it moves on
+DECODER_BATCH_SIZE = 4
+
+# NACK scheduling, missing packets are requested again every round-trip
+# time until they arrive or are given up on
+NACK_DEFAULT_RTT_MS = 100
+NACK_INTERVAL = 0.02
+NACK_MAX_AGE_MS = 1000
+NACK_MAX_MISSING = 500
+NACK_MAX_RETRIES = 10
+
+# number of packets recovered from RED blocks which are remembered, so that a
+# recovery is withdrawn if the original packet was only reordered
+RED_RECOVERED_HISTORY = 64
+
+
+class DecoderContext:
+    """
+    The decoding state of a single stream.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, track: "RemoteStreamTrack") -> None:
+        self.codec_name: Optional[str] = None
+        self.decoder = None
+        self.loop = loop
+        self.track = track
+
+    def handle(self, task) -> bool:
+        """
+        Decode an encoded frame and pass the result to the track.
+
+        Returns `False` once the end of the stream is reached.
+        """
         if task is None:
             # inform the track that is has ended
-            asyncio.run_coroutine_threadsafe(output_q.put(None), loop)
-            break
+            self.track._put_frames(self.loop, [None])
+            self.decoder = None
+            return False
         codec, encoded_frame = task
 
-        if codec.name != codec_name:
-            decoder = get_decoder(codec)
-            codec_name = codec.name
-            logger.debug(f"RTCRtpReceiver(%s) retrieved the decoder", codec_name)
+        if codec.name != self.codec_name:
+            self.decoder = get_decoder(codec)
+            self.codec_name = codec.name
+            logger.debug(f"RTCRtpReceiver(%s) retrieved the decoder", self.codec_name)
+
+        decoded_frames = self.decoder.decode(encoded_frame)
+        logger.debug(f"RTCRtpReceiver(%s) decoding timestamp %s, got %d frames", self.codec_name, encoded_frame.timestamp, len(decoded_frames))
+
+        # pass the decoded frames to the track along with their frame index
+        if decoded_frames:
+            self.track._put_frames(
+                self.loop, [(frame, encoded_frame.frame_index) for frame in decoded_frames]
+            )
+        return True
+
 
+def decoder_worker(loop, input_q, track):
+    context = DecoderContext(loop, track)
+    while context.handle(input_q.get()):
+        pass
 
-        decoded_frames = decoder.decode(encoded_frame)
-        logger.debug(f"RTCRtpReceiver(%s) decoding timestamp %s, got %d frames", codec_name, encoded_frame.timestamp, len(decoded_frames))
 
-        for frame in decoded_frames:
-            # pass the decoded frame to the track
-            asyncio.run_coroutine_threadsafe(output_q.put(frame), loop)
+class DecoderStream:
+    """
+    A stream decoded by a :class:`DecoderScheduler`.
+
+    The stream is handled by at most one worker at a time, so its frames
+    are decoded in order.
+    """
+
+    def __init__(
+        self, scheduler: "DecoderScheduler", input_q: DropOldestQueue, context: DecoderContext
+    ) -> None:
+        self.__context = context
+        self.__done = threading.Event()
+        self.__input_q = input_q
+        self.__lock = threading.Lock()
+        self.__scheduled = False
+        self.__scheduler = scheduler
+
+    def schedule(self) -> None:
+        """
+        Make sure a worker handles the frames queued for this stream.
+        """
+        with self.__lock:
+            if self.__scheduled or self.__done.is_set():
+                return
+            self.__scheduled = True
+        self.__scheduler._ready.put(self)
+
+    def wait(self) -> None:
+        """
+        Wait for the end of the stream to be handled.
+        """
+        self.__done.wait()
+
+    def _run(self) -> None:
+        for i in range(DECODER_BATCH_SIZE):
+            task = self.__input_q.get_nowait()
+            if task is DropOldestQueue.EMPTY:
+                break
+            if not self.__context.handle(task):
+                self.__done.set()
+                return
+
+        with self.__lock:
+            if not self.__input_q.depth:
+                self.__scheduled = False
+                return
+
+        # give other streams a turn before handling the rest
+        self.__scheduler._ready.put(self)
 
 
-    if decoder is not None:
-        del decoder
+class DecoderScheduler:
+    """
+    A fixed pool of decoder threads shared by the receivers of a process.
+
+    :param workers: The number of threads, defaults to the number of cores.
+    """
+
+    def __init__(self, workers: Optional[int] = None) -> None:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self._ready: queue.Queue = queue.Queue()
+        self.__threads = [
+            threading.Thread(
+                target=self.__run, name="decoder-%d" % i, daemon=True
+            )
+            for i in range(workers)
+        ]
+        for thread in self.__threads:
+            thread.start()
+
+    @property
+    def workers(self) -> int:
+        return len(self.__threads)
+
+    def add_stream(
+        self, loop: asyncio.AbstractEventLoop, input_q: DropOldestQueue, track: "RemoteStreamTrack"
+    ) -> DecoderStream:
+        """
+        Start decoding the frames queued to `input_q` into `track`.
+        """
+        return DecoderStream(self, input_q, DecoderContext(loop, track))
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker threads once the streams scheduled so far are handled.
+        """
+        for thread in self.__threads:
+            self._ready.put(None)
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
+    def __run(self) -> None:
+        while True:
+            stream = self._ready.get()
+            if stream is None:
+                break
+            try:
+                stream._run()
+            except Exception as exc:  # pragma: no cover
+                logger.warning("DecoderScheduler failed to decode: %s", exc)
+
+
+_decoder_scheduler: Optional[DecoderScheduler] = None
+_decoder_scheduler_lock = threading.Lock()
+
+
+def get_decoder_scheduler() -> DecoderScheduler:
+    """
+    Return the decoder scheduler shared by the receivers of this process.
+    """
+    global _decoder_scheduler
+    with _decoder_scheduler_lock:
+        if _decoder_scheduler is None:
+            _decoder_scheduler = DecoderScheduler()
+        return _decoder_scheduler
+
+
+class NackRequest:
+    __slots__ = ("first_missed", "last_request", "retries")
+
+    def __init__(self, first_missed: float) -> None:
+        self.first_missed = first_missed
+        self.last_request: Optional[float] = None
+        self.retries = 0
 
 
 class NackGenerator:
+    """
+    Keeps track of missing packets and decides when to request them.
+
+    A missing packet is requested as soon as the gap is detected, then again
+    whenever a round-trip time has elapsed without it arriving. It is given
+    up on after too many retries, once it is too old to be useful, or once
+    the jitter buffer has moved past it.
+    """
+
     def __init__(self) -> None:
         self.max_seq: Optional[int] = None
         self.missing: Set[int] = set()
+        self.packets_abandoned = 0
+        self.__requests: Dict[int, NackRequest] = {}
+
+    def add(
+        self, packet: RtpPacket, now_ms: Optional[float] = None
+    ) -> Tuple[bool, bool]:
+        """
+        Make note of a received packet.
 
-    def add(self, packet: RtpPacket) -> bool:
+        Return whether packets were found to be missing, and whether some had
+        to be given up on straight away so a keyframe should be requested.
+        """
+        if now_ms is None:
+            now_ms = clock.current_ms()
         missed = False
+        keyframe_needed = False
 
         if self.max_seq is None:
             self.max_seq = packet.sequence_number
-            return missed
+            return missed, keyframe_needed
 
         # mark missing packets
         if uint16_gt(packet.sequence_number, self.max_seq):
-            seq = uint16_add(self.max_seq, 1)
-            while uint16_gt(packet.sequence_number, seq):
-                self.missing.add(seq)
-                missed = True
-                seq = uint16_add(seq, 1)
+            gap = uint16_add(packet.sequence_number, -self.max_seq) - 1
+            if gap > NACK_MAX_MISSING:
+                # too many packets are missing to recover them, request a
+                # keyframe instead
+                self.packets_abandoned += len(self.missing) + gap
+                self.missing.clear()
+                self.__requests.clear()
+                keyframe_needed = True
+            else:
+                seq = uint16_add(self.max_seq, 1)
+                while uint16_gt(packet.sequence_number, seq):
+                    self.missing.add(seq)
+                    self.__requests[seq] = NackRequest(now_ms)
+                    missed = True
+                    seq = uint16_add(seq, 1)
             self.max_seq = packet.sequence_number
             if missed:
                 logger.debug(f"RTCRtpReceiver(%s) missed packets", self.missing)
+
+            # bound the missing set to the most recent packets
+            excess = len(self.missing) - NACK_MAX_MISSING
+            if excess > 0:
+                for seq in sorted(self.missing, key=self.__age, reverse=True)[:excess]:
+                    self.__abandon(seq)
+                keyframe_needed = True
         else:
             self.missing.discard(packet.sequence_number)
+            self.__requests.pop(packet.sequence_number, None)
+
+        return missed, keyframe_needed
 
-        return missed
+    def get_nack_batch(
+        self, now_ms: float, rtt_ms: float, horizon: Optional[int] = None
+    ) -> List[int]:
+        """
+        Return the missing packets which are due to be requested.
+
+        :param now_ms: The current time in milliseconds.
+        :param rtt_ms: The round-trip time in milliseconds.
+        :param horizon: The oldest sequence number the jitter buffer still needs.
+        """
+        lost = []
+        for seq in sorted(self.missing, key=self.__age, reverse=True):
+            request = self.__requests[seq]
+            if (
+                request.retries >= NACK_MAX_RETRIES
+                or now_ms - request.first_missed > NACK_MAX_AGE_MS
+                or (horizon is not None and uint16_gt(horizon, seq))
+            ):
+                self.__abandon(seq)
+            elif request.last_request is None or now_ms - request.last_request >= rtt_ms:
+                request.last_request = now_ms
+                request.retries += 1
+                lost.append(seq)
+        return lost
+
+    def __abandon(self, seq: int) -> None:
+        self.missing.discard(seq)
+        self.__requests.pop(seq, None)
+        self.packets_abandoned += 1
+
+    def __age(self, seq: int) -> int:
+        return uint16_add(self.max_seq, -seq)
 
 
 class StreamStatistics:
@@ -180,7 +430,14 @@ class RemoteStreamTrack(MediaStreamTrack):
         self.kind = kind
         if id is not None:
             self._id = id
-        self._queue: asyncio.Queue = asyncio.Queue()
+        self._queue: Deque = deque()
+        self._queue_size: Optional[int] = None if kind == "audio" else TRACK_QUEUE_SIZE
+        self.__event = asyncio.Event()
+        self.__lock = threading.Lock()
+        self.__wakeup_pending = False
+        self.__last_frame: Optional[Frame] = None
+        self.__last_frame_index: Optional[int] = None
+        self.frames_dropped = 0
 
     async def recv(self) -> Frame:
         """
@@ -189,14 +446,60 @@ class RemoteStreamTrack(MediaStreamTrack):
         if self.readyState != "live":
             raise MediaStreamError
 
-        frame = await self._queue.get()
-        if frame is None:
+        while True:
+            with self.__lock:
+                if self._queue:
+                    item = self._queue.popleft()
+                    break
+                self.__event.clear()
+            await self.__event.wait()
+
+        if item is None:
             self.stop()
             logger.debug(f"RTCRtpReceiver(%s) received None frame", self.kind)
             raise MediaStreamError
+        frame, self.__last_frame_index = item
+        self.__last_frame = frame
         logger.debug(f"RTCRtpReceiver(%s) received the next frame", self.kind)
         return frame
 
+    def frame_index(self, frame: Frame) -> Optional[int]:
+        """
+        Return the frame index carried in the RTP header extension of the
+        last received frame.
+        """
+        if frame is self.__last_frame and self.__last_frame_index is not None:
+            return self.__last_frame_index
+        return super().frame_index(frame)
+
+    def _put_frames(self, loop: asyncio.AbstractEventLoop, items: List) -> None:
+        """
+        Queue decoded frames from the decoder thread.
+
+        A single wakeup of the event loop is scheduled for any number of
+        frames, and unless the queue is unbounded the oldest frames are
+        dropped if the reader falls behind.
+        """
+        with self.__lock:
+            for item in items:
+                if item is not None and self._queue_size is not None:
+                    while (
+                        len(self._queue) >= self._queue_size
+                        and self._queue[0] is not None
+                    ):
+                        self._queue.popleft()
+                        self.frames_dropped += 1
+                self._queue.append(item)
+            if self.__wakeup_pending:
+                return
+            self.__wakeup_pending = True
+        loop.call_soon_threadsafe(self.__wakeup)
+
+    def __wakeup(self) -> None:
+        with self.__lock:
+            self.__wakeup_pending = False
+        self.__event.set()
+
 
 class TimestampMapper:
     def __init__(self) -> None:
@@ -256,7 +559,10 @@ class RTCRtpReceiver:
 
         self.__active_ssrc: Dict[int, datetime.datetime] = {}
         self.__codecs: Dict[int, RTCRtpCodecParameters] = {}
-        self.__decoder_queue: queue.Queue = queue.Queue()
+        self.__decoder_queue = DropOldestQueue(
+            None if kind == "audio" else DECODER_QUEUE_SIZE
+        )
+        self.__decoder_stream: Optional[DecoderStream] = None
         self.__decoder_thread: Optional[threading.Thread] = None
         self.__kind = kind
         if kind == "audio":
@@ -264,21 +570,37 @@ class RTCRtpReceiver:
             self.__nack_generator = None
             self.__remote_bitrate_estimator = None
         elif kind == "keypoints":
-            self.__jitter_buffer = JitterBuffer(capacity=128)
+            self.__jitter_buffer = JitterBuffer(
+                capacity=128, adaptive=adaptive_jitter_buffer
+            )
             self.__nack_generator = NackGenerator()
             self.__remote_bitrate_estimator = None
         elif kind == "lr_video":
-            self.__jitter_buffer = JitterBuffer(capacity=128, is_video=True)
+            self.__jitter_buffer = JitterBuffer(
+                capacity=128, is_video=True, adaptive=adaptive_jitter_buffer
+            )
             self.__nack_generator = NackGenerator()
             self.__remote_bitrate_estimator = RemoteBitrateEstimator()
         else:
             # for "video"
-            self.__jitter_buffer = JitterBuffer(capacity=128, is_video=True)
+            self.__jitter_buffer = JitterBuffer(
+                capacity=128, is_video=True, adaptive=adaptive_jitter_buffer
+            )
             self.__nack_generator = NackGenerator()
             self.__remote_bitrate_estimator = RemoteBitrateEstimator()
         self._track: Optional[RemoteStreamTrack] = None
         self.__rtcp_exited = asyncio.Event()
         self.__rtcp_task: Optional[asyncio.Future[None]] = None
+        self.__nack_ssrc: Optional[int] = None
+        self.__nack_task: Optional[asyncio.Future[None]] = None
+        self.__jitter_codec: Optional[RTCRtpCodecParameters] = None
+        self.__jitter_deadline: Optional[asyncio.TimerHandle] = None
+        self.__jitter_ssrc: Optional[int] = None
+        self.__red_max_seq: Dict[int, int] = {}
+        self.__red_recovered = 0
+        self.__red_recovered_packets: Deque[Tuple[int, int]] = deque(
+            maxlen=RED_RECOVERED_HISTORY
+        )
         self.__rtx_ssrc: Dict[int, int] = {}
         self.__started = False
         self.__stats = RTCStatsReport()
@@ -341,6 +663,15 @@ class RTCRtpReceiver:
                     packetsLost=stream.packets_lost,
                     jitter=stream.jitter,
                     # RTPInboundRtpStreamStats
+                    jitterBufferDelay=self.__jitter_buffer.current_delay,
+                    jitterBufferTargetDelay=self.__jitter_buffer.target_delay,
+                    framesDropped=self.__jitter_buffer.frames_dropped_late,
+                    decoderQueueDepth=self.__decoder_queue.depth,
+                    decoderQueueMaxDepth=self.__decoder_queue.max_depth,
+                    decoderFramesDropped=self.__decoder_queue.dropped,
+                    packetsRecovered=self.__red_recovered,
+                    trackQueueDepth=len(self._track._queue) if self._track else None,
+                    trackFramesDropped=self._track.frames_dropped if self._track else None,
                 )
             )
         self.__stats.update(self.transport._get_stats())
@@ -374,20 +705,33 @@ class RTCRtpReceiver:
                 if encoding.rtx:
                     self.__rtx_ssrc[encoding.rtx.ssrc] = encoding.ssrc
 
-            # start decoder thread
-            self.__decoder_thread = threading.Thread(
-                target=decoder_worker,
-                name=self.__kind + "-decoder",
-                args=(
-                    asyncio.get_event_loop(),
-                    self.__decoder_queue,
-                    self._track._queue,
-                ),
-            )
-            self.__decoder_thread.start()
+            # time the jitter buffer with the clock of the negotiated codec
+            for codec in parameters.codecs:
+                if not is_red(codec) and not is_rtx(codec):
+                    self.__jitter_buffer.clock_rate = codec.clockRate
+                    break
+
+            # start decoder thread, or join the shared decoder pool
+            if shared_decoder_pool:
+                self.__decoder_stream = get_decoder_scheduler().add_stream(
+                    asyncio.get_event_loop(), self.__decoder_queue, self._track
+                )
+            else:
+                self.__decoder_thread = threading.Thread(
+                    target=decoder_worker,
+                    name=self.__kind + "-decoder",
+                    args=(
+                        asyncio.get_event_loop(),
+                        self.__decoder_queue,
+                        self._track,
+                    ),
+                )
+                self.__decoder_thread.start()
 
             self.__transport._register_rtp_receiver(self, parameters)
             self.__rtcp_task = asyncio.ensure_future(self._run_rtcp())
+            if self.__nack_generator is not None:
+                self.__nack_task = asyncio.ensure_future(self._run_nack())
             self.__started = True
 
     def setTransport(self, transport: RTCDtlsTransport) -> None:
@@ -401,6 +745,11 @@ class RTCRtpReceiver:
             self.__transport._unregister_rtp_receiver(self)
             self.__stop_decoder()
             self.__rtcp_task.cancel()
+            if self.__nack_task is not None:
+                self.__nack_task.cancel()
+            if self.__jitter_deadline is not None:
+                self.__jitter_deadline.cancel()
+                self.__jitter_deadline = None
             await self.__rtcp_exited.wait()
 
     def _handle_disconnect(self) -> None:
@@ -441,105 +790,287 @@ class RTCRtpReceiver:
         """
         Handle an incoming RTP packet.
         """
-        self.__log_debug("< RTP %s arrival time:%d %s", 
-                         packet, arrival_time_ms, datetime.datetime.now())
+        await self._handle_rtp_packets([(packet, arrival_time_ms)])
 
+    async def _handle_rtp_packets(self, packets: List[Tuple[RtpPacket, int]]) -> None:
         """
-        if (packet.sequence_number == 3000):
-            self.__dropped_packet_time = arrival_time_ms
-            self.__log_debug("dropping packet %s", packet.sequence_number)
-            return 
+        Handle a batch of incoming RTP packets, given with their arrival times.
 
-        if arrival_time_ms - self.__dropped_packet_time < 10000: # 10seconds
-            self.__log_debug("dropping more packets %s", packet.sequence_number)
-            return
+        The packets are handled in order, then the feedback they call for,
+        REMB, NACK and PLI, is sent once for the whole batch.
         """
+        now = clock.current_datetime()
+        remb = None
+        send_nacks = False
+        pli_ssrcs: List[int] = []
+        frames_queued = False
+
+        for packet, arrival_time_ms in packets:
+            self.__log_debug("< RTP %s arrival time:%d %s", 
+                             packet, arrival_time_ms, datetime.datetime.now())
+
+            """
+            if (packet.sequence_number == 3000):
+                self.__dropped_packet_time = arrival_time_ms
+                self.__log_debug("dropping packet %s", packet.sequence_number)
+                return 
+
+            if arrival_time_ms - self.__dropped_packet_time < 10000: # 10seconds
+                self.__log_debug("dropping more packets %s", packet.sequence_number)
+                return
+            """
+
+            # decode the header extensions, dropping the packet if they are
+            # malformed
+            try:
+                extensions = packet.extensions
+            except ValueError as exc:
+                self.__log_debug("x RTP header extension parsing failed: %s", exc)
+                continue
+
+            # feed bitrate estimator, unless the sender estimates the bitrate
+            # from transport-cc feedback
+            if self.__remote_bitrate_estimator is not None:
+                if (
+                    extensions.abs_send_time is not None
+                    and extensions.transport_sequence_number is None
+                ):
+                    remb = (
+                        self.__remote_bitrate_estimator.add(
+                            abs_send_time=extensions.abs_send_time,
+                            arrival_time_ms=arrival_time_ms,
+                            payload_size=len(packet.payload) + packet.padding_size,
+                            ssrc=packet.ssrc,
+                        )
+                        or remb
+                    )
 
-        # feed bitrate estimator
-        if self.__remote_bitrate_estimator is not None:
-            if packet.extensions.abs_send_time is not None:
-                remb = self.__remote_bitrate_estimator.add(
-                    abs_send_time=packet.extensions.abs_send_time,
-                    arrival_time_ms=arrival_time_ms,
-                    payload_size=len(packet.payload) + packet.padding_size,
-                    ssrc=packet.ssrc,
+            # keep track of sources
+            self.__active_ssrc[packet.ssrc] = now
+
+            # check the codec is known
+            codec = self.__codecs.get(packet.payload_type)
+            if codec is None:
+                self.__log_debug(
+                    "x RTP packet with unknown payload type %d", packet.payload_type
+                )
+                continue
+
+            # feed RTCP statistics
+            if packet.ssrc not in self.__remote_streams:
+                self.__remote_streams[packet.ssrc] = StreamStatistics(codec.clockRate)
+            self.__remote_streams[packet.ssrc].add(packet)
+
+            # unwrap retransmission packet
+            if is_rtx(codec):
+                original_ssrc = self.__rtx_ssrc.get(packet.ssrc)
+                if original_ssrc is None:
+                    self.__log_debug("x RTX packet from unknown SSRC %d", packet.ssrc)
+                    continue
+
+                if len(packet.payload) < 2:
+                    continue
+
+                codec = self.__codecs[codec.parameters["apt"]]
+                packet = unwrap_rtx(
+                    packet, payload_type=codec.payloadType, ssrc=original_ssrc
                 )
 
-                if self.__rtcp_ssrc is not None and remb is not None:
-                    # send Receiver Estimated Maximum Bitrate feedback
-                    rtcp_packet = RtcpPsfbPacket(
-                        fmt=RTCP_PSFB_APP,
-                        ssrc=self.__rtcp_ssrc,
-                        media_ssrc=0,
-                        fci=pack_remb_fci(*remb),
-                    )
-                    await self._send_rtcp(rtcp_packet)
+            # recover the packets lost before a redundant packet
+            if is_red(codec):
+                media_packets = self.__unwrap_red(packet)
+            else:
+                media_packets = [packet]
 
-        # keep track of sources
-        self.__active_ssrc[packet.ssrc] = clock.current_datetime()
+            for packet in media_packets:
+                codec = self.__codecs[packet.payload_type]
 
-        # check the codec is known
-        codec = self.__codecs.get(packet.payload_type)
-        if codec is None:
-            self.__log_debug(
-                "x RTP packet with unknown payload type %d", packet.payload_type
+                # make note of newly missing packets, retries are sent by _run_nack
+                if self.__nack_generator is not None:
+                    self.__nack_ssrc = packet.ssrc
+                    missed, keyframe_needed = self.__nack_generator.add(
+                        packet, arrival_time_ms
+                    )
+                    if missed:
+                        send_nacks = True
+                    if keyframe_needed:
+                        self.__log_debug("Too many packets missing, generating a PLI")
+                        if packet.ssrc not in pli_ssrcs:
+                            pli_ssrcs.append(packet.ssrc)
+
+                # parse codec-specific information
+                try:
+                    if packet.payload:
+                        packet._data = depayload(codec, packet.payload)  # type: ignore
+                    else:
+                        packet._data = b""  # type: ignore
+                except ValueError as exc:
+                    self.__log_debug("x RTP payload parsing failed: %s", exc)
+                    continue
+
+                # try to re-assemble encoded frame
+                self.__jitter_codec = codec
+                self.__jitter_ssrc = packet.ssrc
+                pli_flag, encoded_frame = self.__jitter_buffer.add(packet, arrival_time_ms)
+                # check if the PLI should be sent
+                if pli_flag:
+                    if encoded_frame is not None:
+                        self.__log_debug("Generating a PLI for %s", encoded_frame.timestamp)
+                    else:
+                        self.__log_debug("Generating a PLI for None")
+                    if packet.ssrc not in pli_ssrcs:
+                        pli_ssrcs.append(packet.ssrc)
+
+                # if we have a complete encoded frame, queue it for decoding
+                if encoded_frame is not None and (self.__decoder_thread or self.__decoder_stream):
+                    frames_queued = True
+                    if self.__queue_encoded_frame(codec, encoded_frame):
+                        if packet.ssrc not in pli_ssrcs:
+                            pli_ssrcs.append(packet.ssrc)
+
+        if frames_queued and self.__decoder_stream:
+            self.__decoder_stream.schedule()
+
+        # a frame waiting for a lost packet is abandoned at its deadline even
+        # if no further packets arrive
+        self.__schedule_jitter_deadline()
+
+        if self.__rtcp_ssrc is not None and remb is not None:
+            # send Receiver Estimated Maximum Bitrate feedback
+            rtcp_packet = RtcpPsfbPacket(
+                fmt=RTCP_PSFB_APP,
+                ssrc=self.__rtcp_ssrc,
+                media_ssrc=0,
+                fci=pack_remb_fci(*remb),
             )
-            return
-
-        # feed RTCP statistics
-        if packet.ssrc not in self.__remote_streams:
-            self.__remote_streams[packet.ssrc] = StreamStatistics(codec.clockRate)
-        self.__remote_streams[packet.ssrc].add(packet)
-
-        # unwrap retransmission packet
-        if is_rtx(codec):
-            original_ssrc = self.__rtx_ssrc.get(packet.ssrc)
-            if original_ssrc is None:
-                self.__log_debug("x RTX packet from unknown SSRC %d", packet.ssrc)
-                return
+            await self._send_rtcp(rtcp_packet)
 
-            if len(packet.payload) < 2:
-                return
+        # send NACKs for newly missing packets
+        if send_nacks:
+            await self.__send_nacks(arrival_time_ms)
 
-            codec = self.__codecs[codec.parameters["apt"]]
-            packet = unwrap_rtx(
-                packet, payload_type=codec.payloadType, ssrc=original_ssrc
-            )
+        for ssrc in pli_ssrcs:
+            await self._send_rtcp_pli(ssrc)
 
-        # send NACKs for any missing any packets
-        if self.__nack_generator is not None and self.__nack_generator.add(packet):
-            await self._send_rtcp_nack(
-                packet.ssrc, sorted(self.__nack_generator.missing)
+    def __queue_encoded_frame(self, codec: RTCRtpCodecParameters, encoded_frame) -> bool:
+        """
+        Queue a complete encoded frame for decoding, and return whether a
+        keyframe is needed because older frames were dropped to make room.
+        """
+        encoded_frame.timestamp = self.__timestamp_mapper.map(encoded_frame.timestamp)
+        dropped = self.__decoder_queue.put((codec, encoded_frame))
+        self.__log_debug("Put frame timestamp %s into decoder queue at time %s",
+                         encoded_frame.timestamp, datetime.datetime.now())
+
+        # the decoder is behind, dropped frames break the reference chain
+        if dropped:
+            self.__log_debug("Decoder queue dropped %d frames, generating a PLI", dropped)
+            return True
+        return False
+
+    def __schedule_jitter_deadline(self) -> None:
+        if self.__jitter_deadline is not None:
+            self.__jitter_deadline.cancel()
+            self.__jitter_deadline = None
+
+        deadline_ms = self.__jitter_buffer.deadline
+        if deadline_ms is not None:
+            delay = max(0.0, (deadline_ms - clock.current_ms()) / 1000)
+            self.__jitter_deadline = asyncio.get_event_loop().call_later(
+                delay, lambda: asyncio.ensure_future(self.__handle_jitter_deadline())
             )
 
-        # parse codec-specific information
-        try:
-            if packet.payload:
-                packet._data = depayload(codec, packet.payload)  # type: ignore
-            else:
-                packet._data = b""  # type: ignore
-        except ValueError as exc:
-            self.__log_debug("x RTP payload parsing failed: %s", exc)
-            return
-
-        # try to re-assemble encoded frame
-        pli_flag, encoded_frame = self.__jitter_buffer.add(packet)
-        # check if the PLI should be sent
+    async def __handle_jitter_deadline(self) -> None:
+        """
+        Abandon the late frame the jitter buffer is waiting on and queue the
+        complete frames behind it.
+        """
+        self.__jitter_deadline = None
+        pli_flag, encoded_frames = self.__jitter_buffer.poll(clock.current_ms())
+        if encoded_frames and (self.__decoder_thread or self.__decoder_stream):
+            for encoded_frame in encoded_frames:
+                if self.__queue_encoded_frame(self.__jitter_codec, encoded_frame):
+                    pli_flag = True
+            if self.__decoder_stream:
+                self.__decoder_stream.schedule()
+
+        self.__schedule_jitter_deadline()
         if pli_flag:
-            if encoded_frame is not None:
-                self.__log_debug("Generating a PLI for %s", encoded_frame.timestamp)
-            else:
-                self.__log_debug("Generating a PLI for None")
-            await self._send_rtcp_pli(packet.ssrc)
+            self.__log_debug("Abandoned a late frame, generating a PLI")
+            await self._send_rtcp_pli(self.__jitter_ssrc)
 
-        # if we have a complete encoded frame, decode it
-        if encoded_frame is not None and self.__decoder_thread:
-            encoded_frame.timestamp = self.__timestamp_mapper.map(
-                encoded_frame.timestamp
+    def __unwrap_red(self, red: RtpPacket) -> List[RtpPacket]:
+        """
+        Return the primary packet of a redundant packet, preceded by the
+        packets which were lost and which it carries redundant blocks for.
+        """
+        try:
+            blocks = unpack_red_payload(red.payload)
+            extensions = red.extensions
+        except ValueError as exc:
+            self.__log_debug("x RED packet parsing failed: %s", exc)
+            return []
+
+        max_seq = self.__red_max_seq.get(red.ssrc)
+        if max_seq is None or uint16_gt(red.sequence_number, max_seq):
+            self.__red_max_seq[red.ssrc] = red.sequence_number
+
+        packets = []
+        for distance, (payload_type, timestamp_offset, data) in zip(
+            range(len(blocks) - 1, -1, -1), blocks
+        ):
+            codec = self.__codecs.get(payload_type)
+            if codec is None or is_red(codec) or is_rtx(codec):
+                self.__log_debug(
+                    "x RED block with unknown payload type %d", payload_type
+                )
+                continue
+
+            # each redundant block was sent as the primary of an earlier packet
+            sequence_number = uint16_add(red.sequence_number, -distance)
+            if distance:
+                if not self.__red_block_missing(red.ssrc, sequence_number, max_seq):
+                    continue
+                self.__log_debug("- RED recovered packet %d", sequence_number)
+                self.__red_recovered += 1
+                self.__red_recovered_packets.append((red.ssrc, sequence_number))
+            elif (red.ssrc, sequence_number) in self.__red_recovered_packets:
+                # the original was reordered rather than lost
+                self.__log_debug(
+                    "- RED packet %d arrived after its recovery", sequence_number
+                )
+                self.__red_recovered -= 1
+                self.__red_recovered_packets.remove((red.ssrc, sequence_number))
+
+            packet = RtpPacket(
+                payload_type=payload_type,
+                marker=red.marker,
+                sequence_number=sequence_number,
+                timestamp=uint32_add(red.timestamp, -timestamp_offset),
+                ssrc=red.ssrc,
+                payload=data,
             )
-            self.__decoder_queue.put((codec, encoded_frame))
-            self.__log_debug("Put frame timestamp %s into decoder queue at time %s", 
-                             encoded_frame.timestamp, datetime.datetime.now())
+            if not distance:
+                packet.csrc = red.csrc
+                packet.extensions = extensions
+            packets.append(packet)
+        return packets
+
+    def __red_block_missing(
+        self, ssrc: int, sequence_number: int, max_seq: Optional[int]
+    ) -> bool:
+        """
+        Return whether the packet a redundant block stands for has not been
+        received yet.
+        """
+        if (ssrc, sequence_number) in self.__red_recovered_packets:
+            return False
+        if (
+            self.__nack_generator is not None
+            and sequence_number in self.__nack_generator.missing
+        ):
+            return True
+        return max_seq is not None and uint16_gt(sequence_number, max_seq)
 
     async def _run_rtcp(self) -> None:
         self.__log_debug("- RTCP started")
@@ -583,6 +1114,27 @@ class RTCRtpReceiver:
         self.__log_debug("- RTCP finished")
         self.__rtcp_exited.set()
 
+    async def _run_nack(self) -> None:
+        """
+        Periodically request the missing packets which are due again.
+        """
+        try:
+            while True:
+                await asyncio.sleep(NACK_INTERVAL)
+                if self.__nack_generator.missing:
+                    await self.__send_nacks(clock.current_ms())
+        except asyncio.CancelledError:
+            pass
+
+    async def __send_nacks(self, now_ms: float) -> None:
+        rtt = self.__transport._rtt
+        rtt_ms = rtt * 1000 if rtt is not None else NACK_DEFAULT_RTT_MS
+        lost = self.__nack_generator.get_nack_batch(
+            now_ms, rtt_ms, horizon=self.__jitter_buffer.origin
+        )
+        if lost:
+            await self._send_rtcp_nack(self.__nack_ssrc, lost)
+
     async def _send_rtcp(self, packet) -> None:
         self.__log_debug("> RTCP %s", packet)
         try:
@@ -622,6 +1174,11 @@ class RTCRtpReceiver:
             self.__decoder_queue.put(None)
             self.__decoder_thread.join()
             self.__decoder_thread = None
+        if self.__decoder_stream:
+            self.__decoder_queue.put(None)
+            self.__decoder_stream.schedule()
+            self.__decoder_stream.wait()
+            self.__decoder_stream = None
 
     def __log_debug(self, msg: str, *args) -> None:
         logger.debug(f"RTCRtpReceiver(%s) {msg}", self.__kind, *args)
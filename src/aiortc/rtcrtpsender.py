@@ -1,19 +1,25 @@
 import asyncio
 import logging
 import random
+import threading
 import time
 import traceback
 import uuid
-from typing import Dict, List, Optional, Union
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Union
 import datetime
 
 from . import clock, rtp
-from .codecs import get_capabilities, get_encoder, is_rtx
+from .codecs import get_capabilities, get_encoder, is_red, is_rtx
 from .codecs.base import Encoder
 from .exceptions import InvalidStateError
 from .mediastreams import MediaStreamError, MediaStreamTrack
+from .pacer import PRIORITY_HIGH, PRIORITY_RETRANSMISSION, get_priority
+from .rate import RateCounter
 from .rtcrtpparameters import RTCRtpCodecParameters, RTCRtpSendParameters
 from .rtp import (
+    RED_MAX_BLOCK_LENGTH,
+    RED_MAX_TIMESTAMP_OFFSET,
     RTCP_PSFB_APP,
     RTCP_PSFB_PLI,
     RTCP_RTPFB_NACK,
@@ -27,21 +33,194 @@ from .rtp import (
     RtcpSourceInfo,
     RtcpSrPacket,
     RtpPacket,
+    pack_red_payload,
     unpack_remb_fci,
-    wrap_rtx,
+    wrap_rtx_data,
 )
 from .stats import (
     RTCOutboundRtpStreamStats,
     RTCRemoteInboundRtpStreamStats,
     RTCStatsReport,
 )
-from .utils import random16, random32, uint16_add, uint32_add
+from .utils import DropOldestQueue, random16, random32, uint16_add, uint32_add
 
 logger = logging.getLogger(__name__)
 
-RTP_HISTORY_SIZE = 128
+# sent packets are kept for retransmission for a duration in seconds, up
+# to a total size in bytes
+RTP_HISTORY_DURATION = 1.0
+RTP_HISTORY_MAX_BYTES = 4 * 1024 * 1024
 RTT_ALPHA = 0.85
 
+# retransmissions of a packet are at least this many seconds apart when
+# the round-trip time is not known yet
+RTX_DEFAULT_INTERVAL = 0.1
+
+# send RTP packets through the pacer of the transport instead of as soon
+# as they are packetized
+paced_sending = False
+
+# encode frames on a dedicated thread per sender, so the next frame is
+# captured and encoded while the current one is packetized and sent
+pipelined_encoding = False
+ENCODE_QUEUE_SIZE = 2
+
+# number of previous frames carried by each packet when redundant encoding
+# is negotiated, so a lost frame is recovered without a retransmission
+RED_DISTANCE = 2
+
+
+class RtpHistoryEntry:
+    __slots__ = ("data", "last_retransmit", "sent", "sequence_number")
+
+    def __init__(self, sequence_number: int, data: bytes, sent: float) -> None:
+        self.data = data
+        self.last_retransmit: Optional[float] = None
+        self.sent = sent
+        self.sequence_number = sequence_number
+
+
+class RtpHistory:
+    """
+    The serialized RTP packets sent recently, kept for retransmission.
+
+    Packets are kept in the order they were sent and expire once they are
+    older than `duration` seconds or the history exceeds `max_bytes`, so a
+    keyframe spanning many packets can be retransmitted in full.
+    """
+
+    def __init__(
+        self, duration: float = RTP_HISTORY_DURATION, max_bytes: int = RTP_HISTORY_MAX_BYTES
+    ) -> None:
+        self.__bytes = 0
+        self.__duration = duration
+        self.__entries: Deque[RtpHistoryEntry] = deque()
+        self.__index: Dict[int, RtpHistoryEntry] = {}
+        self.__max_bytes = max_bytes
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @property
+    def bytes(self) -> int:
+        return self.__bytes
+
+    def add(self, sequence_number: int, data: bytes, now: float) -> None:
+        entry = RtpHistoryEntry(sequence_number, data, now)
+        previous = self.__index.get(sequence_number)
+        if previous is not None:
+            # the sequence number wrapped, forget the stale packet
+            self.__entries.remove(previous)
+            self.__bytes -= len(previous.data)
+        self.__entries.append(entry)
+        self.__index[sequence_number] = entry
+        self.__bytes += len(data)
+        self.expire(now)
+
+    def expire(self, now: float) -> None:
+        while self.__entries and (
+            self.__bytes > self.__max_bytes
+            or now - self.__entries[0].sent > self.__duration
+        ):
+            entry = self.__entries.popleft()
+            del self.__index[entry.sequence_number]
+            self.__bytes -= len(entry.data)
+
+    def get(self, sequence_number: int) -> Optional[RtpHistoryEntry]:
+        return self.__index.get(sequence_number)
+
+
+class EncodePipeline:
+    """
+    Encodes the frames of a sender on a dedicated thread.
+
+    Captured frames wait in a bounded queue and the oldest ones are dropped
+    when the encoder falls behind. At most `queue_size` encoded frames are
+    waiting to be sent, beyond which the encoder thread stops taking frames.
+
+    :param encode: The function encoding a frame into payloads and a timestamp.
+    :param queue_size: The maximum number of frames waiting on either side.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[..., Tuple[List[bytes], int]],
+        queue_size: int = ENCODE_QUEUE_SIZE,
+        name: str = "encoder",
+    ) -> None:
+        self.__encode = encode
+        self.__error: Optional[Exception] = None
+        self.__input = DropOldestQueue(queue_size)
+        self.__loop = asyncio.get_event_loop()
+        self.__output: asyncio.Queue = asyncio.Queue()
+        self.__slots = threading.Semaphore(queue_size)
+        self.__stopped = False
+        self.__thread = threading.Thread(name=name, target=self.__run, daemon=True)
+        self.__thread.start()
+
+    @property
+    def frames_dropped(self) -> int:
+        return self.__input.dropped
+
+    @property
+    def queue_depth(self) -> int:
+        return self.__input.depth
+
+    def close(self, error: Optional[Exception] = None) -> None:
+        """
+        Signal the end of the track, once the queued frames are encoded
+        :meth:`get` raises `error` or :class:`MediaStreamError`.
+        """
+        self.__error = error
+        self.__input.put(None)
+
+    async def get(self) -> Tuple[List[bytes], int, Optional[int]]:
+        """
+        Return the payloads, timestamp and frame index of the next frame.
+        """
+        result = await self.__output.get()
+        self.__slots.release()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def put(self, frame, frame_index: Optional[int]) -> int:
+        """
+        Queue a frame and return the number of frames dropped to make room.
+        """
+        return self.__input.put((frame, frame_index))
+
+    def stop(self) -> None:
+        """
+        Stop the encoder thread, dropping the queued frames.
+        """
+        self.__stopped = True
+        self.__input.put(None)
+        self.__slots.release()
+
+    def __post(self, result) -> None:
+        try:
+            self.__loop.call_soon_threadsafe(self.__output.put_nowait, result)
+        except RuntimeError:
+            # the event loop is closed
+            pass
+
+    def __run(self) -> None:
+        while True:
+            self.__slots.acquire()
+            item = self.__input.get()
+            if item is None or self.__stopped:
+                self.__post(self.__error or MediaStreamError())
+                return
+
+            frame, frame_index = item
+            try:
+                payloads, timestamp = self.__encode(frame)
+            except Exception as exc:
+                self.__post(exc)
+                return
+            self.__post((payloads, timestamp, frame_index))
+
 
 class RTCRtpSender:
     """
@@ -70,21 +249,27 @@ class RTCRtpSender:
         self._rtx_ssrc = random32()
         # FIXME: how should this be initialised?
         self._stream_id = str(uuid.uuid4())
+        self.__capture_task: Optional[asyncio.Future[None]] = None
+        self.__encode_pipeline: Optional[EncodePipeline] = None
         self.__encoder: Optional[Encoder] = None
         self.__force_keyframe = False
+        self.__keyframe_lock = threading.Lock()
         self.__quantizer = quantizer
         self.__target_bitrate = target_bitrate
         self.__enable_gcc = enable_gcc
         self.__loop = asyncio.get_event_loop()
         self.__mid: Optional[str] = None
+        self.__red_history: Deque[Tuple[int, bytes]] = deque(maxlen=RED_DISTANCE)
+        self.__red_payload_type: Optional[int] = None
         self.__rtp_exited = asyncio.Event()
         self.__rtp_header_extensions_map = rtp.HeaderExtensionsMap()
         self.__rtp_task: Optional[asyncio.Future[None]] = None
-        self.__rtp_history: Dict[int, RtpPacket] = {}
+        self.__rtp_history = RtpHistory()
         self.__rtcp_exited = asyncio.Event()
         self.__rtcp_task: Optional[asyncio.Future[None]] = None
         self.__rtx_payload_type: Optional[int] = None
         self.__rtx_sequence_number = 61495 #random16()
+        self.__send_rate = RateCounter(1000, 8000)
         self.__started = False
         self.__stats = RTCStatsReport()
         self.__transport = transport
@@ -98,6 +283,13 @@ class RTCRtpSender:
         self.__octet_count = 0
         self.__packet_count = 0
         self.__rtt = None
+        self.__nack_count = 0
+        self.__retransmitted_bytes = 0
+        self.__retransmitted_packets = 0
+        self.__retransmissions_deduplicated = 0
+        self.__retransmissions_missed = 0
+        self.__frames_encoded = 0
+        self.__total_encode_time = 0.0
 
     @property
     def kind(self):
@@ -149,6 +341,25 @@ class RTCRtpSender:
                 bytesSent=self.__octet_count,
                 # RTCOutboundRtpStreamStats
                 trackId=str(id(self.track)),
+                nackCount=self.__nack_count,
+                retransmittedPacketsSent=self.__retransmitted_packets,
+                retransmittedBytesSent=self.__retransmitted_bytes,
+                retransmissionsDeduplicated=self.__retransmissions_deduplicated,
+                retransmissionsMissed=self.__retransmissions_missed,
+                rtpHistoryPackets=len(self.__rtp_history),
+                rtpHistoryBytes=self.__rtp_history.bytes,
+                framesEncoded=self.__frames_encoded,
+                totalEncodeTime=self.__total_encode_time,
+                encoderQueueDepth=(
+                    self.__encode_pipeline.queue_depth
+                    if self.__encode_pipeline is not None
+                    else None
+                ),
+                encoderFramesDropped=(
+                    self.__encode_pipeline.frames_dropped
+                    if self.__encode_pipeline is not None
+                    else None
+                ),
             )
         )
         self.__stats.update(self.transport._get_stats())
@@ -190,6 +401,12 @@ class RTCRtpSender:
                     self.__rtx_payload_type = codec.payloadType
                     break
 
+            # make note of RED payload type
+            for codec in parameters.codecs:
+                if is_red(codec):
+                    self.__red_payload_type = codec.payloadType
+                    break
+
             self.__rtp_task = asyncio.ensure_future(self._run_rtp(parameters.codecs[0]))
             self.__rtcp_task = asyncio.ensure_future(self._run_rtcp())
             self.__started = True
@@ -219,6 +436,7 @@ class RTCRtpSender:
                         self.__rtt = rtt
                     else:
                         self.__rtt = RTT_ALPHA * self.__rtt + (1 - RTT_ALPHA) * rtt
+                    self.__transport._rtt = self.__rtt
 
                 self.__stats.add(
                     RTCRemoteInboundRtpStreamStats(
@@ -240,6 +458,7 @@ class RTCRtpSender:
                     )
                 )
         elif isinstance(packet, RtcpRtpfbPacket) and packet.fmt == RTCP_RTPFB_NACK:
+            self.__nack_count += 1
             for seq in packet.lost:
                 self.__log_debug("dispatching retransmit %s", seq)
                 await self._retransmit(seq)
@@ -259,51 +478,74 @@ class RTCRtpSender:
                 pass
 
     async def _next_encoded_frame(self, codec: RTCRtpCodecParameters):
+        if self.__encoder is None:
+            self.__encoder = get_encoder(codec)
+
+        if pipelined_encoding:
+            if self.__encode_pipeline is None:
+                self.__encode_pipeline = EncodePipeline(
+                    self.__encode, name="encoder-%s" % self.__kind
+                )
+                self.__capture_task = asyncio.ensure_future(self.__run_capture())
+            return await self.__encode_pipeline.get()
+
         # get frame
         frame = await self.__track.recv()
+        frame_index = self.__track.frame_index(frame)
 
         # encode frame
-        if self.__encoder is None:
-            self.__encoder = get_encoder(codec)
-        force_keyframe = self.__force_keyframe
-        quantizer = self.__quantizer
-        target_bitrate = self.__target_bitrate
-        enable_gcc = self.__enable_gcc
-        self.__force_keyframe = False
-        self.__log_debug("encoding frame with force keyframe %s at time %s", 
-                        force_keyframe, datetime.datetime.now())
-        return await self.__loop.run_in_executor(
-            None, self.__encoder.encode, frame, force_keyframe, quantizer, target_bitrate, enable_gcc
+        payloads, timestamp = await self.__loop.run_in_executor(
+            None, self.__encode, frame
         )
+        return payloads, timestamp, frame_index
 
     async def _retransmit(self, sequence_number: int) -> None:
         """
         Retransmit an RTP packet which was reported as lost.
         """
-        packet = self.__rtp_history.get(sequence_number % RTP_HISTORY_SIZE)
-        if packet and packet.sequence_number == sequence_number:
-            if self.__rtx_payload_type is not None:
-                packet = wrap_rtx(
-                    packet,
-                    payload_type=self.__rtx_payload_type,
-                    sequence_number=self.__rtx_sequence_number,
-                    ssrc=self._rtx_ssrc,
-                )
-                self.__rtx_sequence_number = uint16_add(self.__rtx_sequence_number, 1)
+        now = time.time()
+        self.__rtp_history.expire(now)
+        entry = self.__rtp_history.get(sequence_number)
+        if entry is None:
+            self.__log_debug("x retransmission of %s is no longer possible", sequence_number)
+            self.__retransmissions_missed += 1
+            return
+
+        # the previous retransmission may still be in flight
+        interval = self.__rtt if self.__rtt is not None else RTX_DEFAULT_INTERVAL
+        if entry.last_retransmit is not None and now - entry.last_retransmit < interval:
+            self.__retransmissions_deduplicated += 1
+            return
+        entry.last_retransmit = now
+
+        packet_bytes = entry.data
+        if self.__rtx_payload_type is not None:
+            packet_bytes = wrap_rtx_data(
+                packet_bytes,
+                payload_type=self.__rtx_payload_type,
+                sequence_number=self.__rtx_sequence_number,
+                ssrc=self._rtx_ssrc,
+            )
+            self.__rtx_sequence_number = uint16_add(self.__rtx_sequence_number, 1)
 
-            self.__log_debug("> %s retransmission of original %s", packet, sequence_number)
-            packet_bytes = packet.serialize(self.__rtp_header_extensions_map)
-            await self.transport._send_rtp(packet_bytes)
+        self.__log_debug("> retransmission of original %s", sequence_number)
+        self.__retransmitted_packets += 1
+        self.__retransmitted_bytes += len(packet_bytes)
+        await self.__send_rtp(
+            packet_bytes, PRIORITY_RETRANSMISSION, prepare=self.__stamp_abs_send_time
+        )
 
     def _send_keyframe(self) -> None:
         """
         Request the next frame to be a keyframe.
         """
-        self.__force_keyframe = True
+        with self.__keyframe_lock:
+            self.__force_keyframe = True
 
     async def _run_rtp(self, codec: RTCRtpCodecParameters) -> None:
         self.__log_debug("- RTP started")
 
+        priority = get_priority(self.__kind)
         sequence_number = 0 #random16()
         timestamp_origin = 0 #random32()
         try:
@@ -314,12 +556,17 @@ class RTCRtpSender:
                     continue
 
                 counter += 1
-                payloads, timestamp = await self._next_encoded_frame(codec)
+                payloads, timestamp, frame_index = await self._next_encoded_frame(codec)
+                if paced_sending and priority != PRIORITY_HIGH:
+                    self.transport._pacer.set_bitrate(self._ssrc, self.__pacing_bitrate())
                 self.__log_debug("Frame %s is encoded with timestamp %s with len %s at time %s", 
                                 counter, timestamp, sum([len(i) for i in payloads]), datetime.datetime.now())
                 old_timestamp = timestamp
                 timestamp = uint32_add(timestamp_origin, timestamp)
 
+                # serialize all the packets of the frame, then send them at once
+                batch = []
+                header_length = None
                 for i, payload in enumerate(payloads):
                     packet = RtpPacket(
                         payload_type=codec.payloadType,
@@ -328,6 +575,8 @@ class RTCRtpSender:
                     )
                     packet.ssrc = self._ssrc
                     packet.payload = payload
+                    if self.__red_payload_type is not None:
+                        self.__wrap_red(packet, codec, len(payloads))
                     packet.marker = (i == len(payloads) - 1) and 1 or 0
 
                     # set header extensions
@@ -335,21 +584,35 @@ class RTCRtpSender:
                         clock.current_ntp_time() >> 14
                     ) & 0x00FFFFFF
                     packet.extensions.mid = self.__mid
+                    packet.extensions.frame_index = frame_index
+                    # set by the transport when the packet is sent
+                    packet.extensions.transport_sequence_number = 0
 
-                    # send packet
                     self.__log_debug("> RTP %s (encoded frame ts: %s) %s", packet, old_timestamp, 
                                     datetime.datetime.now())
-                    self.__rtp_history[
-                        packet.sequence_number % RTP_HISTORY_SIZE
-                    ] = packet
-                    packet_bytes = packet.serialize(self.__rtp_header_extensions_map)
-                    await self.transport._send_rtp(packet_bytes)
+                    # the packets of a frame carry the same header extensions, so
+                    # each one is written once into a buffer of its final size,
+                    # which the pacer and transport then update in place
+                    if header_length is None:
+                        header_length = packet.header_length(
+                            self.__rtp_header_extensions_map
+                        )
+                    packet_bytes = bytearray(header_length + len(packet.payload))
+                    packet.serialize_into(packet_bytes, self.__rtp_header_extensions_map)
+                    self.__rtp_history.add(packet.sequence_number, packet_bytes, time.time())
+                    self.__send_rate.add(len(packet_bytes), clock.current_ms())
+                    batch.append(packet_bytes)
 
-                    self.__ntp_timestamp = clock.current_ntp_time()
-                    self.__rtp_timestamp = packet.timestamp
-                    self.__octet_count += len(payload)
+                    self.__octet_count += len(packet.payload)
                     self.__packet_count += 1
                     sequence_number = uint16_add(sequence_number, 1)
+
+                # send packets
+                await self.__send_rtp_batch(
+                    batch, priority, prepare=self.__stamp_abs_send_time
+                )
+                self.__ntp_timestamp = clock.current_ntp_time()
+                self.__rtp_timestamp = timestamp
         except (asyncio.CancelledError, ConnectionError, MediaStreamError):
             pass
         except Exception:
@@ -357,10 +620,16 @@ class RTCRtpSender:
             # so issue a warning if we hit an unexpected exception
             self.__log_warning(traceback.format_exc())
 
+        # stop encoding
+        if self.__encode_pipeline is not None:
+            self.__capture_task.cancel()
+            self.__encode_pipeline.stop()
+
         # stop track
         if self.__track:
             self.__track.stop()
             self.__track = None
+        self.transport._pacer.set_bitrate(self._ssrc, None)
 
         self.__log_debug("- RTP finished")
         self.__rtp_exited.set()
@@ -435,6 +704,134 @@ class RTCRtpSender:
         except ConnectionError:
             pass
 
+    def _get_encoder_bitrate(self) -> Optional[int]:
+        """
+        Return the target bitrate of the encoder, if it has one which follows
+        the transport estimate.
+
+        The VPX encoders only apply the target bitrate they are given when
+        `enable_gcc` is set, otherwise they are rate controlled by the
+        quantizer and their sent bitrate is left to them.
+        """
+        if not self.__enable_gcc:
+            return None
+        return getattr(self.__encoder, "target_bitrate", None)
+
+    def _get_sent_bitrate(self, now_ms: int) -> int:
+        """
+        Return the bitrate sent over the last second.
+        """
+        return self.__send_rate.rate(now_ms) or 0
+
+    def _set_encoder_bitrate(self, bitrate: int) -> None:
+        """
+        Set the target bitrate of the encoder, as estimated by the transport.
+        """
+        if self.__encoder is not None and hasattr(self.__encoder, "target_bitrate"):
+            self.__log_debug("- transport estimated bitrate %d bps", bitrate)
+            self.__encoder.target_bitrate = bitrate
+
+    def __encode(self, frame) -> Tuple[List[bytes], int]:
+        # runs on an executor or encoder thread
+        with self.__keyframe_lock:
+            force_keyframe = self.__force_keyframe
+            self.__force_keyframe = False
+        self.__log_debug("encoding frame with force keyframe %s at time %s",
+                        force_keyframe, datetime.datetime.now())
+        start = time.perf_counter()
+        payloads, timestamp = self.__encoder.encode(
+            frame, force_keyframe, self.__quantizer, self.__target_bitrate, self.__enable_gcc
+        )
+        encode_time = time.perf_counter() - start
+
+        # the counters belong to the event loop, like the encoded frames
+        try:
+            self.__loop.call_soon_threadsafe(self.__count_encoded_frame, encode_time)
+        except RuntimeError:
+            # the event loop is closed
+            pass
+        return payloads, timestamp
+
+    def __count_encoded_frame(self, encode_time: float) -> None:
+        self.__frames_encoded += 1
+        self.__total_encode_time += encode_time
+
+    def __wrap_red(
+        self, packet: RtpPacket, codec: RTCRtpCodecParameters, count: int
+    ) -> None:
+        """
+        Add the payloads of the previous frames to a packet.
+
+        The receiver matches each redundant block to the packet sent that
+        many sequence numbers earlier, so only frames made of a single packet
+        are protected and the history is restarted by any other frame.
+        """
+        if count != 1:
+            self.__red_history.clear()
+            return
+
+        payload = bytes(packet.payload)
+        redundancy: List[Tuple[int, bytes]] = []
+        for timestamp, data in reversed(self.__red_history):
+            timestamp_offset = uint32_add(packet.timestamp, -timestamp)
+            if (
+                timestamp_offset > RED_MAX_TIMESTAMP_OFFSET
+                or len(data) > RED_MAX_BLOCK_LENGTH
+            ):
+                break
+            redundancy.insert(0, (timestamp_offset, data))
+
+        packet.payload_type = self.__red_payload_type
+        packet.payload = pack_red_payload(codec.payloadType, payload, redundancy)
+        self.__red_history.append((packet.timestamp, payload))
+
+    def __pacing_bitrate(self) -> int:
+        bitrate = getattr(self.__encoder, "target_bitrate", None)
+        return bitrate if bitrate else self.__target_bitrate
+
+    async def __run_capture(self) -> None:
+        try:
+            while True:
+                if not self.__track:
+                    await asyncio.sleep(0.02)
+                    continue
+
+                frame = await self.__track.recv()
+                dropped = self.__encode_pipeline.put(
+                    frame, self.__track.frame_index(frame)
+                )
+                if dropped:
+                    self.__log_debug("x encoder is behind, dropped %d frames", dropped)
+        except asyncio.CancelledError:
+            pass
+        except Exception as exc:
+            self.__encode_pipeline.close(exc)
+
+    async def __send_rtp(self, data: bytes, priority: int, prepare=None) -> None:
+        if paced_sending:
+            await self.transport._pacer.send(data, priority, prepare)
+        else:
+            if prepare is not None:
+                data = prepare(data)
+            await self.transport._send_rtp(data)
+
+    async def __send_rtp_batch(
+        self, packets: List[bytes], priority: int, prepare=None
+    ) -> None:
+        if paced_sending:
+            await self.transport._pacer.send_batch(packets, priority, prepare)
+        else:
+            if prepare is not None:
+                packets = [prepare(data) for data in packets]
+            await self.transport._send_rtp_batch(packets)
+
+    def __stamp_abs_send_time(self, data: bytearray) -> bytearray:
+        # packets delayed by the pacer carry the time they are actually sent
+        self.__rtp_header_extensions_map.set_abs_send_time(
+            data, (clock.current_ntp_time() >> 14) & 0x00FFFFFF
+        )
+        return data
+
     def __log_debug(self, msg: str, *args) -> None:
         logger.debug(f"RTCRtpSender(%s) {msg}", self.__kind, *args)
 
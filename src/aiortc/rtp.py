@@ -1,6 +1,7 @@
 import os
 from dataclasses import dataclass, field
-from struct import pack, unpack, unpack_from
+from struct import error as struct_error
+from struct import pack, pack_into, unpack, unpack_from
 from typing import Any, List, Optional, Tuple, Union
 
 from .rtcrtpparameters import RTCRtpParameters
@@ -23,17 +24,43 @@ RTCP_RTPFB = 205
 RTCP_PSFB = 206
 
 RTCP_RTPFB_NACK = 1
+RTCP_RTPFB_TRANSPORT_CC = 15
 
 RTCP_PSFB_PLI = 1
 RTCP_PSFB_SLI = 2
 RTCP_PSFB_RPSI = 3
 RTCP_PSFB_APP = 15
 
+# header extension carrying the application frame index of a video frame
+FRAME_INDEX_URI = "urn:aiortc:rtp-hdrext:frame-index"
+
+TRANSPORT_CC_URI = (
+    "http://www.ietf.org/id/draft-holmer-rmcat-transport-wide-cc-extensions-01"
+)
+
+# transport-cc packet status symbols
+TRANSPORT_CC_NOT_RECEIVED = 0
+TRANSPORT_CC_SMALL_DELTA = 1
+TRANSPORT_CC_LARGE_DELTA = 2
+
+# transport-cc receive deltas are expressed in multiples of 250us and the
+# reference time in multiples of 64ms
+TRANSPORT_CC_DELTA_US = 250
+TRANSPORT_CC_REFERENCE_US = 64000
+TRANSPORT_CC_MAX_DELTA = 0x7FFF
+TRANSPORT_CC_MIN_DELTA = -0x8000
+
+# redundant audio data blocks have a 14-bit timestamp offset and a 10-bit
+# length
+RED_MAX_TIMESTAMP_OFFSET = 0x3FFF
+RED_MAX_BLOCK_LENGTH = 0x3FF
+
 
 @dataclass
 class HeaderExtensions:
     abs_send_time: Optional[int] = None
     audio_level: Any = None
+    frame_index: Optional[int] = None
     mid: Any = None
     repaired_rtp_stream_id: Any = None
     rtp_stream_id: Any = None
@@ -61,11 +88,10 @@ class HeaderExtensionsMap:
                 self.__ids.transmission_offset = ext.id
             elif ext.uri == "urn:ietf:params:rtp-hdrext:ssrc-audio-level":
                 self.__ids.audio_level = ext.id
-            elif (
-                ext.uri
-                == "http://www.ietf.org/id/draft-holmer-rmcat-transport-wide-cc-extensions-01"
-            ):
+            elif ext.uri == TRANSPORT_CC_URI:
                 self.__ids.transport_sequence_number = ext.id
+            elif ext.uri == FRAME_INDEX_URI:
+                self.__ids.frame_index = ext.id
 
     def get(self, extension_profile: int, extension_value: bytes) -> HeaderExtensions:
         values = HeaderExtensions()
@@ -87,6 +113,8 @@ class HeaderExtensionsMap:
                 values.audio_level = (vad_level & 0x80 == 0x80, vad_level & 0x7F)
             elif x_id == self.__ids.transport_sequence_number:
                 values.transport_sequence_number = unpack("!H", x_value)[0]
+            elif x_id == self.__ids.frame_index:
+                values.frame_index = unpack("!L", x_value)[0]
         return values
 
     def set(self, values: HeaderExtensions):
@@ -139,8 +167,48 @@ class HeaderExtensionsMap:
                     pack("!H", values.transport_sequence_number),
                 )
             )
+        if values.frame_index is not None and self.__ids.frame_index:
+            extensions.append(
+                (self.__ids.frame_index, pack("!L", values.frame_index & 0xFFFFFFFF))
+            )
         return pack_header_extensions(extensions)
 
+    def set_abs_send_time(self, data: bytearray, abs_send_time: int) -> bool:
+        """
+        Set the abs-send-time header extension of the serialized packet
+        `data` to `abs_send_time` in place, and return whether it has one.
+        """
+        pos = find_header_extension(data, self.__ids.abs_send_time)
+        if pos is None:
+            return False
+        pack_into("!BH", data, pos, (abs_send_time >> 16) & 0xFF, abs_send_time & 0xFFFF)
+        return True
+
+    def get_transport_sequence_number(self, data: bytes) -> Optional[int]:
+        """
+        Return the transport-wide sequence number of the serialized packet
+        `data` without parsing its other header extensions, or `None` if
+        transport-cc was not negotiated or the packet does not carry it.
+        """
+        pos = find_header_extension(data, self.__ids.transport_sequence_number)
+        if pos is None or pos + 2 > len(data):
+            return None
+        return unpack_from("!H", data, pos)[0]
+
+    def set_transport_sequence_number(
+        self, data: bytearray, sequence_number: int
+    ) -> bool:
+        """
+        Set the transport-wide sequence number header extension of the
+        serialized packet `data` to `sequence_number` in place, and return
+        whether it has one.
+        """
+        pos = find_header_extension(data, self.__ids.transport_sequence_number)
+        if pos is None:
+            return False
+        pack_into("!H", data, pos, sequence_number)
+        return True
+
 
 def clamp_packets_lost(count: int) -> int:
     return max(PACKETS_LOST_MIN, min(count, PACKETS_LOST_MAX))
@@ -205,6 +273,195 @@ def unpack_remb_fci(data: bytes) -> Tuple[int, List[int]]:
     return (bitrate, ssrcs)
 
 
+def pack_transport_cc_fci(
+    base_sequence_number: int,
+    feedback_count: int,
+    arrival_times: List[Optional[int]],
+) -> bytes:
+    """
+    Pack the FCI for a transport-wide congestion control feedback.
+
+    `arrival_times` holds the arrival time in microseconds of each packet
+    starting at `base_sequence_number`, or `None` for the packets which
+    were not received.
+
+    https://tools.ietf.org/html/draft-holmer-rmcat-transport-wide-cc-extensions-01
+    """
+    first = next((x for x in arrival_times if x is not None), 0)
+    reference_time = first // TRANSPORT_CC_REFERENCE_US
+    previous = reference_time * TRANSPORT_CC_REFERENCE_US
+
+    # work out the status and receive delta of each packet
+    symbols = []
+    deltas = b""
+    for arrival_time in arrival_times:
+        if arrival_time is None:
+            symbols.append(TRANSPORT_CC_NOT_RECEIVED)
+            continue
+
+        delta = round((arrival_time - previous) / TRANSPORT_CC_DELTA_US)
+        if delta < TRANSPORT_CC_MIN_DELTA or delta > TRANSPORT_CC_MAX_DELTA:
+            raise ValueError("Transport-cc receive delta is out of range")
+        if 0 <= delta <= 0xFF:
+            symbols.append(TRANSPORT_CC_SMALL_DELTA)
+            deltas += pack("!B", delta)
+        else:
+            symbols.append(TRANSPORT_CC_LARGE_DELTA)
+            deltas += pack("!h", delta)
+        previous += delta * TRANSPORT_CC_DELTA_US
+
+    # runs of identical statuses use run length chunks, others use
+    # status vector chunks of seven two-bit symbols
+    chunks = b""
+    pos = 0
+    while pos < len(symbols):
+        run = 1
+        while (
+            pos + run < len(symbols)
+            and run < 0x1FFF
+            and symbols[pos + run] == symbols[pos]
+        ):
+            run += 1
+        if run >= 7:
+            chunks += pack("!H", (symbols[pos] << 13) | run)
+            pos += run
+        else:
+            chunk = 0xC000
+            for i, symbol in enumerate(symbols[pos : pos + 7]):
+                chunk |= symbol << (2 * (6 - i))
+            chunks += pack("!H", chunk)
+            pos += 7
+
+    data = pack(
+        "!HHL",
+        base_sequence_number,
+        len(symbols),
+        ((reference_time & 0xFFFFFF) << 8) | (feedback_count & 0xFF),
+    )
+    data += chunks + deltas
+    return data + b"\x00" * padl(len(data))
+
+
+def unpack_transport_cc_fci(
+    data: bytes,
+) -> Tuple[int, int, List[Tuple[int, Optional[int]]]]:
+    """
+    Unpack the FCI for a transport-wide congestion control feedback.
+
+    Returns the base sequence number, the feedback packet count and the
+    sequence number and arrival time in microseconds of each packet, the
+    arrival time being `None` for the packets which were not received.
+
+    https://tools.ietf.org/html/draft-holmer-rmcat-transport-wide-cc-extensions-01
+    """
+    if len(data) < 8:
+        raise ValueError("Transport-cc feedback length is invalid")
+
+    base_sequence_number, status_count, word = unpack_from("!HHL", data, 0)
+    reference_time = word >> 8
+    if reference_time & 0x800000:
+        reference_time -= 0x1000000
+    feedback_count = word & 0xFF
+
+    # read packet status chunks
+    pos = 8
+    symbols: List[int] = []
+    while len(symbols) < status_count:
+        if len(data) < pos + 2:
+            raise ValueError("Transport-cc packet status chunk is truncated")
+        chunk = unpack_from("!H", data, pos)[0]
+        pos += 2
+        if not chunk & 0x8000:
+            symbols += [(chunk >> 13) & 0x03] * (chunk & 0x1FFF)
+        elif not chunk & 0x4000:
+            symbols += [(chunk >> (13 - i)) & 0x01 for i in range(14)]
+        else:
+            symbols += [(chunk >> (2 * (6 - i))) & 0x03 for i in range(7)]
+    del symbols[status_count:]
+
+    # read receive deltas
+    arrival_time = reference_time * TRANSPORT_CC_REFERENCE_US
+    packets: List[Tuple[int, Optional[int]]] = []
+    for i, symbol in enumerate(symbols):
+        sequence_number = (base_sequence_number + i) & 0xFFFF
+        if symbol == TRANSPORT_CC_SMALL_DELTA:
+            if len(data) < pos + 1:
+                raise ValueError("Transport-cc receive delta is truncated")
+            arrival_time += data[pos] * TRANSPORT_CC_DELTA_US
+            pos += 1
+        elif symbol == TRANSPORT_CC_LARGE_DELTA:
+            if len(data) < pos + 2:
+                raise ValueError("Transport-cc receive delta is truncated")
+            arrival_time += unpack_from("!h", data, pos)[0] * TRANSPORT_CC_DELTA_US
+            pos += 2
+        else:
+            packets.append((sequence_number, None))
+            continue
+        packets.append((sequence_number, arrival_time))
+
+    return (base_sequence_number, feedback_count, packets)
+
+
+def pack_red_payload(
+    payload_type: int, payload: bytes, redundancy: List[Tuple[int, bytes]]
+) -> bytes:
+    """
+    Pack a primary payload and the redundant payloads of previous frames,
+    given from oldest to newest with their timestamp offset, into a
+    redundant payload.
+
+    https://tools.ietf.org/html/rfc2198
+    """
+    headers = []
+    for timestamp_offset, data in redundancy:
+        if timestamp_offset > RED_MAX_TIMESTAMP_OFFSET:
+            raise ValueError("Redundant block timestamp offset is too large")
+        if len(data) > RED_MAX_BLOCK_LENGTH:
+            raise ValueError("Redundant block is too long")
+        headers.append(
+            pack(
+                "!L",
+                ((0x80 | payload_type) << 24) | (timestamp_offset << 10) | len(data),
+            )
+        )
+    headers.append(pack("!B", payload_type))
+    return b"".join(headers + [bytes(data) for _, data in redundancy] + [payload])
+
+
+def unpack_red_payload(data: bytes) -> List[Tuple[int, int, bytes]]:
+    """
+    Unpack a redundant payload into the payload type, timestamp offset and
+    data of its blocks, from oldest to newest, the last block being the
+    primary payload.
+
+    https://tools.ietf.org/html/rfc2198
+    """
+    headers = []
+    pos = 0
+    while True:
+        if len(data) < pos + 1:
+            raise ValueError("RED header is truncated")
+        if not data[pos] & 0x80:
+            headers.append((data[pos], 0, None))
+            pos += 1
+            break
+
+        if len(data) < pos + 4:
+            raise ValueError("RED header is truncated")
+        word = unpack_from("!L", data, pos)[0]
+        headers.append(((word >> 24) & 0x7F, (word >> 10) & 0x3FFF, word & 0x3FF))
+        pos += 4
+
+    blocks = []
+    for payload_type, timestamp_offset, length in headers:
+        end = len(data) if length is None else pos + length
+        if end > len(data):
+            raise ValueError("RED block is truncated")
+        blocks.append((payload_type, timestamp_offset, data[pos:end]))
+        pos = end
+    return blocks
+
+
 def is_rtcp(msg: bytes) -> bool:
     return len(msg) >= 2 and msg[1] >= 192 and msg[1] <= 208
 
@@ -264,6 +521,76 @@ def unpack_header_extensions(
     return extensions
 
 
+def scan_header_extensions(
+    data: bytes, pos: int, x_id: Optional[int] = None
+) -> Optional[int]:
+    """
+    Walk the header extension block starting at `pos` in the serialized RTP
+    packet `data` without decoding the values.
+
+    Return the position of the value of header extension `x_id`, or `None`
+    if it is not present. Raise :class:`ValueError` if the block is
+    truncated.
+    """
+    if len(data) < pos + 4:
+        raise ValueError("RTP packet has truncated extension profile / length")
+    extension_profile, extension_length = unpack_from("!HH", data, pos)
+    pos += 4
+    end = pos + 4 * extension_length
+    if len(data) < end:
+        raise ValueError("RTP packet has truncated extension value")
+
+    if extension_profile == 0xBEDE:
+        while pos < end:
+            # skip padding byte
+            if data[pos] == 0:
+                pos += 1
+                continue
+
+            ext_id = data[pos] >> 4
+            ext_length = (data[pos] & 0x0F) + 1
+            pos += 1
+            if end < pos + ext_length:
+                raise ValueError("RTP one-byte header extension value is truncated")
+            if ext_id == x_id:
+                return pos
+            pos += ext_length
+    elif extension_profile == 0x1000:
+        while pos < end:
+            # skip padding byte
+            if data[pos] == 0:
+                pos += 1
+                continue
+
+            if end < pos + 2:
+                raise ValueError("RTP two-byte header extension is truncated")
+            ext_id, ext_length = data[pos], data[pos + 1]
+            pos += 2
+            if end < pos + ext_length:
+                raise ValueError("RTP two-byte header extension value is truncated")
+            if ext_id == x_id:
+                return pos
+            pos += ext_length
+    return None
+
+
+def find_header_extension(data: bytes, x_id: Optional[int]) -> Optional[int]:
+    """
+    Return the position of the value of header extension `x_id` in the
+    serialized RTP packet `data`, or `None` if it is not present or the
+    header extensions are malformed.
+    """
+    if not x_id or len(data) < RTP_HEADER_LENGTH or not (data[0] >> 4) & 1:
+        return None
+
+    try:
+        return scan_header_extensions(
+            data, RTP_HEADER_LENGTH + 4 * (data[0] & 0x0F), x_id
+        )
+    except ValueError:
+        return None
+
+
 def pack_header_extensions(extensions: List[Tuple[int, bytes]]) -> Tuple[int, bytes]:
     """
     Serialize header extensions according to RFC 5285.
@@ -450,8 +777,11 @@ class RtcpRtpfbPacket:
     # generick NACK
     lost: List[int] = field(default_factory=list)
 
+    # other feedback, such as transport-cc
+    fci: bytes = b""
+
     def __bytes__(self) -> bytes:
-        payload = pack("!LL", self.ssrc, self.media_ssrc)
+        payload = pack("!LL", self.ssrc, self.media_ssrc) + self.fci
         if self.lost:
             pid = self.lost[0]
             blp = 0
@@ -472,6 +802,9 @@ class RtcpRtpfbPacket:
             raise ValueError("RTCP RTP feedback length is invalid")
 
         ssrc, media_ssrc = unpack("!LL", data[0:8])
+        if fmt != RTCP_RTPFB_NACK:
+            return cls(fmt=fmt, ssrc=ssrc, media_ssrc=media_ssrc, fci=data[8:])
+
         lost = []
         for pos in range(8, len(data), 4):
             pid, blp = unpack("!HH", data[pos : pos + 4])
@@ -609,7 +942,69 @@ class RtcpPacket:
         return packets
 
 
+class RtpPayload:
+    """
+    An RTP payload made of a short header, such as a payload descriptor,
+    followed by a slice of an encoded frame.
+
+    The slice is a view on the encoder's buffer, so packetizing a frame does
+    not copy it; the payload is only copied when the packet is serialized.
+    """
+
+    __slots__ = ("header", "data")
+
+    def __init__(self, header: bytes, data: memoryview) -> None:
+        self.header = header
+        self.data = data
+
+    def __bytes__(self) -> bytes:
+        return self.header + self.data
+
+    def __len__(self) -> int:
+        return len(self.header) + len(self.data)
+
+    def __repr__(self) -> str:
+        return f"RtpPayload({len(self)} bytes)"
+
+    def write_into(self, buffer: bytearray, offset: int) -> int:
+        """
+        Write the payload into `buffer` at `offset` and return its length.
+        """
+        header_end = offset + len(self.header)
+        end = header_end + len(self.data)
+        buffer[offset:header_end] = self.header
+        buffer[header_end:end] = self.data
+        return end - offset
+
+
 class RtpPacket:
+    """
+    An RTP packet.
+
+    A parsed packet keeps a view on the datagram it was parsed from: the
+    fixed header is decoded straight away, while the CSRC list, the header
+    extensions and the payload are only decoded when they are accessed.
+    """
+
+    __slots__ = (
+        "version",
+        "marker",
+        "payload_type",
+        "sequence_number",
+        "timestamp",
+        "ssrc",
+        "padding_size",
+        "_csrc",
+        "_extensions",
+        "_payload",
+        "_data",
+        "_buffer",
+        "_extension_pos",
+        "_extensions_map",
+        "_payload_start",
+        "_payload_end",
+    )
+
     def __init__(
         self,
         payload_type: int = 0,
@@ -617,7 +1012,7 @@ class RtpPacket:
         sequence_number: int = 0,
         timestamp: int = 0,
         ssrc: int = 0,
-        payload: bytes = b"",
+        payload: Union[bytes, RtpPayload] = b"",
     ) -> None:
         self.version = 2
         self.marker = marker
@@ -625,10 +1020,11 @@ class RtpPacket:
         self.sequence_number = sequence_number
         self.timestamp = timestamp
         self.ssrc = ssrc
-        self.csrc: List[int] = []
-        self.extensions = HeaderExtensions()
-        self.payload = payload
         self.padding_size = 0
+        self._csrc: Optional[List[int]] = None
+        self._extensions: Optional[HeaderExtensions] = None
+        self._payload: Optional[Union[bytes, RtpPayload]] = payload
+        self._buffer: Optional[memoryview] = None
 
     def __repr__(self) -> str:
         return (
@@ -636,6 +1032,65 @@ class RtpPacket:
             f"marker={self.marker}, payload={self.payload_type}, {len(self.payload)} bytes)"
         )
 
+    @property
+    def csrc(self) -> List[int]:
+        if self._csrc is None:
+            if self._buffer is None:
+                self._csrc = []
+            else:
+                cc = self._buffer[0] & 0x0F
+                self._csrc = list(
+                    unpack_from("!%dL" % cc, self._buffer, RTP_HEADER_LENGTH)
+                )
+        return self._csrc
+
+    @csrc.setter
+    def csrc(self, csrc: List[int]) -> None:
+        self._csrc = csrc
+
+    @property
+    def extensions(self) -> HeaderExtensions:
+        """
+        The header extensions, decoded on first access.
+
+        For a parsed packet this raises :class:`ValueError` if a header
+        extension value cannot be decoded.
+        """
+        if self._extensions is None:
+            if self._buffer is None or self._extension_pos is None:
+                self._extensions = HeaderExtensions()
+            else:
+                pos = self._extension_pos
+                extension_profile, extension_length = unpack_from(
+                    "!HH", self._buffer, pos
+                )
+                extension_value = bytes(
+                    self._buffer[pos + 4 : pos + 4 + 4 * extension_length]
+                )
+                try:
+                    self._extensions = self._extensions_map.get(
+                        extension_profile, extension_value
+                    )
+                except struct_error as exc:
+                    raise ValueError(
+                        f"RTP header extension value is invalid: {exc}"
+                    ) from exc
+        return self._extensions
+
+    @extensions.setter
+    def extensions(self, extensions: HeaderExtensions) -> None:
+        self._extensions = extensions
+
+    @property
+    def payload(self) -> Union[bytes, RtpPayload]:
+        if self._payload is None:
+            self._payload = bytes(self._buffer[self._payload_start : self._payload_end])
+        return self._payload
+
+    @payload.setter
+    def payload(self, payload: Union[bytes, RtpPayload]) -> None:
+        self._payload = payload
+
     @classmethod
     def parse(cls, data: bytes, extensions_map=HeaderExtensionsMap()):
         if len(data) < RTP_HEADER_LENGTH:
@@ -643,7 +1098,7 @@ class RtpPacket:
                 f"RTP packet length is less than {RTP_HEADER_LENGTH} bytes"
             )
 
-        v_p_x_cc, m_pt, sequence_number, timestamp, ssrc = unpack("!BBHLL", data[0:12])
+        v_p_x_cc, m_pt, sequence_number, timestamp, ssrc = unpack_from("!BBHLL", data)
         version = v_p_x_cc >> 6
         padding = (v_p_x_cc >> 5) & 1
         extension = (v_p_x_cc >> 4) & 1
@@ -661,61 +1116,108 @@ class RtpPacket:
             ssrc=ssrc,
         )
 
-        pos = RTP_HEADER_LENGTH
-        for i in range(0, cc):
-            packet.csrc.append(unpack_from("!L", data, pos)[0])
-            pos += 4
-
+        pos = RTP_HEADER_LENGTH + 4 * cc
+        extension_pos = None
         if extension:
-            if len(data) < pos + 4:
-                raise ValueError("RTP packet has truncated extension profile / length")
-            extension_profile, extension_length = unpack_from("!HH", data, pos)
-            extension_length *= 4
-            pos += 4
-
-            if len(data) < pos + extension_length:
-                raise ValueError("RTP packet has truncated extension value")
-            extension_value = data[pos : pos + extension_length]
-            pos += extension_length
-            packet.extensions = extensions_map.get(extension_profile, extension_value)
-
+            # check the structure of the header extensions, their values are
+            # only decoded when they are accessed
+            scan_header_extensions(data, pos)
+            extension_length = unpack_from("!H", data, pos + 2)[0] * 4
+            extension_pos = pos
+            pos += 4 + extension_length
+
+        end = len(data)
         if padding:
             padding_len = data[-1]
             if not padding_len or padding_len > len(data) - pos:
                 raise ValueError("RTP packet padding length is invalid")
             packet.padding_size = padding_len
-            packet.payload = data[pos:-padding_len]
-        else:
-            packet.payload = data[pos:]
-
+            end -= padding_len
+
+        packet._buffer = memoryview(data)
+        packet._extension_pos = extension_pos
+        packet._extensions_map = extensions_map
+        packet._payload = None
+        packet._payload_start = pos
+        packet._payload_end = end
         return packet
 
+    def header_length(self, extensions_map=HeaderExtensionsMap()) -> int:
+        """
+        Return the length of the serialized packet without its payload and
+        padding, that is the fixed header, CSRC list and header extensions.
+        """
+        return self.__serialized_length(extensions_map.set(self.extensions)[1]) - (
+            len(self.payload) + self.padding_size
+        )
+
     def serialize(self, extensions_map=HeaderExtensionsMap()) -> bytes:
-        extension_profile, extension_value = extensions_map.set(self.extensions)
+        extension = extensions_map.set(self.extensions)
+        data = bytearray(self.__serialized_length(extension[1]))
+        self.__write(data, extension)
+        return bytes(data)
+
+    def serialize_into(
+        self, buffer: bytearray, extensions_map=HeaderExtensionsMap()
+    ) -> int:
+        """
+        Write the packet at the start of `buffer` and return its length.
+
+        :param buffer: A writable buffer, such as a :class:`bytearray`.
+        """
+        extension = extensions_map.set(self.extensions)
+        length = self.__serialized_length(extension[1])
+        if len(buffer) < length:
+            raise ValueError("RTP packet does not fit in the buffer")
+        self.__write(buffer, extension)
+        return length
+
+    def __serialized_length(self, extension_value: bytes) -> int:
+        length = (
+            RTP_HEADER_LENGTH
+            + 4 * len(self.csrc)
+            + len(self.payload)
+            + self.padding_size
+        )
+        if extension_value:
+            length += 4 + len(extension_value)
+        return length
+
+    def __write(self, buffer: bytearray, extension: Tuple[int, bytes]) -> None:
+        extension_profile, extension_value = extension
         has_extension = bool(extension_value)
+        csrc = self.csrc
 
         padding = self.padding_size > 0
-        data = pack(
+        pack_into(
             "!BBHLL",
-            (self.version << 6)
-            | (padding << 5)
-            | (has_extension << 4)
-            | len(self.csrc),
+            buffer,
+            0,
+            (self.version << 6) | (padding << 5) | (has_extension << 4) | len(csrc),
             (self.marker << 7) | self.payload_type,
             self.sequence_number,
             self.timestamp,
             self.ssrc,
         )
-        for csrc in self.csrc:
-            data += pack("!L", csrc)
+        pos = RTP_HEADER_LENGTH
+        if csrc:
+            pack_into("!%dL" % len(csrc), buffer, pos, *csrc)
+            pos += 4 * len(csrc)
         if has_extension:
-            data += pack("!HH", extension_profile, len(extension_value) >> 2)
-            data += extension_value
-        data += self.payload
+            pack_into("!HH", buffer, pos, extension_profile, len(extension_value) >> 2)
+            pos += 4
+            buffer[pos : pos + len(extension_value)] = extension_value
+            pos += len(extension_value)
+
+        payload = self.payload
+        if isinstance(payload, RtpPayload):
+            pos += payload.write_into(buffer, pos)
+        else:
+            buffer[pos : pos + len(payload)] = payload
+            pos += len(payload)
         if padding:
-            data += os.urandom(self.padding_size - 1)
-            data += bytes([self.padding_size])
-        return data
+            buffer[pos : pos + self.padding_size - 1] = os.urandom(self.padding_size - 1)
+            buffer[pos + self.padding_size - 1] = self.padding_size
 
 
 def unwrap_rtx(rtx: RtpPacket, payload_type: int, ssrc: int) -> RtpPacket:
@@ -747,8 +1249,35 @@ def wrap_rtx(
         sequence_number=sequence_number,
         timestamp=packet.timestamp,
         ssrc=ssrc,
-        payload=pack("!H", packet.sequence_number) + packet.payload,
+        payload=pack("!H", packet.sequence_number) + bytes(packet.payload),
     )
     rtx.csrc = packet.csrc
     rtx.extensions = packet.extensions
     return rtx
+
+
+def wrap_rtx_data(data: bytes, payload_type: int, sequence_number: int, ssrc: int) -> bytearray:
+    """
+    Create a serialized retransmission packet from a serialized lost packet,
+    without parsing its header extensions or payload.
+
+    The result is a :class:`bytearray` so its header extensions can still be
+    updated in place before it is sent.
+    """
+    v_p_x_cc, m_pt, original_sequence_number = unpack_from("!BBH", data)
+    pos = RTP_HEADER_LENGTH + 4 * (v_p_x_cc & 0x0F)
+    if (v_p_x_cc >> 4) & 1:
+        pos += 4 + 4 * unpack_from("!H", data, pos + 2)[0]
+    end = len(data) - data[-1] if (v_p_x_cc >> 5) & 1 else len(data)
+
+    # the padding is not retransmitted
+    return bytearray().join(
+        [
+            pack("!BBH", v_p_x_cc & 0xDF, (m_pt & 0x80) | payload_type, sequence_number),
+            data[4:8],
+            pack("!L", ssrc),
+            data[RTP_HEADER_LENGTH:pos],
+            pack("!H", original_sequence_number),
+            data[pos:end],
+        ]
+    )
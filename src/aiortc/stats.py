@@ -44,7 +44,24 @@ class RTCInboundRtpStreamStats(RTCReceivedRtpStreamStats):
     metrics for the incoming RTP media stream.
     """
 
-    pass
+    jitterBufferDelay: Optional[float] = None
+    "Delay in milliseconds of the last frame released by the jitter buffer."
+    jitterBufferTargetDelay: Optional[float] = None
+    "Target playout delay in milliseconds of the jitter buffer."
+    framesDropped: Optional[int] = None
+    "Number of frames abandoned by the jitter buffer after missing their deadline."
+    decoderQueueDepth: Optional[int] = None
+    "Number of encoded frames waiting for the decoder."
+    decoderQueueMaxDepth: Optional[int] = None
+    "Highest number of encoded frames which waited for the decoder."
+    decoderFramesDropped: Optional[int] = None
+    "Number of encoded frames dropped because the decoder fell behind."
+    packetsRecovered: Optional[int] = None
+    "Number of lost packets recovered from the redundant blocks of later packets."
+    trackQueueDepth: Optional[int] = None
+    "Number of decoded frames waiting to be read from the track."
+    trackFramesDropped: Optional[int] = None
+    "Number of decoded frames dropped because the track was not read in time."
 
 
 @dataclass
@@ -66,6 +83,28 @@ class RTCOutboundRtpStreamStats(RTCSentRtpStreamStats):
     """
 
     trackId: str
+    nackCount: Optional[int] = None
+    "Number of NACK packets received."
+    retransmittedPacketsSent: Optional[int] = None
+    "Number of packets retransmitted."
+    retransmittedBytesSent: Optional[int] = None
+    "Number of bytes retransmitted, including headers."
+    retransmissionsDeduplicated: Optional[int] = None
+    "Number of requests ignored as the packet was retransmitted within one round-trip time."
+    retransmissionsMissed: Optional[int] = None
+    "Number of requests for packets no longer in the retransmission history."
+    rtpHistoryPackets: Optional[int] = None
+    "Number of packets in the retransmission history."
+    rtpHistoryBytes: Optional[int] = None
+    "Size in bytes of the retransmission history."
+    framesEncoded: Optional[int] = None
+    "Number of frames encoded."
+    totalEncodeTime: Optional[float] = None
+    "Total time in seconds spent encoding frames."
+    encoderQueueDepth: Optional[int] = None
+    "Number of frames waiting for the encoder thread."
+    encoderFramesDropped: Optional[int] = None
+    "Number of frames dropped because the encoder thread fell behind."
 
 
 @dataclass
@@ -92,6 +131,8 @@ class RTCTransportStats(RTCStats):
     "The current value of :attr:`RTCIceTransport.role`."
     dtlsState: str
     "The current value of :attr:`RTCDtlsTransport.state`."
+    srtpCipher: Optional[str] = None
+    "The SRTP protection profile negotiated by DTLS-SRTP."
 
 
 class RTCStatsReport(dict):
@@ -1,5 +1,8 @@
 import os
+import threading
+from collections import deque
 from struct import unpack
+from typing import Deque, Optional
 
 
 def random16() -> int:
@@ -52,3 +55,59 @@ def uint32_gte(a: int, b: int) -> bool:
     Return a >= b.
     """
     return (a == b) or uint32_gt(a, b)
+
+
+class DropOldestQueue:
+    """
+    A bounded queue of frames handed over between threads.
+
+    When the consumer falls behind, the oldest frames are dropped instead of
+    letting latency build up. `None` marks the end and is never dropped.
+
+    :param maxsize: The maximum number of queued frames, or `None` to never
+                    drop frames.
+    """
+
+    EMPTY = object()
+
+    def __init__(self, maxsize: Optional[int]) -> None:
+        self._condition = threading.Condition()
+        self._items: Deque = deque()
+        self._maxsize = maxsize
+        self.dropped = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    def put(self, item) -> int:
+        """
+        Queue an item and return the number of frames dropped to make room.
+        """
+        dropped = 0
+        with self._condition:
+            if item is not None and self._maxsize is not None:
+                while len(self._items) >= self._maxsize and self._items[0] is not None:
+                    self._items.popleft()
+                    dropped += 1
+                self.dropped += dropped
+            self._items.append(item)
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._condition.notify()
+        return dropped
+
+    def get(self):
+        with self._condition:
+            while not self._items:
+                self._condition.wait()
+            return self._items.popleft()
+
+    def get_nowait(self):
+        """
+        Return the next item, or :attr:`EMPTY` if there is none.
+        """
+        with self._condition:
+            if not self._items:
+                return self.EMPTY
+            return self._items.popleft()
@@ -0,0 +1,105 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from aiortc.contrib.framewriter import FrameWriter, load_frames
+
+
+class FrameWriterTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.save_dir = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_frames(self, count, shape=(4, 6, 3)):
+        rng = np.random.default_rng(1234)
+        return [rng.integers(0, 256, shape, dtype=np.uint8) for i in range(count)]
+
+    def test_save(self):
+        frames = self.create_frames(7)
+        writer = FrameWriter(self.save_dir, chunk_size=3)
+        for i, frame in enumerate(frames):
+            writer.save("sender_frame", i, frame)
+        writer.close()
+
+        self.assertEqual(
+            sorted(os.listdir(self.save_dir)),
+            [
+                "sender_frame_00000.npy",
+                "sender_frame_00001.npy",
+                "sender_frame_00002.npy",
+                "sender_frame_index.txt",
+            ],
+        )
+        chunk = np.load(os.path.join(self.save_dir, "sender_frame_00000.npy"))
+        self.assertEqual(chunk.shape, (3, 4, 6, 3))
+
+        loaded = load_frames(self.save_dir, "sender_frame")
+        self.assertEqual(sorted(loaded.keys()), list(range(7)))
+        for i, frame in enumerate(frames):
+            np.testing.assert_array_equal(loaded[i], frame)
+
+    def test_save_compressed(self):
+        frames = self.create_frames(4)
+        writer = FrameWriter(self.save_dir, chunk_size=3, compress=True)
+        for i, frame in enumerate(frames):
+            writer.save("predicted_frame", 10 + i, frame)
+        writer.close()
+
+        self.assertIn("predicted_frame_00000.npz", os.listdir(self.save_dir))
+        loaded = load_frames(self.save_dir, "predicted_frame")
+        for i, frame in enumerate(frames):
+            np.testing.assert_array_equal(loaded[10 + i], frame)
+
+    def test_save_shape_change(self):
+        small = self.create_frames(2, shape=(2, 2, 3))
+        large = self.create_frames(2, shape=(4, 4, 3))
+        writer = FrameWriter(self.save_dir)
+        writer.save("receiver_frame", 0, small[0])
+        writer.save("receiver_frame", 1, small[1])
+        writer.save("receiver_frame", 2, large[0])
+        writer.save("receiver_frame", 3, large[1])
+        writer.close()
+
+        loaded = load_frames(self.save_dir, "receiver_frame")
+        np.testing.assert_array_equal(loaded[1], small[1])
+        np.testing.assert_array_equal(loaded[3], large[1])
+
+    def test_log(self):
+        writer = FrameWriter(self.save_dir)
+        writer.log("send_times.txt", "Sent 0 at 1\n")
+        writer.log("send_times.txt", "Sent 1 at 2\n")
+        writer.close()
+
+        # writing after close is ignored
+        writer.log("send_times.txt", "Sent 2 at 3\n")
+        self.assertEqual(writer.pending, 0)
+
+        with open(os.path.join(self.save_dir, "send_times.txt")) as fp:
+            self.assertEqual(fp.read(), "Sent 0 at 1\nSent 1 at 2\n")
+
+    def test_save_without_index(self):
+        frames = self.create_frames(2)
+        writer = FrameWriter(self.save_dir)
+        writer.save("receiver_frame", None, frames[0])
+        writer.save("receiver_frame", 1, frames[1])
+        writer.close()
+
+        loaded = load_frames(self.save_dir, "receiver_frame")
+        self.assertEqual(list(loaded.keys()), [1])
+
+    def test_save_error(self):
+        frames = self.create_frames(1)
+        writer = FrameWriter(self.save_dir)
+        with self.assertLogs("aiortc.contrib.framewriter", level="WARNING"):
+            writer.save("receiver_frame", 0, "not a frame")
+            writer.save("receiver_frame", 1, frames[0])
+            writer.close()
+
+        # the other frames are still written
+        loaded = load_frames(self.save_dir, "receiver_frame")
+        self.assertEqual(list(loaded.keys()), [1])
@@ -1,13 +1,16 @@
 import asyncio
+import concurrent.futures
 import errno
 import os
 import tempfile
 import wave
 from unittest import TestCase
-from unittest.mock import patch
+import sys
+from unittest.mock import MagicMock, patch
 
 import av
 
+from aiortc.contrib import media
 from aiortc.contrib.media import MediaBlackhole, MediaPlayer, MediaRecorder, MediaRelay
 from aiortc.mediastreams import AudioStreamTrack, MediaStreamError, VideoStreamTrack
 
@@ -362,6 +365,21 @@ class MediaPlayerTest(MediaTestCase):
         self.assertEqual(player.video.readyState, "ended")
 
 
+class StampedVideoStreamTrack(VideoStreamTrack):
+    """
+    A video track whose frames carry their index as a barcode only.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.counter = 0
+
+    async def recv(self):
+        frame = await super().recv()
+        self.counter += 1
+        return media.stamp_frame(frame, self.counter, frame.pts, frame.time_base)
+
+
 class MediaRecorderTest(MediaTestCase):
     def test_audio_mp3(self):
         path = self.temporary_path("test.mp3")
@@ -467,3 +485,247 @@ class MediaRecorderTest(MediaTestCase):
         )
         self.assertEqual(container.streams[0].width, 640)
         self.assertEqual(container.streams[0].height, 480)
+
+    def test_video_mp4_stamped_without_frame_index(self):
+        """
+        Record stamped frames from a track which does not know their index,
+        as when the frame index header extension was not negotiated.
+        """
+        path = self.temporary_path("test.mp4")
+        recorder = MediaRecorder(path)
+        recorder.addTrack(StampedVideoStreamTrack())
+        run(recorder.start())
+        run(asyncio.sleep(2))
+        run(recorder.stop())
+
+        # the barcode was removed
+        container = av.open(path, "r")
+        self.assertEqual(len(container.streams), 1)
+        self.assertGreater(
+            float(container.streams[0].duration * container.streams[0].time_base), 0
+        )
+        self.assertEqual(container.streams[0].width, 640)
+        self.assertEqual(container.streams[0].height, 480)
+
+
+class ModelRegistryTest(TestCase):
+    def setUp(self):
+        self.model_class = MagicMock()
+        self.model_class.return_value.get_shape.return_value = (4, 4, 3)
+        self.model_class.return_value.extract_keypoints.return_value = ({}, 0)
+        self.configs = {
+            "frame_shape": (4, 4, 3),
+            "generator_type": "occlusion_aware",
+            "use_lr_video": False,
+            "lr_size": 4,
+        }
+        fom_wrapper = MagicMock(FirstOrderModel=self.model_class)
+        self.get_main_config_params = MagicMock(return_value=self.configs)
+        fom_utils = MagicMock(get_main_config_params=self.get_main_config_params)
+        patchers = [
+            patch.dict(media._models, clear=True),
+            patch.dict(media._main_configs, clear=True),
+            patch.dict(
+                sys.modules,
+                {
+                    "first_order_model.fom_wrapper": fom_wrapper,
+                    "first_order_model.utils": fom_utils,
+                },
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_get_model_is_lazy_and_shared(self):
+        self.assertEqual(self.model_class.call_count, 0)
+
+        model = media.get_model("config.yaml", "checkpoint.tar")
+        self.assertIs(media.get_model("config.yaml", "checkpoint.tar"), model)
+        self.assertEqual(self.model_class.call_count, 1)
+
+        media.get_model("config.yaml", "other.tar")
+        self.assertEqual(self.model_class.call_count, 2)
+
+    def test_get_main_configs_is_lazy(self):
+        self.assertEqual(self.get_main_config_params.call_count, 0)
+        self.assertIs(media.get_main_configs("config.yaml"), self.configs)
+        self.assertIs(media.get_main_configs("config.yaml"), self.configs)
+        self.assertEqual(self.get_main_config_params.call_count, 1)
+
+    def test_recorder_resolves_model_lazily(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        recorder = MediaRecorder(
+            os.path.join(directory.name, "test.mp4"), enable_prediction=True
+        )
+        self.assertIsNotNone(recorder.inference_executor)
+        self.assertEqual(self.model_class.call_count, 0)
+        run(recorder.stop())
+
+    def test_get_model_without_prediction_model(self):
+        self.configs["generator_type"] = "vpx"
+        with self.assertRaises(ValueError):
+            media.get_model("config.yaml", "checkpoint.tar")
+
+    def test_warm_up_model(self):
+        model = run(media.warm_up_model("config.yaml", "checkpoint.tar", iterations=3))
+        self.assertEqual(model.predict.call_count, 3)
+        model.reset.assert_called_once_with()
+
+        # warming up again is a no-op
+        run(media.warm_up_model("config.yaml", "checkpoint.tar", iterations=3))
+        self.assertEqual(model.predict.call_count, 3)
+
+    def test_warm_up_model_in_executor(self):
+        executor = media.InferenceExecutor()
+        model = run(
+            media.warm_up_model(
+                "config.yaml", "checkpoint.tar", iterations=3, executor=executor
+            )
+        )
+        self.assertEqual(model.predict.call_count, 3)
+        self.assertEqual(executor.calls, 1)
+        executor.shutdown()
+
+
+class InferenceExecutorTest(TestCase):
+    def test_run(self):
+        executor = media.InferenceExecutor()
+        self.assertEqual(run(executor.run(sum, [1, 2, 3])), 6)
+        self.assertEqual(executor.calls, 1)
+        self.assertEqual(executor.queue_depth, 0)
+        self.assertEqual(executor.max_queue_depth, 1)
+        executor.shutdown()
+
+    def test_run_queued(self):
+        executor = media.InferenceExecutor()
+
+        async def run_many():
+            return await asyncio.gather(
+                *[executor.run(pow, i, 2) for i in range(5)]
+            )
+
+        self.assertEqual(run(run_many()), [0, 1, 4, 9, 16])
+        self.assertEqual(executor.calls, 5)
+        self.assertEqual(executor.queue_depth, 0)
+        self.assertEqual(executor.max_queue_depth, 5)
+        executor.shutdown()
+
+    def test_run_pluggable(self):
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        executor = media.InferenceExecutor(pool)
+        self.assertEqual(run(executor.run(max, 1, 2)), 2)
+
+        # the pool is not owned by the inference executor
+        executor.shutdown()
+        self.assertEqual(pool.submit(min, 1, 2).result(), 1)
+        pool.shutdown()
+
+    def test_recorder_owns_executor(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "test.mp4")
+
+        with patch.object(media, "requires_model", return_value=True), patch.object(
+            media, "get_main_configs"
+        ):
+            recorder = MediaRecorder(path, enable_prediction=True)
+            executor = recorder.inference_executor
+            self.assertEqual(run(executor.run(sum, [1, 2])), 3)
+
+            # the executor is shut down with the recorder
+            run(recorder.stop())
+            with self.assertRaises(RuntimeError):
+                run(executor.run(sum, [1, 2]))
+
+            # an executor which is passed in is left running
+            shared = media.InferenceExecutor()
+            recorder = MediaRecorder(path, enable_prediction=True, inference_executor=shared)
+            self.assertIs(recorder.inference_executor, shared)
+            run(recorder.stop())
+            self.assertEqual(run(shared.run(sum, [1, 2])), 3)
+            shared.shutdown()
+
+
+class StampFrameTest(CodecTestCase):
+    def test_roundtrip(self):
+        frame = self.create_video_frame(width=640, height=480, pts=3000)
+        for frame_index in [0, 1, 29, 1000, 30000]:
+            stamped = media.stamp_frame(frame, frame_index, frame.pts, frame.time_base)
+            self.assertEqual(stamped.format.name, "yuv420p")
+            self.assertEqual(stamped.width, 640)
+            self.assertEqual(stamped.height, 480 + media.NUM_ROWS)
+            self.assertEqual(stamped.pts, 3000)
+            self.assertEqual(stamped.time_base, frame.time_base)
+
+            destamped, destamped_index = media.destamp_frame(stamped)
+            self.assertEqual(destamped_index, frame_index)
+            self.assertEqual(destamped.width, 640)
+            self.assertEqual(destamped.height, 480)
+            self.assertTrue(
+                (destamped.to_ndarray() == frame.to_ndarray()).all()
+            )
+
+    def test_roundtrip_rgb(self):
+        frame = self.create_video_frame(
+            width=320, height=240, pts=0, format="rgb24"
+        )
+        stamped = media.stamp_frame(frame, 42, frame.pts, frame.time_base)
+        destamped, destamped_index = media.destamp_frame(stamped.to_rgb())
+        self.assertEqual(destamped_index, 42)
+        self.assertEqual(destamped.height, 240)
+
+    def test_frame_planes_odd_size(self):
+        frame = self.create_video_frame(width=33, height=21, pts=0)
+        for plane in frame.planes:
+            plane.update(bytes(i % 251 for i in range(plane.buffer_size)))
+
+        planes = media._frame_planes(frame)
+        self.assertEqual([plane.shape for plane in planes], [(21, 33), (11, 17), (11, 17)])
+        for plane, array in zip(frame.planes, planes):
+            data = bytes(plane)
+            for row in range(plane.height):
+                start = row * plane.line_size
+                self.assertEqual(array[row].tobytes(), data[start:start + plane.width])
+
+    def test_is_frame_stamped(self):
+        frame = self.create_video_frame(width=640, height=480, pts=0)
+        self.assertFalse(media.is_frame_stamped(frame))
+
+        stamped = media.stamp_frame(frame, 0, frame.pts, frame.time_base)
+        self.assertTrue(media.is_frame_stamped(stamped))
+
+    def test_receive_frame_index(self):
+        frame = self.create_video_frame(width=640, height=480, pts=0)
+        stamped = media.stamp_frame(frame, 42, frame.pts, frame.time_base)
+        track = MagicMock()
+
+        # the header extension was received
+        track.frame_index.return_value = 7
+        self.assertEqual(media.receive_frame_index(track, stamped), (stamped, 7))
+
+        # the header extension is absent, the barcode is used instead
+        track.frame_index.return_value = None
+        destamped, frame_index = media.receive_frame_index(track, stamped)
+        self.assertEqual(frame_index, 42)
+        self.assertEqual(destamped.height, 480)
+
+        # neither is there
+        self.assertEqual(media.receive_frame_index(track, frame), (frame, None))
+
+
+class SharedVideoFrameTest(CodecTestCase):
+    def test_to_rgb_ndarray(self):
+        frame = self.create_video_frame(width=320, height=240, pts=0)
+        shared = media.SharedVideoFrame(frame)
+        self.assertIs(shared.frame, frame)
+
+        # the RGB array is computed once and shared
+        array = shared.to_rgb_ndarray()
+        self.assertEqual(array.shape, (240, 320, 3))
+        self.assertIs(shared.to_rgb_ndarray(), array)
+
+        # the encoder still gets the native layout
+        self.assertEqual(shared.frame.format.name, "yuv420p")
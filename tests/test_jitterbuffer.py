@@ -1,9 +1,85 @@
+import random
 from unittest import TestCase
 
-from aiortc.jitterbuffer import JitterBuffer
+from aiortc.jitterbuffer import JitterBuffer, JitterFrame
 from aiortc.rtp import RtpPacket
 
 
+class RescanJitterBuffer(JitterBuffer):
+    """
+    Jitter buffer which rescans the ring from its origin on every packet,
+    used as a reference for the incremental frame assembly.
+    """
+
+    def _remove_frame(self, sequence_number):
+        frame = None
+        frames = 0
+        packets = []
+        remove = 0
+
+        for count in range(self.capacity):
+            pos = (self._origin + count) % self._capacity
+            packet = self._packets[pos]
+            if packet is None:
+                break
+            packets.append(packet)
+
+            if packet.marker == 1:
+                if frame is None:
+                    frame = JitterFrame(
+                        data=b"".join([x._data for x in packets]),
+                        timestamp=packet.timestamp,
+                    )
+                    remove = count + 1
+
+                frames += 1
+                if frames >= self._prefetch:
+                    self.remove(remove)
+                    return frame
+
+                packets = []
+
+        return None
+
+
+class CountingList(list):
+    """
+    List which counts the items read, to measure the work of a jitter buffer.
+    """
+
+    def __init__(self, items):
+        super().__init__(items)
+        self.reads = 0
+
+    def __getitem__(self, index):
+        self.reads += 1
+        return super().__getitem__(index)
+
+
+def create_keyframe_bursts(frame_count, packets_per_frame, shuffle=0, loss=0.0, seed=0):
+    """
+    Create the packets of consecutive frames, optionally reordered within
+    a window of `shuffle` packets and with random losses.
+    """
+    rng = random.Random(seed)
+    packets = []
+    sequence_number = 65000
+    for i in range(frame_count):
+        for j in range(packets_per_frame):
+            packet = RtpPacket(sequence_number=sequence_number, timestamp=3000 * i)
+            packet.marker = 1 if j == packets_per_frame - 1 else 0
+            packet._data = b"%d:%d;" % (i, j)
+            packets.append(packet)
+            sequence_number = (sequence_number + 1) & 0xFFFF
+
+    if shuffle:
+        for i in range(0, len(packets), shuffle):
+            window = packets[i : i + shuffle]
+            rng.shuffle(window)
+            packets[i : i + shuffle] = window
+    return [p for p in packets if rng.random() >= loss]
+
+
 class JitterBufferTest(TestCase):
     def assertPackets(self, jbuffer, expected):
         found = [x.sequence_number if x else None for x in jbuffer._packets]
@@ -283,6 +359,21 @@ class JitterBufferTest(TestCase):
         self.assertEqual(frame.data, b"000000010002")
         self.assertEqual(frame.timestamp, 1234)
 
+    def test_remove_frame_with_frame_index(self):
+        jbuffer = JitterBuffer(capacity=128, is_video=True)
+
+        for i in range(3):
+            packet = RtpPacket(sequence_number=i, timestamp=1234)
+            packet.marker = 1 if i == 2 else 0
+            packet.extensions.frame_index = 42
+            packet._data = b"000%d" % i
+            pli_flag, frame = jbuffer.add(packet)
+
+        self.assertIsNotNone(frame)
+        self.assertEqual(frame.data, b"000000010002")
+        self.assertEqual(frame.timestamp, 1234)
+        self.assertEqual(frame.frame_index, 42)
+
     def test_pli_flag(self):
         """
         Video jitter buffer.
@@ -316,3 +407,177 @@ class JitterBufferTest(TestCase):
         self.assertIsNone(frame)
         self.assertEqual(jbuffer._origin, 2000)
         self.assertTrue(pli_flag)
+
+
+class JitterBufferAssemblyTest(TestCase):
+    def assemble(self, jbuffer, packets):
+        frames = []
+        for packet in packets:
+            pli_flag, frame = jbuffer.add(packet)
+            if frame is not None:
+                frames.append((frame.data, frame.timestamp))
+        return frames
+
+    def test_same_frames_as_rescan(self):
+        scenarios = [
+            dict(frame_count=50, packets_per_frame=3),
+            dict(frame_count=50, packets_per_frame=7, shuffle=5, seed=1),
+            dict(frame_count=50, packets_per_frame=7, shuffle=20, loss=0.02, seed=2),
+            dict(frame_count=20, packets_per_frame=60, shuffle=50, loss=0.01, seed=3),
+        ]
+        for scenario in scenarios:
+            for kwargs in [
+                dict(capacity=128, is_video=True),
+                dict(capacity=128, prefetch=4),
+                dict(capacity=16, prefetch=4),
+            ]:
+                packets = create_keyframe_bursts(**scenario)
+                expected = self.assemble(RescanJitterBuffer(**kwargs), packets)
+                found = self.assemble(JitterBuffer(**kwargs), packets)
+                self.assertEqual(found, expected, (scenario, kwargs))
+
+    def test_keyframe_burst_is_linear(self):
+        """
+        A keyframe spanning hundreds of packets is assembled in linear time.
+        """
+        packets = create_keyframe_bursts(frame_count=4, packets_per_frame=500)
+
+        visits = []
+        for jitter_buffer_class in [RescanJitterBuffer, JitterBuffer]:
+            jbuffer = jitter_buffer_class(capacity=1024, is_video=True)
+            jbuffer._packets = CountingList(jbuffer._packets)
+            frames = self.assemble(jbuffer, packets)
+            self.assertEqual(len(frames), 4)
+            visits.append(jbuffer._packets.reads)
+
+        # the rescan visits each keyframe packet once per packet received
+        rescan_visits, incremental_visits = visits
+        self.assertLessEqual(incremental_visits, 4 * len(packets))
+        self.assertGreater(rescan_visits, 100 * len(packets))
+
+
+class JitterBufferAdaptiveTest(TestCase):
+    def create_packet(self, sequence_number, frame, marker=0):
+        packet = RtpPacket(sequence_number=sequence_number, timestamp=3000 * frame)
+        packet.marker = marker
+        packet._data = b"%d:%d;" % (frame, sequence_number)
+        return packet
+
+    def test_jitter_estimate(self):
+        jbuffer = JitterBuffer(capacity=128, is_video=True, adaptive=True)
+        self.assertEqual(jbuffer.jitter, 0)
+        self.assertEqual(jbuffer.target_delay, 10)
+
+        # one packet per frame, arriving alternately on time and 20ms late
+        for i in range(200):
+            packet = self.create_packet(i, i, marker=1)
+            pli_flag, frame = jbuffer.add(packet, 1000 + 100 * i / 3 + 20 * (i % 2))
+            self.assertIsNotNone(frame)
+            self.assertFalse(pli_flag)
+
+        self.assertAlmostEqual(jbuffer.jitter, 20, delta=1)
+        self.assertAlmostEqual(jbuffer.target_delay, 80, delta=4)
+        self.assertAlmostEqual(jbuffer.current_delay, 20, delta=1)
+        self.assertEqual(jbuffer.frames_dropped_late, 0)
+
+    def test_clock_rate(self):
+        jbuffer = JitterBuffer(capacity=128, adaptive=True)
+        self.assertEqual(jbuffer.clock_rate, 90000)
+        jbuffer.clock_rate = 8000
+        self.assertEqual(jbuffer.clock_rate, 8000)
+
+        # 20ms frames at 8kHz arriving on time show no jitter
+        for i in range(10):
+            packet = self.create_packet(i, i, marker=1)
+            packet.timestamp = 160 * i
+            pli_flag, frame = jbuffer.add(packet, 20 * i)
+            self.assertIsNotNone(frame)
+
+        self.assertEqual(jbuffer.jitter, 0)
+        self.assertEqual(jbuffer.current_delay, 0)
+
+    def test_timestamp_wrap(self):
+        jbuffer = JitterBuffer(capacity=128, is_video=True, adaptive=True)
+
+        for i in range(10):
+            packet = self.create_packet(i, i, marker=1)
+            packet.timestamp = (0xFFFFFFFF - 10000 + 3000 * i) & 0xFFFFFFFF
+            pli_flag, frame = jbuffer.add(packet, 100 * i / 3)
+            self.assertIsNotNone(frame)
+
+        self.assertEqual(jbuffer.jitter, 0)
+        self.assertEqual(jbuffer.current_delay, 0)
+
+    def test_wait_before_deadline(self):
+        jbuffer = JitterBuffer(capacity=128, is_video=True, adaptive=True)
+
+        # the second packet of frame 0 is late but within the target delay
+        jbuffer.add(self.create_packet(0, 0), 0)
+        pli_flag, frame = jbuffer.add(self.create_packet(2, 0, marker=1), 1)
+        self.assertIsNone(frame)
+        pli_flag, frame = jbuffer.add(self.create_packet(1, 0), 8)
+        self.assertFalse(pli_flag)
+        self.assertEqual(frame.data, b"0:0;0:1;0:2;")
+        self.assertEqual(jbuffer.frames_dropped_late, 0)
+
+    def test_abandon_late_frame(self):
+        jbuffer = JitterBuffer(capacity=128, is_video=True, adaptive=True)
+
+        # packet 1 of frame 0 is lost
+        pli_flag, frame = jbuffer.add(self.create_packet(0, 0), 0)
+        self.assertIsNone(frame)
+        pli_flag, frame = jbuffer.add(self.create_packet(2, 0, marker=1), 1)
+        self.assertIsNone(frame)
+        self.assertFalse(pli_flag)
+
+        # frame 1 arrives past the deadline of frame 0
+        pli_flag, frame = jbuffer.add(self.create_packet(3, 1), 33)
+        self.assertIsNone(frame)
+        self.assertTrue(pli_flag)
+        self.assertEqual(jbuffer._origin, 3)
+        pli_flag, frame = jbuffer.add(self.create_packet(4, 1, marker=1), 34)
+        self.assertFalse(pli_flag)
+        self.assertEqual(frame.data, b"1:3;1:4;")
+        self.assertEqual(frame.timestamp, 3000)
+        self.assertEqual(jbuffer.frames_dropped_late, 1)
+        self.assertEqual(jbuffer._origin, 5)
+
+        # a retransmission of the abandoned packet is too old
+        pli_flag, frame = jbuffer.add(self.create_packet(1, 0), 40)
+        self.assertIsNone(frame)
+
+    def test_abandon_late_frame_without_more_packets(self):
+        jbuffer = JitterBuffer(capacity=128, is_video=True, adaptive=True)
+        self.assertIsNone(jbuffer.deadline)
+
+        # packet 1 of frame 0 is lost, frame 1 arrives before the deadline
+        jbuffer._jitter = 20
+        jbuffer.add(self.create_packet(0, 0), 0)
+        self.assertIsNone(jbuffer.deadline)
+        jbuffer.add(self.create_packet(2, 0, marker=1), 1)
+        self.assertAlmostEqual(jbuffer.deadline, jbuffer.target_delay, delta=1)
+        pli_flag, frame = jbuffer.add(self.create_packet(3, 1, marker=1), 34)
+        self.assertIsNone(frame)
+        deadline = jbuffer.deadline
+        self.assertGreater(deadline, 34)
+
+        # no more packets arrive, the deadline is polled
+        self.assertEqual(jbuffer.poll(deadline - 1), (False, []))
+        pli_flag, frames = jbuffer.poll(deadline)
+        self.assertTrue(pli_flag)
+        self.assertEqual([frame.data for frame in frames], [b"1:3;"])
+        self.assertEqual(jbuffer.frames_dropped_late, 1)
+        self.assertIsNone(jbuffer.deadline)
+        self.assertEqual(jbuffer.poll(1000), (False, []))
+
+    def test_not_adaptive(self):
+        jbuffer = JitterBuffer(capacity=128, is_video=True)
+
+        jbuffer.add(self.create_packet(0, 0), 0)
+        jbuffer.add(self.create_packet(2, 0, marker=1), 1)
+        pli_flag, frame = jbuffer.add(self.create_packet(3, 1, marker=1), 1000)
+        self.assertIsNone(frame)
+        self.assertFalse(pli_flag)
+        self.assertEqual(jbuffer.frames_dropped_late, 0)
+        self.assertIsNone(jbuffer.deadline)
+        self.assertEqual(jbuffer.poll(1000), (False, []))
@@ -0,0 +1,363 @@
+from unittest import TestCase
+
+import numpy as np
+
+from aiortc.codecs import (
+    KEYPOINTS_BINNED_CODECS,
+    KEYPOINTS_CODEC,
+    KEYPOINTS_DELTA_CODEC,
+    get_capabilities,
+    get_decoder,
+    get_encoder,
+)
+from aiortc.codecs.keypointcodec import (
+    DELTA_FRAME,
+    KEY_FRAME,
+    KEYFRAME_INTERVAL,
+    MODEL_INTERVAL,
+    NUM_KP,
+    KeypointsBinnedDecoder,
+    KeypointsBinnedEncoder,
+    bin_to_jacobian,
+    bins_to_jacobians,
+    custom_decode,
+    custom_encode,
+    exp_golomb_decode,
+    exp_golomb_encode,
+    float16_to_jacobian,
+    jacobian_to_bin,
+    jacobian_to_float16,
+    jacobians_to_bins,
+)
+from aiortc.jitterbuffer import JitterFrame
+from aiortc.mediastreams import KeypointsFrame
+
+KEYPOINTS_PAYLOAD = bytes.fromhex(
+    "04d20007403004cee659acd66ab37369a802808ce6699a4da6a33b361a3c00b400040041003c80"
+    "b40030003e003d00b400340038003d80b4003600b8003e00b4003800be003e80b4003900c1003f"
+    "00b4003a00c3003f80b4003b00c4804000b4003c00c5804040b4003c80c680"
+)
+
+
+def create_keypoint_dict(frame_index=1234, source_index=7):
+    return {
+        "keypoints": np.array([[i / 10 - 0.5, 0.5 - i / 20] for i in range(NUM_KP)]),
+        "jacobians": np.array(
+            [[[1.0 + i / 8, -0.25], [0.125 * i, 2.5 - i]] for i in range(NUM_KP)]
+        ),
+        "frame_index": frame_index,
+        "source_index": source_index,
+    }
+
+
+def create_moving_keypoint_dict(i, source_index=7):
+    keypoint_dict = create_keypoint_dict(frame_index=i, source_index=source_index)
+    keypoint_dict["keypoints"] += 0.003 * i
+    keypoint_dict["jacobians"] *= 1 + 0.01 * i
+    return keypoint_dict
+
+
+class KeypointsCodecTest(TestCase):
+    def test_jacobian_to_float16(self):
+        words = jacobian_to_float16([1.0, -2.0, 0.0, 1e9, 1.0009765625 + 2 ** -12])
+        self.assertEqual(list(words), [0x3C00, 0xC000, 0x0400, 0x7B73, 0x3C01])
+
+    def test_float16_to_jacobian(self):
+        values = float16_to_jacobian([0x3C00, 0xC000, 0x0400, 0x7BFF, 0x3C01])
+        self.assertEqual(
+            list(values), [1.0, -2.0, 2 ** -14, 65504.0, 1.0009765625]
+        )
+
+    def test_custom_encode(self):
+        self.assertEqual(custom_encode(create_keypoint_dict()), KEYPOINTS_PAYLOAD)
+
+    def test_custom_encode_float32(self):
+        keypoint_dict = create_keypoint_dict()
+        keypoint_dict["keypoints"] = keypoint_dict["keypoints"].astype(np.float32)
+        keypoint_dict["jacobians"] = keypoint_dict["jacobians"].astype(np.float32)
+        self.assertEqual(custom_encode(keypoint_dict), KEYPOINTS_PAYLOAD)
+
+    def test_custom_decode(self):
+        expected = create_keypoint_dict()
+        keypoint_dict = custom_decode(KEYPOINTS_PAYLOAD)
+        self.assertEqual(keypoint_dict["frame_index"], 1234)
+        self.assertEqual(keypoint_dict["source_index"], 7)
+        self.assertEqual(keypoint_dict["keypoints"].shape, (NUM_KP, 2))
+        np.testing.assert_allclose(
+            keypoint_dict["keypoints"], expected["keypoints"], atol=1 / 512
+        )
+        np.testing.assert_allclose(
+            keypoint_dict["jacobians"], expected["jacobians"], atol=1e-4
+        )
+
+    def test_roundtrip(self):
+        encoder = get_encoder(KEYPOINTS_CODEC)
+        decoder = get_decoder(KEYPOINTS_CODEC)
+
+        keypoint_dict = create_keypoint_dict()
+        frame = KeypointsFrame(keypoint_dict, 3000, 1234, 7)
+        payloads, timestamp = encoder.encode(frame)
+        self.assertEqual(payloads, [KEYPOINTS_PAYLOAD])
+        self.assertEqual(timestamp, 3000)
+
+        frames = decoder.decode(JitterFrame(data=payloads[0], timestamp=timestamp))
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(frames[0].frame_index, 1234)
+        self.assertEqual(frames[0].source_index, 7)
+        np.testing.assert_allclose(
+            frames[0].data["jacobians"], keypoint_dict["jacobians"], atol=1e-4
+        )
+
+    def test_roundtrip_batch(self):
+        encoder = get_encoder(KEYPOINTS_CODEC)
+        decoder = get_decoder(KEYPOINTS_CODEC)
+
+        frames = [
+            KeypointsFrame(create_keypoint_dict(), 3000 * i, i, i // 2)
+            for i in range(5)
+        ]
+        encoded = encoder.encode_batch(frames)
+        self.assertEqual(len(encoded), 5)
+        for i, (payloads, timestamp) in enumerate(encoded):
+            self.assertEqual(payloads, encoder.encode(frames[i])[0])
+            self.assertEqual(timestamp, 3000 * i)
+
+        # payloads of different lengths are decoded in the same batch
+        encoded_frames = [
+            JitterFrame(data=payloads[0], timestamp=timestamp)
+            for payloads, timestamp in encoded
+        ]
+        encoded_frames.append(
+            JitterFrame(data=KEYPOINTS_PAYLOAD[:-8], timestamp=15000)
+        )
+        decoded = decoder.decode_batch(encoded_frames)
+        self.assertEqual(len(decoded), 6)
+        for i in range(5):
+            self.assertEqual(len(decoded[i]), 1)
+            self.assertEqual(decoded[i][0].frame_index, i)
+            self.assertEqual(decoded[i][0].source_index, i // 2)
+        self.assertEqual(decoded[5][0].frame_index, 1234)
+        self.assertEqual(decoded[5][0].data["jacobians"].shape, (NUM_KP - 1, 2, 2))
+
+
+class KeypointsDeltaCodecTest(TestCase):
+    def encode_frames(self, encoder, keypoint_dicts):
+        payloads = []
+        for keypoint_dict in keypoint_dicts:
+            frame = KeypointsFrame(
+                keypoint_dict,
+                3000 * keypoint_dict["frame_index"],
+                keypoint_dict["frame_index"],
+                keypoint_dict["source_index"],
+            )
+            payloads.append(encoder.encode(frame)[0][0])
+        return payloads
+
+    def test_exp_golomb(self):
+        values = [0, 1, -1, 2, -2, 1000, -65535, 0]
+        bits = exp_golomb_encode(values)
+        self.assertEqual(list(bits[:9]), [1, 0, 1, 1, 0, 1, 0, 0, 0])
+
+        decoded, consumed = exp_golomb_decode(bits, len(values))
+        self.assertEqual(list(decoded), values)
+        self.assertEqual(consumed, len(bits))
+
+        with self.assertRaises(ValueError):
+            exp_golomb_decode(bits[:-1], len(values))
+
+    def test_opt_in(self):
+        # delta coding is only used when preferred over the default codec
+        codecs = get_capabilities("keypoints").codecs
+        self.assertEqual(codecs[0].mimeType, KEYPOINTS_CODEC.mimeType)
+        self.assertIn(KEYPOINTS_DELTA_CODEC.mimeType, [c.mimeType for c in codecs])
+
+    def test_roundtrip(self):
+        encoder = get_encoder(KEYPOINTS_DELTA_CODEC)
+        decoder = get_decoder(KEYPOINTS_DELTA_CODEC)
+
+        keypoint_dicts = [create_moving_keypoint_dict(i) for i in range(10)]
+        payloads = self.encode_frames(encoder, keypoint_dicts)
+        self.assertEqual(payloads[0][0], KEY_FRAME)
+        self.assertEqual(payloads[0][1:], custom_encode(keypoint_dicts[0]))
+        for payload in payloads[1:]:
+            self.assertEqual(payload[0], DELTA_FRAME)
+            self.assertLess(len(payload), len(payloads[0]))
+
+        # delta frames reconstruct exactly what the key frame path would
+        for i, payload in enumerate(payloads):
+            frames = decoder.decode(JitterFrame(data=payload, timestamp=3000 * i))
+            self.assertEqual(len(frames), 1)
+            expected = custom_decode(custom_encode(keypoint_dicts[i]))
+            self.assertEqual(frames[0].frame_index, i)
+            self.assertEqual(frames[0].source_index, 7)
+            np.testing.assert_array_equal(
+                frames[0].data["keypoints"], expected["keypoints"]
+            )
+            np.testing.assert_array_equal(
+                frames[0].data["jacobians"], expected["jacobians"]
+            )
+
+    def test_keyframe_interval(self):
+        encoder = get_encoder(KEYPOINTS_DELTA_CODEC)
+
+        payloads = self.encode_frames(
+            encoder,
+            [create_moving_keypoint_dict(i) for i in range(2 * KEYFRAME_INTERVAL)],
+        )
+        keyframes = [i for i, p in enumerate(payloads) if p[0] == KEY_FRAME]
+        self.assertEqual(keyframes, [0, KEYFRAME_INTERVAL])
+
+    def test_keyframe_on_source_change(self):
+        encoder = get_encoder(KEYPOINTS_DELTA_CODEC)
+
+        payloads = self.encode_frames(
+            encoder,
+            [
+                create_moving_keypoint_dict(0, source_index=0),
+                create_moving_keypoint_dict(1, source_index=0),
+                create_moving_keypoint_dict(2, source_index=1),
+                create_moving_keypoint_dict(3, source_index=1),
+            ],
+        )
+        self.assertEqual(
+            [p[0] for p in payloads], [KEY_FRAME, DELTA_FRAME, KEY_FRAME, DELTA_FRAME]
+        )
+
+    def test_missing_reference(self):
+        encoder = get_encoder(KEYPOINTS_DELTA_CODEC)
+        decoder = get_decoder(KEYPOINTS_DELTA_CODEC)
+
+        payloads = self.encode_frames(
+            encoder,
+            [
+                create_moving_keypoint_dict(i, source_index=i // 3)
+                for i in range(6)
+            ],
+        )
+
+        # frame 1 is lost, the following delta frame cannot be decoded
+        # until the next key frame arrives
+        decoded = [
+            decoder.decode(JitterFrame(data=payloads[i], timestamp=3000 * i))
+            for i in [0, 2, 3, 4]
+        ]
+        self.assertEqual([len(frames) for frames in decoded], [1, 0, 1, 1])
+        self.assertEqual(decoded[2][0].frame_index, 3)
+        self.assertEqual(decoded[3][0].frame_index, 4)
+
+
+class KeypointsBinnedCodecTest(TestCase):
+    def create_frames(self, count):
+        rng = np.random.RandomState(1234)
+        jacobians = np.tile(np.eye(2), (NUM_KP, 1, 1)) + rng.normal(
+            0, 0.3, (NUM_KP, 2, 2)
+        )
+        frames = []
+        for i in range(count):
+            jacobians = jacobians + rng.normal(0, 0.02, jacobians.shape)
+            keypoint_dict = create_keypoint_dict(frame_index=i)
+            keypoint_dict["jacobians"] = jacobians
+            frames.append(KeypointsFrame(keypoint_dict, 3000 * i, i, 7))
+        return frames
+
+    def roundtrip(self, jacobian_bits, frames):
+        """
+        Round-trip frames through the binned codec, returning the average
+        number of jacobian bits per frame and the maximum reconstruction
+        error of the binned and float16 jacobians.
+        """
+        encoder = KeypointsBinnedEncoder(jacobian_bits)
+        decoder = KeypointsBinnedDecoder()
+
+        header_size = len(custom_encode(frames[0].data)) - NUM_KP * 4 * 2
+        total_bits = 0
+        binned_error = 0.0
+        float16_error = 0.0
+        for frame in frames:
+            jacobians = frame.data["jacobians"].copy()
+            payloads, timestamp = encoder.encode(frame)
+            total_bits += (len(payloads[0]) - header_size) * 8
+
+            decoded = decoder.decode(JitterFrame(data=payloads[0], timestamp=timestamp))
+            self.assertEqual(len(decoded), 1)
+            self.assertEqual(decoded[0].frame_index, frame.frame_index)
+            np.testing.assert_array_equal(
+                decoded[0].data["keypoints"],
+                custom_decode(custom_encode(frame.data))["keypoints"],
+            )
+            binned_error = max(
+                binned_error, np.abs(decoded[0].data["jacobians"] - jacobians).max()
+            )
+            float16_error = max(
+                float16_error,
+                np.abs(custom_decode(custom_encode(frame.data))["jacobians"] - jacobians).max(),
+            )
+
+        return total_bits / len(frames), binned_error, float16_error
+
+    def test_jacobians_to_bins(self):
+        values = [-3.5, -2.75, -2.25, -2.0, -1.0, -0.01, 0.0, 0.01, 0.5, 1.99, 2.6, 7.0]
+        for num_bins in [4, 32, 128]:
+            signs, bins = jacobians_to_bins(values, num_bins)
+            self.assertEqual(
+                list(zip(signs, bins)), [jacobian_to_bin(v, num_bins) for v in values]
+            )
+
+            decoded = bins_to_jacobians(signs, bins, num_bins)
+            for i, value in enumerate(decoded):
+                magnitude = bin_to_jacobian(bins[i], num_bins)
+                self.assertEqual(value, magnitude if signs[i] else -magnitude)
+
+    def test_roundtrip(self):
+        for codec in KEYPOINTS_BINNED_CODECS:
+            encoder = get_encoder(codec)
+            decoder = get_decoder(codec)
+            jacobian_bits = int(codec.parameters["jacobian-bits"])
+            self.assertEqual(encoder.jacobian_bits, jacobian_bits)
+
+            frame = self.create_frames(1)[0]
+            payloads, timestamp = encoder.encode(frame)
+            frames = decoder.decode(JitterFrame(data=payloads[0], timestamp=timestamp))
+            self.assertEqual(len(frames), 1)
+            self.assertEqual(frames[0].frame_index, 0)
+            self.assertEqual(frames[0].source_index, 7)
+            self.assertEqual(frames[0].data["jacobians"].shape, (NUM_KP, 2, 2))
+
+    def test_bits_and_error(self):
+        frames = self.create_frames(2 * MODEL_INTERVAL)
+        float16_bits = NUM_KP * 4 * 16
+
+        results = {}
+        for jacobian_bits in [4, 6, 8]:
+            results[jacobian_bits] = self.roundtrip(jacobian_bits, frames)
+
+        for jacobian_bits, (bits, binned_error, float16_error) in results.items():
+            # fewer bits than the float16 path and within half a bin
+            self.assertLess(bits, float16_bits)
+            self.assertLess(float16_error, 2 ** -9)
+            self.assertLessEqual(binned_error, 1.0 / (2 ** (jacobian_bits - 1) - 3))
+
+        # more bits buy a smaller error
+        self.assertLess(results[4][0], results[6][0])
+        self.assertLess(results[6][0], results[8][0])
+        self.assertGreater(results[4][1], results[6][1])
+        self.assertGreater(results[6][1], results[8][1])
+
+    def test_bad_bit_depth(self):
+        with self.assertRaises(ValueError):
+            KeypointsBinnedEncoder(2)
+
+    def test_lost_frame(self):
+        encoder = KeypointsBinnedEncoder(6)
+        decoder = KeypointsBinnedDecoder()
+
+        frames = self.create_frames(MODEL_INTERVAL + 2)
+        payloads = [encoder.encode(frame)[0][0] for frame in frames]
+
+        # frame 1 is lost, decoding resumes when the model is reset
+        decoded = [
+            decoder.decode(JitterFrame(data=payloads[i], timestamp=0))
+            for i in [0, 2, 3, MODEL_INTERVAL, MODEL_INTERVAL + 1]
+        ]
+        self.assertEqual([len(frames) for frames in decoded], [1, 0, 0, 1, 1])
+        self.assertEqual(decoded[3][0].frame_index, MODEL_INTERVAL)
@@ -0,0 +1,191 @@
+import asyncio
+from unittest import TestCase
+
+from aiortc.pacer import (
+    PRIORITY_HIGH,
+    PRIORITY_RETRANSMISSION,
+    PRIORITY_VIDEO,
+    Pacer,
+    get_priority,
+)
+
+from .utils import run
+
+
+class DummyTransport:
+    def __init__(self):
+        self.batches = []
+        self.sent = []
+
+    async def _send_rtp_batch(self, packets):
+        self.batches.append(len(packets))
+        self.sent.extend(packets)
+
+
+class ClosedTransport:
+    async def _send_rtp_batch(self, packets):
+        raise ConnectionError("Cannot send encrypted RTP, not connected")
+
+
+class FailingTransport(DummyTransport):
+    def __init__(self):
+        super().__init__()
+        self.failures = 1
+
+    async def _send_rtp_batch(self, packets):
+        if self.failures:
+            self.failures -= 1
+            raise ValueError("Cannot protect RTP")
+        await super()._send_rtp_batch(packets)
+
+
+async def send_all(pacer, packets, priority):
+    for packet in packets:
+        await pacer.send(packet, priority)
+
+
+class PacerTest(TestCase):
+    def stop(self, pacer):
+        pacer.stop()
+        run(asyncio.sleep(0))
+
+    def test_get_priority(self):
+        self.assertEqual(get_priority("audio"), PRIORITY_HIGH)
+        self.assertEqual(get_priority("keypoints"), PRIORITY_HIGH)
+        self.assertEqual(get_priority("lr_video"), PRIORITY_VIDEO)
+        self.assertEqual(get_priority("video"), PRIORITY_VIDEO)
+
+    def test_high_priority_not_queued(self):
+        transport = DummyTransport()
+        pacer = Pacer(transport)
+
+        for i in range(10):
+            run(pacer.send(b"a" * 1000, PRIORITY_HIGH))
+        self.assertEqual(len(transport.sent), 10)
+        self.assertEqual(pacer.queue_packets, 0)
+        self.stop(pacer)
+
+    def test_high_priority_charges_budget(self):
+        transport = DummyTransport()
+        pacer = Pacer(transport)
+        pacer.set_bitrate(1234, 400000)
+
+        # 5kB of audio is sent at once and delays video by around 40ms
+        run(pacer.send(b"a" * 5000, PRIORITY_HIGH))
+        run(pacer.send(b"v", PRIORITY_VIDEO))
+        run(asyncio.sleep(0.02))
+        self.assertEqual(len(transport.sent), 1)
+
+        run(asyncio.sleep(0.08))
+        self.assertEqual(transport.sent[1:], [b"v"])
+        self.stop(pacer)
+
+    def test_paced(self):
+        transport = DummyTransport()
+        pacer = Pacer(transport)
+        pacer.set_bitrate(1234, 400000)
+        self.assertEqual(pacer.pacing_rate, 125000)
+
+        # a burst of 25kB takes around 200ms to send at 125kB/s
+        run(send_all(pacer, [b"v" * 1000] * 25, PRIORITY_VIDEO))
+        self.assertLessEqual(len(transport.sent), 1)
+
+        run(asyncio.sleep(0.1))
+        self.assertGreater(len(transport.sent), 5)
+        self.assertLess(len(transport.sent), 20)
+
+        run(asyncio.sleep(0.3))
+        self.assertEqual(len(transport.sent), 25)
+        self.assertEqual(pacer.queue_bytes, 0)
+        self.assertEqual(pacer.packets_paced, 25)
+        self.stop(pacer)
+
+    def test_priority(self):
+        transport = DummyTransport()
+        pacer = Pacer(transport)
+        pacer.set_bitrate(1234, 400000)
+
+        async def send():
+            await send_all(pacer, [b"v%d" % i for i in range(10)], PRIORITY_VIDEO)
+            await pacer.send(b"r", PRIORITY_RETRANSMISSION)
+            await pacer.send(b"a", PRIORITY_HIGH)
+
+        run(send())
+        run(asyncio.sleep(0.05))
+        self.assertEqual(transport.sent[0], b"a")
+        self.assertEqual(transport.sent[1], b"r")
+        self.assertEqual(transport.sent[2:], [b"v%d" % i for i in range(10)])
+        self.stop(pacer)
+
+    def test_prepare(self):
+        transport = DummyTransport()
+        pacer = Pacer(transport)
+
+        run(pacer.send(b"a", PRIORITY_HIGH, prepare=lambda data: data + b"!"))
+        run(pacer.send(b"v", PRIORITY_VIDEO, prepare=lambda data: data + b"!"))
+        run(asyncio.sleep(0.02))
+        self.assertEqual(transport.sent, [b"a!", b"v!"])
+        self.stop(pacer)
+
+    def test_prepare_error(self):
+        transport = DummyTransport()
+        pacer = Pacer(transport)
+
+        def prepare(data):
+            if data == b"bad":
+                raise ValueError("Cannot prepare packet")
+            return data
+
+        # the packet which fails is dropped, the others are sent
+        run(pacer.send_batch([b"v1", b"bad", b"v2"], PRIORITY_VIDEO, prepare=prepare))
+        run(asyncio.sleep(0.02))
+        self.assertEqual(transport.sent, [b"v1", b"v2"])
+        self.stop(pacer)
+
+    def test_send_error(self):
+        transport = FailingTransport()
+        pacer = Pacer(transport)
+
+        # the batch which fails is dropped, the pacer keeps running
+        run(pacer.send(b"v1", PRIORITY_VIDEO))
+        run(asyncio.sleep(0.02))
+        run(pacer.send(b"v2", PRIORITY_VIDEO))
+        run(asyncio.sleep(0.02))
+        self.assertEqual(transport.sent, [b"v2"])
+        self.stop(pacer)
+
+    def test_send_batch(self):
+        transport = DummyTransport()
+        pacer = Pacer(transport)
+        pacer.set_bitrate(1234, 400000)
+
+        # high priority packets are sent as one batch
+        run(pacer.send_batch([b"a1", b"a2"], PRIORITY_HIGH))
+        self.assertEqual(transport.batches, [2])
+
+        # queued packets are sent in batches the budget allows
+        run(pacer.send_batch([b"v" * 100] * 5, PRIORITY_VIDEO))
+        run(asyncio.sleep(0.02))
+        self.assertEqual(transport.batches, [2, 5])
+        self.assertEqual(len(transport.sent), 7)
+        self.stop(pacer)
+
+    def test_drain_queue_with_low_bitrate(self):
+        transport = DummyTransport()
+        pacer = Pacer(transport)
+        pacer.set_bitrate(1234, 1000)
+
+        # the queue is drained within its maximum delay
+        run(send_all(pacer, [b"v" * 1000] * 100, PRIORITY_VIDEO))
+        run(asyncio.sleep(0.6))
+        self.assertEqual(len(transport.sent), 100)
+        self.stop(pacer)
+
+    def test_connection_error(self):
+        pacer = Pacer(ClosedTransport())
+
+        run(pacer.send(b"v", PRIORITY_VIDEO))
+        run(asyncio.sleep(0.02))
+        with self.assertRaises(ConnectionError):
+            run(pacer.send(b"v", PRIORITY_VIDEO))
+        self.stop(pacer)
@@ -12,7 +12,10 @@ from aiortc.rate import (
     RateControlState,
     RateCounter,
     RemoteBitrateEstimator,
+    SendSideBandwidthEstimator,
+    TransportFeedbackGenerator,
 )
+from aiortc.rtp import unpack_transport_cc_fci
 
 TIMESTAMP_GROUP_LENGTH_US = 5000
 MIN_STEP_US = 20
@@ -975,3 +978,128 @@ class RemoteBitrateEstimatorTest(TestCase):
             if res is not None:
                 target_bitrate = res[0]
         self.assertEqual(target_bitrate, 214200)
+
+
+class TransportFeedbackGeneratorTest(TestCase):
+    def test_feedback(self):
+        generator = TransportFeedbackGenerator()
+        self.assertIsNone(generator.feedback())
+
+        # packets around the wrap, one of them reordered
+        generator.add(65534, 1000)
+        generator.add(65535, 1001)
+        generator.add(1, 1003)
+        generator.add(0, 1004)
+        self.assertEqual(
+            unpack_transport_cc_fci(generator.feedback()),
+            (65534, 0, [(65534, 0), (65535, 1000), (0, 4000), (1, 3000)]),
+        )
+        self.assertIsNone(generator.feedback())
+
+        # packets which were already reported are ignored
+        generator.add(1, 1005)
+        self.assertIsNone(generator.feedback())
+
+        # missing packets are reported as not received
+        generator.add(4, 1010)
+        self.assertEqual(
+            unpack_transport_cc_fci(generator.feedback()),
+            (2, 1, [(2, None), (3, None), (4, 10000)]),
+        )
+
+    def test_feedback_max_status_count(self):
+        generator = TransportFeedbackGenerator()
+        generator.add(0, 1000)
+        generator.add(1500, 1100)
+
+        base, feedback_count, packets = unpack_transport_cc_fci(generator.feedback())
+        self.assertEqual(base, 0)
+        self.assertEqual(feedback_count, 0)
+        self.assertEqual(len(packets), 1000)
+        self.assertEqual(packets[0], (0, 0))
+
+        base, feedback_count, packets = unpack_transport_cc_fci(generator.feedback())
+        self.assertEqual(base, 1000)
+        self.assertEqual(feedback_count, 1)
+        self.assertEqual(len(packets), 501)
+        self.assertEqual(packets[-1], (1500, 100000))
+        self.assertIsNone(generator.feedback())
+
+
+class TransportStream:
+    """
+    A sender following the target bitrate over a bottleneck link, with
+    transport-cc feedback every 50ms.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.estimator = SendSideBandwidthEstimator()
+        self.generator = TransportFeedbackGenerator()
+        self.payload_size = 1200
+
+        self.link_free_us = 0
+        self.next_feedback_us = 50000
+        self.now_us = 0
+        self.in_flight = []
+        self.sequence_number = 0
+
+    def run(self, duration_us):
+        end_us = self.now_us + duration_us
+        while self.now_us < end_us:
+            self.estimator.add_packet(
+                self.sequence_number, self.now_us // 1000, self.payload_size
+            )
+            self.link_free_us = max(self.now_us, self.link_free_us) + (
+                self.payload_size * 8000000 // self.capacity
+            )
+            self.in_flight.append((self.link_free_us + 20000, self.sequence_number))
+            self.sequence_number = (self.sequence_number + 1) & 0xFFFF
+            self.now_us += (
+                self.payload_size * 8000000 // self.estimator.target_bitrate
+            )
+
+            while self.now_us >= self.next_feedback_us:
+                self.feedback()
+
+    def feedback(self):
+        arrived = [p for p in self.in_flight if p[0] <= self.next_feedback_us]
+        self.in_flight = [p for p in self.in_flight if p[0] > self.next_feedback_us]
+        for arrival_time_us, sequence_number in arrived:
+            self.generator.add(sequence_number, arrival_time_us // 1000)
+
+        fci = self.generator.feedback()
+        while fci is not None:
+            self.estimator.on_feedback(
+                unpack_transport_cc_fci(fci)[2], self.next_feedback_us // 1000
+            )
+            fci = self.generator.feedback()
+        self.next_feedback_us += 50000
+
+
+class SendSideBandwidthEstimatorTest(TestCase):
+    def test_capacity(self):
+        stream = TransportStream(capacity=1000000)
+        stream.run(20000000)
+        self.assertGreater(stream.estimator.target_bitrate, 800000)
+        self.assertLess(stream.estimator.target_bitrate, 1200000)
+
+        # reduce capacity
+        stream.capacity = 300000
+        stream.run(1000000)
+        self.assertLess(stream.estimator.target_bitrate, 300000)
+
+    def test_loss(self):
+        estimator = SendSideBandwidthEstimator(start_bitrate=500000)
+        for sequence_number in range(10):
+            estimator.add_packet(sequence_number, 1000 + 10 * sequence_number, 1200)
+
+        # half the packets are lost
+        packets = [
+            (seq, None if seq % 2 else (1020 + 10 * seq) * 1000) for seq in range(10)
+        ]
+        self.assertEqual(estimator.on_feedback(packets, 1200), 375000)
+        self.assertEqual(estimator.fraction_lost, 0.5)
+
+        # feedback for unknown packets is ignored
+        self.assertIsNone(estimator.on_feedback(packets, 1250))
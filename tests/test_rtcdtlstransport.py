@@ -4,22 +4,29 @@ from unittest import TestCase
 from unittest.mock import patch
 
 from aiortc.rtcdtlstransport import (
+    SRTP_AEAD_AES_128_GCM,
+    SRTP_AEAD_AES_256_GCM,
+    SRTP_AES128_CM_SHA1_80,
     DtlsError,
     RTCCertificate,
     RTCDtlsFingerprint,
     RTCDtlsParameters,
     RTCDtlsTransport,
     RtpRouter,
+    get_srtp_key_salt,
 )
 from aiortc.rtcrtpparameters import (
     RTCRtpCodecParameters,
     RTCRtpDecodingParameters,
+    RTCRtpHeaderExtensionParameters,
     RTCRtpReceiveParameters,
+    RTCRtpSendParameters,
 )
 from aiortc.rtp import (
     RTCP_PSFB_APP,
     RTCP_PSFB_PLI,
     RTCP_RTPFB_NACK,
+    TRANSPORT_CC_URI,
     RtcpByePacket,
     RtcpPsfbPacket,
     RtcpReceiverInfo,
@@ -55,19 +62,36 @@ class DummyDataReceiver:
 
 class DummyRtpReceiver:
     def __init__(self):
+        self.rtp_batches = []
         self.rtp_packets = []
         self.rtcp_packets = []
 
     def _handle_disconnect(self):
         pass
 
-    async def _handle_rtp_packet(self, packet, arrival_time_ms):
-        self.rtp_packets.append(packet)
+    async def _handle_rtp_packets(self, packets):
+        self.rtp_batches.append(len(packets))
+        self.rtp_packets.extend(packet for packet, arrival_time_ms in packets)
 
     async def _handle_rtcp_packet(self, packet):
         self.rtcp_packets.append(packet)
 
 
+class DummyRtpSender:
+    def __init__(self, ssrc):
+        self._ssrc = ssrc
+        self.target_bitrate = 500000
+
+    def _get_encoder_bitrate(self):
+        return self.target_bitrate
+
+    def _get_sent_bitrate(self, now_ms):
+        return 0
+
+    def _set_encoder_bitrate(self, bitrate):
+        self.target_bitrate = bitrate
+
+
 class RTCCertificateTest(TestCase):
     def test_generate(self):
         certificate = RTCCertificate.generateCertificate()
@@ -222,6 +246,12 @@ class RTCDtlsTransportTest(TestCase):
         )
         self.assertCounters(session1, session2, 2, 2)
 
+        # AES-GCM is preferred
+        self.assertEqual(session1._srtp_profile, SRTP_AEAD_AES_128_GCM)
+        self.assertEqual(session2._srtp_profile, SRTP_AEAD_AES_128_GCM)
+        stats = list(session1._get_stats().values())[0]
+        self.assertEqual(stats.srtpCipher, "AEAD_AES_128_GCM")
+
         # send RTP
         run(session1._send_rtp(RTP))
         run(asyncio.sleep(0.1))
@@ -251,6 +281,107 @@ class RTCDtlsTransportTest(TestCase):
         with self.assertRaises(ConnectionError):
             run(session1._send_rtp(RTP))
 
+    def test_rtp_batch(self):
+        transport1, transport2 = dummy_ice_transport_pair()
+        codecs = [
+            RTCRtpCodecParameters(mimeType="audio/PCMU", clockRate=8000, payloadType=0)
+        ]
+
+        certificate1 = RTCCertificate.generateCertificate()
+        session1 = RTCDtlsTransport(transport1, [certificate1])
+        receivers = [DummyRtpReceiver(), DummyRtpReceiver()]
+        for ssrc, receiver in zip([1234, 5678], receivers):
+            session1._register_rtp_receiver(
+                receiver,
+                RTCRtpReceiveParameters(
+                    codecs=codecs,
+                    encodings=[RTCRtpDecodingParameters(ssrc=ssrc, payloadType=0)],
+                ),
+            )
+
+        certificate2 = RTCCertificate.generateCertificate()
+        session2 = RTCDtlsTransport(transport2, [certificate2])
+
+        run(
+            asyncio.gather(
+                session1.start(session2.getLocalParameters()),
+                session2.start(session1.getLocalParameters()),
+            )
+        )
+
+        # the datagrams sent together are handled as one batch per receiver
+        packets = [
+            RtpPacket(payload_type=0, sequence_number=i, ssrc=[1234, 5678][i % 2])
+            for i in range(6)
+        ]
+        run(session2._send_rtp_batch([packet.serialize() for packet in packets]))
+        run(asyncio.sleep(0.1))
+        for receiver in receivers:
+            self.assertEqual(receiver.rtp_batches, [3])
+        self.assertEqual(
+            [p.sequence_number for p in receivers[1].rtp_packets], [1, 3, 5]
+        )
+
+        # shutdown
+        run(session1.stop())
+        run(session2.stop())
+
+    def test_transport_cc(self):
+        header_extensions = [
+            RTCRtpHeaderExtensionParameters(id=4, uri=TRANSPORT_CC_URI)
+        ]
+        transport1, transport2 = dummy_ice_transport_pair()
+
+        certificate1 = RTCCertificate.generateCertificate()
+        session1 = RTCDtlsTransport(transport1, [certificate1])
+        receiver1 = DummyRtpReceiver()
+        session1._register_rtp_receiver(
+            receiver1,
+            RTCRtpReceiveParameters(
+                codecs=[
+                    RTCRtpCodecParameters(
+                        mimeType="audio/PCMU", clockRate=8000, payloadType=0
+                    )
+                ],
+                encodings=[RTCRtpDecodingParameters(ssrc=1234, payloadType=0)],
+                headerExtensions=header_extensions,
+            ),
+        )
+
+        certificate2 = RTCCertificate.generateCertificate()
+        session2 = RTCDtlsTransport(transport2, [certificate2])
+        sender2 = DummyRtpSender(ssrc=1234)
+        session2._register_rtp_sender(
+            sender2, RTCRtpSendParameters(headerExtensions=header_extensions)
+        )
+
+        run(
+            asyncio.gather(
+                session1.start(session2.getLocalParameters()),
+                session2.start(session1.getLocalParameters()),
+            )
+        )
+
+        # send RTP, the transport sets the transport-wide sequence numbers
+        for i in range(3):
+            packet = RtpPacket(payload_type=0, sequence_number=i, ssrc=1234)
+            packet.extensions.transport_sequence_number = 0
+            run(session2._send_rtp(packet.serialize(session2._rtp_header_extensions_map)))
+        run(asyncio.sleep(0.1))
+        self.assertEqual(
+            [p.extensions.transport_sequence_number for p in receiver1.rtp_packets],
+            [0, 1, 2],
+        )
+
+        # the feedback is handled by the transport, not the senders
+        self.assertEqual(session2._bandwidth_estimator.fraction_lost, 0.0)
+        self.assertEqual(
+            sender2.target_bitrate, session2._bandwidth_estimator.target_bitrate
+        )
+
+        run(session1.stop())
+        run(session2.stop())
+
     def test_rtp_malformed(self):
         transport1, transport2 = dummy_ice_transport_pair()
 
@@ -260,6 +391,15 @@ class RTCDtlsTransportTest(TestCase):
         # receive truncated RTP
         run(session1._handle_rtp_data(RTP[0:8], 0))
 
+        # receive RTP with a truncated header extension
+        run(
+            session1._handle_rtp_data(
+                b"\x90\x00\x00\x01\x00\x00\x00\x00\x00\x00\x04\xd2"
+                + b"\xbe\xde\x00\x01\x93\x00\x00\x00",
+                0,
+            )
+        )
+
         # receive truncated RTCP
         run(session1._handle_rtcp_data(RTCP[0:8]))
 
@@ -454,6 +594,41 @@ class RTCDtlsTransportTest(TestCase):
         run(session2.stop())
 
 
+class SrtpKeySaltTest(TestCase):
+    def test_aead_aes_128_gcm(self):
+        material = bytes(range(56))
+        self.assertEqual(
+            get_srtp_key_salt(material, 0, SRTP_AEAD_AES_128_GCM),
+            bytes(range(0, 16)) + bytes(range(32, 44)),
+        )
+        self.assertEqual(
+            get_srtp_key_salt(material, 1, SRTP_AEAD_AES_128_GCM),
+            bytes(range(16, 32)) + bytes(range(44, 56)),
+        )
+
+    def test_aead_aes_256_gcm(self):
+        material = bytes(range(88))
+        self.assertEqual(
+            get_srtp_key_salt(material, 0, SRTP_AEAD_AES_256_GCM),
+            bytes(range(0, 32)) + bytes(range(64, 76)),
+        )
+        self.assertEqual(
+            get_srtp_key_salt(material, 1, SRTP_AEAD_AES_256_GCM),
+            bytes(range(32, 64)) + bytes(range(76, 88)),
+        )
+
+    def test_aes128_cm_sha1_80(self):
+        material = bytes(range(60))
+        self.assertEqual(
+            get_srtp_key_salt(material, 0, SRTP_AES128_CM_SHA1_80),
+            bytes(range(0, 16)) + bytes(range(32, 46)),
+        )
+        self.assertEqual(
+            get_srtp_key_salt(material, 1, SRTP_AES128_CM_SHA1_80),
+            bytes(range(16, 32)) + bytes(range(46, 60)),
+        )
+
+
 class RtpRouterTest(TestCase):
     def test_route_rtcp(self):
         receiver = object()
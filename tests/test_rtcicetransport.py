@@ -1,5 +1,6 @@
 import asyncio
 from unittest import TestCase
+from unittest.mock import patch
 
 import aioice.stun
 from aioice import ConnectionClosed
@@ -321,6 +322,51 @@ class RTCIceTransportTest(TestCase):
         self.assertEqual(transport_1.state, "closed")
         self.assertEqual(transport_2.state, "closed")
 
+    def test_recv_pending(self):
+        gatherer_1 = RTCIceGatherer()
+        transport_1 = RTCIceTransport(gatherer_1)
+
+        gatherer_2 = RTCIceGatherer()
+        transport_2 = RTCIceTransport(gatherer_2)
+
+        # nothing is pending before connecting
+        self.assertEqual(transport_1._recv_pending(10), [])
+
+        # connect
+        run(asyncio.gather(gatherer_1.gather(), gatherer_2.gather()))
+        for candidate in gatherer_2.getLocalCandidates():
+            run(transport_1.addRemoteCandidate(candidate))
+        for candidate in gatherer_1.getLocalCandidates():
+            run(transport_2.addRemoteCandidate(candidate))
+        run(
+            asyncio.gather(
+                transport_1.start(gatherer_2.getLocalParameters()),
+                transport_2.start(gatherer_1.getLocalParameters()),
+            )
+        )
+
+        # send datagrams and let them arrive
+        with patch("aiortc.clock.current_ms", return_value=1234):
+            for i in range(4):
+                run(transport_2._send(bytes([128, i])))
+            run(asyncio.sleep(0.1))
+
+        # the first is received as usual, the others are pending, and all of
+        # them keep the time they arrived
+        self.assertEqual(run(transport_1._recv_timed()), (b"\x80\x00", 1234))
+        self.assertEqual(
+            transport_1._recv_pending(2), [(b"\x80\x01", 1234), (b"\x80\x02", 1234)]
+        )
+        self.assertEqual(transport_1._recv_pending(10), [(b"\x80\x03", 1234)])
+        self.assertEqual(transport_1._recv_pending(10), [])
+
+        # cleanup
+        run(asyncio.gather(transport_1.stop(), transport_2.stop()))
+
+        # receiving after the connection is closed fails
+        with self.assertRaises(ConnectionError):
+            run(transport_1._recv())
+
     def test_connect_fail(self):
         gatherer_1 = RTCIceGatherer()
         transport_1 = RTCIceTransport(gatherer_1)
@@ -235,6 +235,53 @@ class RTCRtpCodecParametersTest(TestCase):
             ],
         )
 
+    def test_common_keypoints_binned(self):
+        local_codecs = [
+            RTCRtpCodecParameters(
+                mimeType="keypoints/binned",
+                clockRate=8000,
+                channels=1,
+                payloadType=121,
+                parameters={"jacobian-bits": "8"},
+            ),
+            RTCRtpCodecParameters(
+                mimeType="keypoints/binned",
+                clockRate=8000,
+                channels=1,
+                payloadType=122,
+                parameters={"jacobian-bits": "6"},
+            ),
+        ]
+        remote_codecs = [
+            RTCRtpCodecParameters(
+                mimeType="keypoints/binned",
+                clockRate=8000,
+                channels=1,
+                payloadType=100,
+                parameters={"jacobian-bits": "6"},
+            ),
+            RTCRtpCodecParameters(
+                mimeType="keypoints/binned",
+                clockRate=8000,
+                channels=1,
+                payloadType=101,
+                parameters={"jacobian-bits": "4"},
+            ),
+        ]
+        common = find_common_codecs(local_codecs, remote_codecs)
+        self.assertEqual(
+            common,
+            [
+                RTCRtpCodecParameters(
+                    mimeType="keypoints/binned",
+                    clockRate=8000,
+                    channels=1,
+                    payloadType=100,
+                    parameters={"jacobian-bits": "6"},
+                )
+            ],
+        )
+
     def test_filter_preferred(self):
         codecs = [
             RTCRtpCodecParameters(
@@ -2480,12 +2527,14 @@ a=rtpmap:0 PCMU/8000
 a=rtcp-fb:97 nack
 a=rtcp-fb:97 nack pli
 a=rtcp-fb:97 goog-remb
+a=rtcp-fb:97 transport-cc
 a=rtpmap:98 rtx/90000
 a=fmtp:98 apt=97
 a=rtpmap:99 H264/90000
 a=rtcp-fb:99 nack
 a=rtcp-fb:99 nack pli
 a=rtcp-fb:99 goog-remb
+a=rtcp-fb:99 transport-cc
 a=fmtp:99 packetization-mode=1;level-asymmetry-allowed=1;profile-level-id=42001f
 a=rtpmap:100 rtx/90000
 a=fmtp:100 apt=99
@@ -2493,6 +2542,7 @@ a=rtpmap:101 H264/90000
 a=rtcp-fb:101 nack
 a=rtcp-fb:101 nack pli
 a=rtcp-fb:101 goog-remb
+a=rtcp-fb:101 transport-cc
 a=fmtp:101 packetization-mode=1;level-asymmetry-allowed=1;profile-level-id=42e01f
 a=rtpmap:102 rtx/90000
 a=fmtp:102 apt=101
@@ -2530,12 +2580,14 @@ a=fmtp:102 apt=101
 a=rtcp-fb:97 nack
 a=rtcp-fb:97 nack pli
 a=rtcp-fb:97 goog-remb
+a=rtcp-fb:97 transport-cc
 a=rtpmap:98 rtx/90000
 a=fmtp:98 apt=97
 a=rtpmap:99 H264/90000
 a=rtcp-fb:99 nack
 a=rtcp-fb:99 nack pli
 a=rtcp-fb:99 goog-remb
+a=rtcp-fb:99 transport-cc
 a=fmtp:99 packetization-mode=1;level-asymmetry-allowed=1;profile-level-id=42001f
 a=rtpmap:100 rtx/90000
 a=fmtp:100 apt=99
@@ -2543,6 +2595,7 @@ a=rtpmap:101 H264/90000
 a=rtcp-fb:101 nack
 a=rtcp-fb:101 nack pli
 a=rtcp-fb:101 goog-remb
+a=rtcp-fb:101 transport-cc
 a=fmtp:101 packetization-mode=1;level-asymmetry-allowed=1;profile-level-id=42e01f
 a=rtpmap:102 rtx/90000
 a=fmtp:102 apt=101
@@ -2877,6 +2930,7 @@ a=fmtp:102 apt=101
 a=rtcp-fb:99 nack
 a=rtcp-fb:99 nack pli
 a=rtcp-fb:99 goog-remb
+a=rtcp-fb:99 transport-cc
 a=fmtp:99 packetization-mode=1;level-asymmetry-allowed=1;profile-level-id=42001f
 a=rtpmap:100 rtx/90000
 a=fmtp:100 apt=99
@@ -2884,6 +2938,7 @@ a=rtpmap:101 H264/90000
 a=rtcp-fb:101 nack
 a=rtcp-fb:101 nack pli
 a=rtcp-fb:101 goog-remb
+a=rtcp-fb:101 transport-cc
 a=fmtp:101 packetization-mode=1;level-asymmetry-allowed=1;profile-level-id=42e01f
 a=rtpmap:102 rtx/90000
 a=fmtp:102 apt=101
@@ -2891,6 +2946,7 @@ a=rtpmap:97 VP8/90000
 a=rtcp-fb:97 nack
 a=rtcp-fb:97 nack pli
 a=rtcp-fb:97 goog-remb
+a=rtcp-fb:97 transport-cc
 a=rtpmap:98 rtx/90000
 a=fmtp:98 apt=97
 """
@@ -2927,6 +2983,7 @@ a=fmtp:98 apt=97
 a=rtcp-fb:99 nack
 a=rtcp-fb:99 nack pli
 a=rtcp-fb:99 goog-remb
+a=rtcp-fb:99 transport-cc
 a=fmtp:99 packetization-mode=1;level-asymmetry-allowed=1;profile-level-id=42001f
 a=rtpmap:100 rtx/90000
 a=fmtp:100 apt=99
@@ -2934,6 +2991,7 @@ a=rtpmap:101 H264/90000
 a=rtcp-fb:101 nack
 a=rtcp-fb:101 nack pli
 a=rtcp-fb:101 goog-remb
+a=rtcp-fb:101 transport-cc
 a=fmtp:101 packetization-mode=1;level-asymmetry-allowed=1;profile-level-id=42e01f
 a=rtpmap:102 rtx/90000
 a=fmtp:102 apt=101
@@ -2941,6 +2999,7 @@ a=rtpmap:97 VP8/90000
 a=rtcp-fb:97 nack
 a=rtcp-fb:97 nack pli
 a=rtcp-fb:97 goog-remb
+a=rtcp-fb:97 transport-cc
 a=rtpmap:98 rtx/90000
 a=fmtp:98 apt=97
 """
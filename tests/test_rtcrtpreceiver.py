@@ -1,22 +1,35 @@
 import asyncio
 import fractions
+import threading
 from collections import OrderedDict
 from unittest import TestCase
 from unittest.mock import patch
 
-from aiortc.codecs import PCMU_CODEC, get_encoder
+from aiortc.codecs import (
+    KEYPOINTS_DELTA_CODEC,
+    KEYPOINTS_RED_CODEC,
+    PCMU_CODEC,
+    get_decoder,
+    get_encoder,
+)
 from aiortc.exceptions import InvalidStateError
-from aiortc.mediastreams import MediaStreamError
+from aiortc.mediastreams import KeypointsFrame, MediaStreamError
 from aiortc.rtcrtpparameters import (
     RTCRtpCapabilities,
     RTCRtpCodecCapability,
     RTCRtpCodecParameters,
     RTCRtpEncodingParameters,
     RTCRtpHeaderExtensionCapability,
+    RTCRtpHeaderExtensionParameters,
     RTCRtpReceiveParameters,
     RTCRtpRtxParameters,
 )
 from aiortc.rtcrtpreceiver import (
+    DECODER_QUEUE_SIZE,
+    NACK_MAX_AGE_MS,
+    NACK_MAX_MISSING,
+    NACK_MAX_RETRIES,
+    DecoderScheduler,
     NackGenerator,
     RemoteStreamTrack,
     RTCRtpReceiver,
@@ -24,11 +37,19 @@ from aiortc.rtcrtpreceiver import (
     StreamStatistics,
     TimestampMapper,
 )
-from aiortc.rtp import RtcpPacket, RtpPacket
+from aiortc.rtp import (
+    FRAME_INDEX_URI,
+    TRANSPORT_CC_URI,
+    HeaderExtensionsMap,
+    RtcpPacket,
+    RtpPacket,
+    pack_red_payload,
+)
 from aiortc.stats import RTCStatsReport
-from aiortc.utils import uint16_add
+from aiortc.utils import DropOldestQueue, uint16_add
 
 from .codecs import CodecTestCase
+from .test_keypointcodec import create_moving_keypoint_dict
 from .utils import dummy_dtls_transport_pair, load, run
 
 VP8_CODEC = RTCRtpCodecParameters(
@@ -70,6 +91,33 @@ def create_rtp_video_packets(self, codec, frames, seq=0):
     return packets
 
 
+def create_rtp_red_packets(count):
+    """
+    Create keypoints packets which each carry the two previous frames.
+    """
+    encoder = get_encoder(KEYPOINTS_DELTA_CODEC)
+    history = []
+    packets = []
+    for i in range(count):
+        frame = KeypointsFrame(create_moving_keypoint_dict(i), i * 160, i, 7)
+        payload = encoder.encode(frame)[0][0]
+        redundancy = [((i - j) * 160, data) for j, data in history[-2:]]
+        packets.append(
+            RtpPacket(
+                payload_type=KEYPOINTS_RED_CODEC.payloadType,
+                marker=1,
+                sequence_number=i,
+                ssrc=1234,
+                timestamp=i * 160,
+                payload=pack_red_payload(
+                    KEYPOINTS_DELTA_CODEC.payloadType, payload, redundancy
+                ),
+            )
+        )
+        history.append((i, payload))
+    return packets
+
+
 class ClosedDtlsTransport:
     state = "closed"
 
@@ -79,8 +127,7 @@ class NackGeneratorTest(TestCase):
         generator = NackGenerator()
 
         for packet in create_rtp_packets(20, 0):
-            missed = generator.add(packet)
-            self.assertEqual(missed, False)
+            self.assertEqual(generator.add(packet), (False, False))
 
         self.assertEqual(generator.missing, set())
 
@@ -91,15 +138,188 @@ class NackGeneratorTest(TestCase):
         packets = create_rtp_packets(3, 0)
         missing = packets.pop(1)
         for packet in packets:
-            missed = generator.add(packet)
-            self.assertEqual(missed, packet.sequence_number == 2)
+            self.assertEqual(
+                generator.add(packet), (packet.sequence_number == 2, False)
+            )
 
         self.assertEqual(generator.missing, set([1]))
 
         # late arrival
-        missed = generator.add(missing)
-        self.assertEqual(missed, False)
+        self.assertEqual(generator.add(missing), (False, False))
+        self.assertEqual(generator.missing, set())
+
+    def test_retry_after_rtt(self):
+        generator = NackGenerator()
+
+        # receive packets: 0, <1 and 2 missing>, 3
+        packets = create_rtp_packets(4, 0)
+        generator.add(packets[0], 0)
+        generator.add(packets[3], 10)
+        self.assertEqual(generator.get_nack_batch(10, rtt_ms=50), [1, 2])
+
+        # nothing is due within a round-trip time
+        self.assertEqual(generator.get_nack_batch(30, rtt_ms=50), [])
+        generator.add(packets[2], 40)
+        self.assertEqual(generator.get_nack_batch(59, rtt_ms=50), [])
+
+        # the remaining packet is requested again
+        self.assertEqual(generator.get_nack_batch(60, rtt_ms=50), [1])
+        self.assertEqual(generator.get_nack_batch(80, rtt_ms=50), [])
+        self.assertEqual(generator.get_nack_batch(110, rtt_ms=50), [1])
+
+    def test_abandon_max_retries(self):
+        generator = NackGenerator()
+
+        packets = create_rtp_packets(3, 0)
+        generator.add(packets[0], 0)
+        generator.add(packets[2], 0)
+        for i in range(NACK_MAX_RETRIES):
+            self.assertEqual(generator.get_nack_batch(i * 10, rtt_ms=10), [1])
+        self.assertEqual(generator.get_nack_batch(NACK_MAX_RETRIES * 10, rtt_ms=10), [])
+        self.assertEqual(generator.missing, set())
+        self.assertEqual(generator.packets_abandoned, 1)
+
+    def test_abandon_max_age(self):
+        generator = NackGenerator()
+
+        packets = create_rtp_packets(3, 0)
+        generator.add(packets[0], 0)
+        generator.add(packets[2], 0)
+        self.assertEqual(generator.get_nack_batch(0, rtt_ms=400), [1])
+        self.assertEqual(generator.get_nack_batch(NACK_MAX_AGE_MS + 1, rtt_ms=400), [])
+        self.assertEqual(generator.missing, set())
+
+    def test_abandon_past_horizon(self):
+        generator = NackGenerator()
+
+        # receive packets: 0, <1 to 4 missing>, 5
+        packets = create_rtp_packets(6, 0)
+        generator.add(packets[0], 0)
+        generator.add(packets[5], 0)
+
+        # the jitter buffer no longer needs packets before 3
+        self.assertEqual(generator.get_nack_batch(0, rtt_ms=50, horizon=3), [3, 4])
+        self.assertEqual(generator.missing, set([3, 4]))
+        self.assertEqual(generator.packets_abandoned, 2)
+
+    def test_bounded_missing(self):
+        generator = NackGenerator()
+
+        packets = create_rtp_packets(1, 0) + create_rtp_packets(
+            1, NACK_MAX_MISSING + 2
+        )
+        generator.add(packets[0], 0)
+
+        # too many packets are missing, a keyframe is needed
+        self.assertEqual(generator.add(packets[1], 0), (False, True))
         self.assertEqual(generator.missing, set())
+        self.assertEqual(generator.packets_abandoned, NACK_MAX_MISSING + 1)
+        self.assertEqual(generator.max_seq, NACK_MAX_MISSING + 2)
+
+    def test_bounded_missing_trims_oldest(self):
+        generator = NackGenerator()
+        generator.add(create_rtp_packets(1, 0)[0], 0)
+
+        # two gaps which together exceed the bound
+        half = NACK_MAX_MISSING // 2 + 10
+        generator.add(create_rtp_packets(1, half + 1)[0], 0)
+        self.assertEqual(len(generator.missing), half)
+        missed, keyframe_needed = generator.add(
+            create_rtp_packets(1, 2 * half + 2)[0], 0
+        )
+        self.assertEqual((missed, keyframe_needed), (True, True))
+
+        # the oldest missing packets were given up on
+        self.assertEqual(len(generator.missing), NACK_MAX_MISSING)
+        self.assertEqual(generator.packets_abandoned, 2 * half - NACK_MAX_MISSING)
+        self.assertEqual(min(generator.missing), 2 * half - NACK_MAX_MISSING + 1)
+
+
+class DummyDecoder:
+    def decode(self, encoded_frame):
+        return [encoded_frame.data]
+
+
+class DummyEncodedFrame:
+    def __init__(self, data):
+        self.data = data
+        self.frame_index = data
+        self.timestamp = data
+
+
+class DecoderSchedulerTest(TestCase):
+    @patch("aiortc.rtcrtpreceiver.get_decoder")
+    def test_ordering(self, mock_get_decoder):
+        mock_get_decoder.side_effect = lambda codec: DummyDecoder()
+        loop = asyncio.get_event_loop()
+        scheduler = DecoderScheduler(workers=2)
+        self.assertEqual(scheduler.workers, 2)
+
+        streams = []
+        for i in range(5):
+            track = RemoteStreamTrack(kind="video")
+            track._queue_size = 100
+            input_q = DropOldestQueue(maxsize=100)
+            streams.append((scheduler.add_stream(loop, input_q, track), input_q, track))
+
+        # interleave the frames of all streams
+        for j in range(50):
+            for stream, input_q, track in streams:
+                input_q.put((VP8_CODEC, DummyEncodedFrame(j)))
+                stream.schedule()
+        for stream, input_q, track in streams:
+            input_q.put(None)
+            stream.schedule()
+            stream.wait()
+
+        for stream, input_q, track in streams:
+            frames = [run(track.recv()) for j in range(50)]
+            self.assertEqual(frames, list(range(50)))
+            with self.assertRaises(MediaStreamError):
+                run(track.recv())
+
+        scheduler.shutdown()
+        self.assertEqual(scheduler.workers, 0)
+
+
+class RemoteStreamTrackTest(TestCase):
+    def test_recv_from_thread(self):
+        loop = asyncio.get_event_loop()
+        track = RemoteStreamTrack(kind="video")
+
+        thread = threading.Thread(
+            target=track._put_frames, args=(loop, [("frame0", 0), ("frame1", 1)])
+        )
+        thread.start()
+        thread.join()
+
+        self.assertEqual(run(track.recv()), "frame0")
+        self.assertEqual(track.frame_index("frame0"), 0)
+        self.assertEqual(run(track.recv()), "frame1")
+        self.assertEqual(track.frame_index("frame1"), 1)
+
+        track._put_frames(loop, [None])
+        with self.assertRaises(MediaStreamError):
+            run(track.recv())
+        self.assertEqual(track.readyState, "ended")
+
+    def test_drop_oldest(self):
+        loop = asyncio.get_event_loop()
+        track = RemoteStreamTrack(kind="video")
+        track._queue_size = 2
+
+        track._put_frames(loop, [("frame%d" % i, i) for i in range(5)])
+        self.assertEqual(track.frames_dropped, 3)
+        self.assertEqual(run(track.recv()), "frame3")
+        self.assertEqual(run(track.recv()), "frame4")
+
+    def test_audio_unbounded(self):
+        loop = asyncio.get_event_loop()
+        track = RemoteStreamTrack(kind="audio")
+
+        track._put_frames(loop, [("frame%d" % i, i) for i in range(20)])
+        self.assertEqual(track.frames_dropped, 0)
+        self.assertEqual(run(track.recv()), "frame0")
 
 
 class StreamStatisticsTest(TestCase):
@@ -235,7 +455,8 @@ class RTCRtpReceiverTest(CodecTestCase):
             [
                 RTCRtpHeaderExtensionCapability(
                     uri="urn:ietf:params:rtp-hdrext:sdes:mid"
-                )
+                ),
+                RTCRtpHeaderExtensionCapability(uri=TRANSPORT_CC_URI),
             ],
         )
 
@@ -280,6 +501,8 @@ class RTCRtpReceiverTest(CodecTestCase):
                 RTCRtpHeaderExtensionCapability(
                     uri="http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time"
                 ),
+                RTCRtpHeaderExtensionCapability(uri=FRAME_INDEX_URI),
+                RTCRtpHeaderExtensionCapability(uri=TRANSPORT_CC_URI),
             ],
         )
 
@@ -368,6 +591,49 @@ class RTCRtpReceiverTest(CodecTestCase):
         with self.assertRaises(MediaStreamError):
             run(receiver.track.recv())
 
+    def test_rtp_audio_frames_not_dropped(self):
+        decoded = []
+        resume = threading.Event()
+
+        class SlowDecoder:
+            def __init__(self):
+                self.decoder = get_decoder(PCMU_CODEC)
+
+            def decode(self, encoded_frame):
+                resume.wait()
+                frames = self.decoder.decode(encoded_frame)
+                decoded.extend(frames)
+                return frames
+
+        with patch("aiortc.rtcrtpreceiver.get_decoder", return_value=SlowDecoder()):
+            receiver = RTCRtpReceiver("audio", self.local_transport)
+            receiver._track = RemoteStreamTrack(kind="audio")
+            run(receiver.receive(RTCRtpReceiveParameters(codecs=[PCMU_CODEC])))
+
+            # receive more frames than a video decoder queue holds while
+            # the decoder is stalled
+            for i in range(DECODER_QUEUE_SIZE * 4):
+                packet = RtpPacket.parse(load("rtp.bin"))
+                packet.sequence_number += i
+                packet.timestamp += i * 160
+                run(receiver._handle_rtp_packet(packet, arrival_time_ms=i * 20))
+
+            report = run(receiver.getStats())
+            stats = [s for s in report.values() if s.type == "inbound-rtp"][0]
+            self.assertGreater(stats.decoderQueueDepth, DECODER_QUEUE_SIZE)
+            self.assertEqual(stats.decoderFramesDropped, 0)
+
+            # the decoder catches up, the track is not read until the end
+            resume.set()
+            run(receiver.stop())
+
+        frames = []
+        with self.assertRaises(MediaStreamError):
+            while True:
+                frames.append(run(receiver.track.recv()))
+        self.assertEqual(frames, decoded)
+        self.assertEqual(receiver.track.frames_dropped, 0)
+
     def test_rtp_missing_video_packet(self):
         nacks = []
         pli = []
@@ -405,6 +671,119 @@ class RTCRtpReceiverTest(CodecTestCase):
         # shutdown
         run(receiver.stop())
 
+    def test_rtp_batch(self):
+        nacks = []
+
+        async def mock_send_rtcp_nack(*args):
+            nacks.append(args)
+
+        receiver = RTCRtpReceiver("video", self.local_transport)
+        receiver._send_rtcp_nack = mock_send_rtcp_nack
+        receiver._track = RemoteStreamTrack(kind="video")
+        run(receiver.receive(RTCRtpReceiveParameters(codecs=[VP8_CODEC])))
+
+        # receive RTP with two gaps in a single batch
+        packets = create_rtp_video_packets(self, codec=VP8_CODEC, frames=10)
+        batch = [packets[0], packets[2], packets[3], packets[6], packets[9]]
+        run(receiver._handle_rtp_packets([(packet, 0) for packet in batch]))
+
+        # a single NACK covers the whole batch
+        self.assertEqual(nacks, [(1234, [1, 4, 5, 7, 8])])
+
+        # shutdown
+        run(receiver.stop())
+
+    def test_rtp_red(self):
+        nacks = []
+
+        async def mock_send_rtcp_nack(*args):
+            nacks.append(args)
+
+        receiver = RTCRtpReceiver("keypoints", self.local_transport)
+        receiver._send_rtcp_nack = mock_send_rtcp_nack
+        receiver._track = RemoteStreamTrack(kind="keypoints")
+        run(
+            receiver.receive(
+                RTCRtpReceiveParameters(
+                    codecs=[KEYPOINTS_DELTA_CODEC, KEYPOINTS_RED_CODEC]
+                )
+            )
+        )
+
+        # each packet carries the two previous delta frames
+        packets = create_rtp_red_packets(5)
+
+        # the lost packet is recovered from the next one
+        batch = [packets[0], packets[1], packets[3], packets[4]]
+        run(receiver._handle_rtp_packets([(packet, 0) for packet in batch]))
+        self.assertEqual(nacks, [])
+
+        for i in range(5):
+            frame = run(receiver.track.recv())
+            self.assertEqual(frame.frame_index, i)
+
+        report = run(receiver.getStats())
+        stats = [s for s in report.values() if s.type == "inbound-rtp"][0]
+        self.assertEqual(stats.packetsRecovered, 1)
+
+        # shutdown
+        run(receiver.stop())
+
+    def test_rtp_red_reordered(self):
+        async def mock_send_rtcp_nack(*args):
+            pass
+
+        receiver = RTCRtpReceiver("keypoints", self.local_transport)
+        receiver._send_rtcp_nack = mock_send_rtcp_nack
+        receiver._track = RemoteStreamTrack(kind="keypoints")
+        run(
+            receiver.receive(
+                RTCRtpReceiveParameters(
+                    codecs=[KEYPOINTS_DELTA_CODEC, KEYPOINTS_RED_CODEC]
+                )
+            )
+        )
+
+        # the packet arriving after its redundant block is not a recovery
+        packets = create_rtp_red_packets(5)
+        batch = [packets[0], packets[1], packets[3], packets[2], packets[4]]
+        run(receiver._handle_rtp_packets([(packet, 0) for packet in batch]))
+
+        report = run(receiver.getStats())
+        stats = [s for s in report.values() if s.type == "inbound-rtp"][0]
+        self.assertEqual(stats.packetsRecovered, 0)
+
+        # shutdown
+        run(receiver.stop())
+
+    def test_rtp_red_still_missing(self):
+        async def mock_send_rtcp_nack(*args):
+            pass
+
+        receiver = RTCRtpReceiver("keypoints", self.local_transport)
+        receiver._send_rtcp_nack = mock_send_rtcp_nack
+        receiver._track = RemoteStreamTrack(kind="keypoints")
+        run(
+            receiver.receive(
+                RTCRtpReceiveParameters(
+                    codecs=[KEYPOINTS_DELTA_CODEC, KEYPOINTS_RED_CODEC]
+                )
+            )
+        )
+
+        # packets 2 and 3 are recovered from packet 4, packet 1 is still
+        # missing when the late packet 3 brings its redundant block
+        packets = create_rtp_red_packets(5)
+        batch = [packets[0], packets[4], packets[3]]
+        run(receiver._handle_rtp_packets([(packet, 0) for packet in batch]))
+
+        report = run(receiver.getStats())
+        stats = [s for s in report.values() if s.type == "inbound-rtp"][0]
+        self.assertEqual(stats.packetsRecovered, 2)
+
+        # shutdown
+        run(receiver.stop())
+
     def test_rtp_empty_video_packet(self):
         receiver = RTCRtpReceiver("video", self.local_transport)
         self.assertEqual(receiver.transport, self.local_transport)
@@ -433,6 +812,38 @@ class RTCRtpReceiverTest(CodecTestCase):
         # shutdown
         run(receiver.stop())
 
+    def test_rtp_invalid_header_extension(self):
+        extensions_map = HeaderExtensionsMap()
+        extensions_map.configure(
+            RTCRtpReceiveParameters(
+                headerExtensions=[
+                    RTCRtpHeaderExtensionParameters(
+                        id=3,
+                        uri="http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time",
+                    )
+                ]
+            )
+        )
+
+        receiver = RTCRtpReceiver("video", self.local_transport)
+        receiver._track = RemoteStreamTrack(kind="video")
+        run(receiver.receive(RTCRtpReceiveParameters(codecs=[VP8_CODEC])))
+
+        # receive RTP whose 1-byte abs-send-time cannot be decoded
+        packet = RtpPacket.parse(
+            b"\x90\x64\x00\x01\x00\x00\x00\x00\x00\x00\x04\xd2"
+            + b"\xbe\xde\x00\x01\x30\x01\x00\x00\x10",
+            extensions_map,
+        )
+        run(receiver._handle_rtp_packet(packet, arrival_time_ms=0))
+        report = run(receiver.getStats())
+        self.assertEqual(
+            [s for s in report.values() if s.type == "inbound-rtp"], []
+        )
+
+        # shutdown
+        run(receiver.stop())
+
     def test_rtp_unknown_payload_type(self):
         receiver = RTCRtpReceiver("video", self.local_transport)
         self.assertEqual(receiver.transport, self.local_transport)
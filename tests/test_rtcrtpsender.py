@@ -1,4 +1,5 @@
 import asyncio
+import threading
 from collections import OrderedDict
 from struct import pack
 from unittest import TestCase
@@ -6,7 +7,7 @@ from unittest import TestCase
 from aiortc import MediaStreamTrack
 from aiortc.codecs import PCMU_CODEC
 from aiortc.exceptions import InvalidStateError
-from aiortc.mediastreams import AudioStreamTrack, VideoStreamTrack
+from aiortc.mediastreams import AudioStreamTrack, MediaStreamError, VideoStreamTrack
 from aiortc.rtcrtpparameters import (
     RTCRtpCapabilities,
     RTCRtpCodecCapability,
@@ -14,11 +15,13 @@ from aiortc.rtcrtpparameters import (
     RTCRtpHeaderExtensionCapability,
     RTCRtpParameters,
 )
-from aiortc.rtcrtpsender import RTCRtpSender
+from aiortc.rtcrtpsender import EncodePipeline, RTCRtpSender, RtpHistory
 from aiortc.rtp import (
+    FRAME_INDEX_URI,
     RTCP_PSFB_APP,
     RTCP_PSFB_PLI,
     RTCP_RTPFB_NACK,
+    TRANSPORT_CC_URI,
     RtcpPsfbPacket,
     RtcpReceiverInfo,
     RtcpRrPacket,
@@ -26,6 +29,7 @@ from aiortc.rtp import (
     RtpPacket,
     is_rtcp,
     pack_remb_fci,
+    unpack_red_payload,
 )
 from aiortc.stats import RTCStatsReport
 
@@ -43,6 +47,101 @@ class BuggyStreamTrack(MediaStreamTrack):
         raise Exception("I'm a buggy track!")
 
 
+class EncodePipelineTest(TestCase):
+    def test_encode(self):
+        async def encode():
+            pipeline = EncodePipeline(lambda frame: ([frame], len(frame)))
+            pipeline.put(b"a", 0)
+            pipeline.put(b"bb", 1)
+            pipeline.close()
+            self.assertEqual(await pipeline.get(), ([b"a"], 1, 0))
+            self.assertEqual(await pipeline.get(), ([b"bb"], 2, 1))
+            with self.assertRaises(MediaStreamError):
+                await pipeline.get()
+
+        run(encode())
+
+    def test_drop_if_behind(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def encode(frame):
+            started.set()
+            release.wait()
+            return [frame], 0
+
+        async def encode_frames():
+            pipeline = EncodePipeline(encode, queue_size=2)
+
+            # the encoder is busy with the first frame
+            self.assertEqual(pipeline.put(b"0", 0), 0)
+            started.wait()
+            for i in range(1, 5):
+                pipeline.put(b"%d" % i, i)
+            self.assertEqual(pipeline.frames_dropped, 2)
+            self.assertEqual(pipeline.queue_depth, 2)
+
+            release.set()
+            frame_indices = []
+            for i in range(3):
+                payloads, timestamp, frame_index = await pipeline.get()
+                frame_indices.append(frame_index)
+            self.assertEqual(frame_indices, [0, 3, 4])
+            pipeline.stop()
+
+        run(encode_frames())
+
+    def test_error(self):
+        def encode(frame):
+            raise ValueError("bad frame")
+
+        async def encode_frames():
+            pipeline = EncodePipeline(encode)
+            pipeline.put(b"a", 0)
+            with self.assertRaises(ValueError):
+                await pipeline.get()
+
+        run(encode_frames())
+
+
+class RtpHistoryTest(TestCase):
+    def test_expire_by_duration(self):
+        history = RtpHistory(duration=1.0)
+        for i in range(300):
+            history.add(i, b"x" * 10, i / 128)
+
+        # more than 128 packets are kept
+        self.assertEqual(len(history), 129)
+        self.assertEqual(history.bytes, 1290)
+        self.assertIsNone(history.get(170))
+        self.assertEqual(history.get(171).data, b"x" * 10)
+        self.assertEqual(history.get(299).sequence_number, 299)
+
+        history.expire(5.0)
+        self.assertEqual(len(history), 0)
+        self.assertEqual(history.bytes, 0)
+
+    def test_expire_by_size(self):
+        history = RtpHistory(max_bytes=1000)
+        for i in range(20):
+            history.add(i, b"x" * 100, 0)
+
+        self.assertEqual(len(history), 10)
+        self.assertEqual(history.bytes, 1000)
+        self.assertIsNone(history.get(9))
+        self.assertIsNotNone(history.get(10))
+
+    def test_sequence_number_reused(self):
+        history = RtpHistory()
+        history.add(1, b"old", 0)
+        history.add(2, b"other", 0)
+        history.add(1, b"new", 0)
+
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history.bytes, 8)
+        self.assertEqual(history.get(1).data, b"new")
+
+
 class RTCRtpSenderTest(TestCase):
     def setUp(self):
         self.local_transport, self.remote_transport = dummy_dtls_transport_pair()
@@ -74,7 +173,8 @@ class RTCRtpSenderTest(TestCase):
             [
                 RTCRtpHeaderExtensionCapability(
                     uri="urn:ietf:params:rtp-hdrext:sdes:mid"
-                )
+                ),
+                RTCRtpHeaderExtensionCapability(uri=TRANSPORT_CC_URI),
             ],
         )
 
@@ -119,6 +219,8 @@ class RTCRtpSenderTest(TestCase):
                 RTCRtpHeaderExtensionCapability(
                     uri="http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time"
                 ),
+                RTCRtpHeaderExtensionCapability(uri=FRAME_INDEX_URI),
+                RTCRtpHeaderExtensionCapability(uri=TRANSPORT_CC_URI),
             ],
         )
 
@@ -242,7 +344,12 @@ class RTCRtpSenderTest(TestCase):
             if not is_rtcp(data):
                 await queue.put(RtpPacket.parse(data))
 
+        async def mock_send_rtp_batch(packets):
+            for data in packets:
+                await mock_send_rtp(data)
+
         self.local_transport._send_rtp = mock_send_rtp
+        self.local_transport._send_rtp_batch = mock_send_rtp_batch
 
         sender = RTCRtpSender(VideoStreamTrack(), self.local_transport)
         self.assertEqual(sender.kind, "video")
@@ -267,7 +374,12 @@ class RTCRtpSenderTest(TestCase):
             if not is_rtcp(data):
                 await queue.put(RtpPacket.parse(data))
 
+        async def mock_send_rtp_batch(packets):
+            for data in packets:
+                await mock_send_rtp(data)
+
         self.local_transport._send_rtp = mock_send_rtp
+        self.local_transport._send_rtp_batch = mock_send_rtp_batch
 
         sender = RTCRtpSender(VideoStreamTrack(), self.local_transport)
         sender._ssrc = 1234
@@ -304,7 +416,12 @@ class RTCRtpSenderTest(TestCase):
             if not is_rtcp(data):
                 await queue.put(RtpPacket.parse(data))
 
+        async def mock_send_rtp_batch(packets):
+            for data in packets:
+                await mock_send_rtp(data)
+
         self.local_transport._send_rtp = mock_send_rtp
+        self.local_transport._send_rtp_batch = mock_send_rtp_batch
 
         sender = RTCRtpSender(VideoStreamTrack(), self.local_transport)
         sender._ssrc = 1234
@@ -347,6 +464,63 @@ class RTCRtpSenderTest(TestCase):
         self.assertEqual(found_rtx.ssrc, 2345)
         self.assertEqual(found_rtx.payload[0:2], pack("!H", packet.sequence_number))
 
+    def test_send_red(self):
+        """
+        Send the payloads of the previous frames with each packet.
+        """
+        queue = asyncio.Queue()
+
+        async def mock_send_rtp_batch(packets):
+            for data in packets:
+                if not is_rtcp(data):
+                    await queue.put(RtpPacket.parse(data))
+
+        self.local_transport._send_rtp_batch = mock_send_rtp_batch
+
+        sender = RTCRtpSender(AudioStreamTrack(), self.local_transport)
+        run(
+            sender.send(
+                RTCRtpParameters(
+                    codecs=[
+                        PCMU_CODEC,
+                        RTCRtpCodecParameters(
+                            mimeType="audio/red",
+                            clockRate=8000,
+                            channels=1,
+                            payloadType=127,
+                        ),
+                    ]
+                )
+            )
+        )
+
+        # wait for four packets to be transmitted, then shutdown
+        packets = [run(queue.get()) for i in range(4)]
+        run(sender.stop())
+
+        primaries = []
+        for i, packet in enumerate(packets):
+            self.assertEqual(packet.payload_type, 127)
+            blocks = unpack_red_payload(packet.payload)
+            self.assertEqual(len(blocks), min(i, 2) + 1)
+            self.assertEqual(
+                [(pt, offset) for pt, offset, data in blocks],
+                [(0, 160 * (len(blocks) - 1 - j)) for j in range(len(blocks))],
+            )
+            self.assertEqual(
+                [data for pt, offset, data in blocks[:-1]], primaries[-2:]
+            )
+            primaries.append(blocks[-1][2])
+
+        # the redundant blocks count towards the bytes sent
+        while not queue.empty():
+            packets.append(queue.get_nowait())
+        report = run(sender.getStats())
+        stats = [s for s in report.values() if s.type == "outbound-rtp"][0]
+        self.assertGreaterEqual(
+            stats.bytesSent, sum(len(packet.payload) for packet in packets)
+        )
+
     def test_stop(self):
         sender = RTCRtpSender(AudioStreamTrack(), self.local_transport)
         self.assertEqual(sender.kind, "audio")
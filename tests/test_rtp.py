@@ -3,6 +3,8 @@ from unittest import TestCase
 from aiortc import rtp
 from aiortc.rtcrtpparameters import RTCRtpHeaderExtensionParameters, RTCRtpParameters
 from aiortc.rtp import (
+    RTCP_RTPFB_TRANSPORT_CC,
+    TRANSPORT_CC_URI,
     RtcpByePacket,
     RtcpPacket,
     RtcpPsfbPacket,
@@ -11,15 +13,22 @@ from aiortc.rtp import (
     RtcpSdesPacket,
     RtcpSrPacket,
     RtpPacket,
+    RtpPayload,
     clamp_packets_lost,
+    find_header_extension,
     pack_header_extensions,
     pack_packets_lost,
+    pack_red_payload,
     pack_remb_fci,
+    pack_transport_cc_fci,
     unpack_header_extensions,
     unpack_packets_lost,
+    unpack_red_payload,
     unpack_remb_fci,
+    unpack_transport_cc_fci,
     unwrap_rtx,
     wrap_rtx,
+    wrap_rtx_data,
 )
 
 from .utils import load
@@ -216,6 +225,19 @@ class RtcpPacketTest(TestCase):
             RtcpPacket.parse(data)
         self.assertEqual(str(cm.exception), "RTCP RTP feedback length is invalid")
 
+    def test_rtpfb_transport_cc(self):
+        fci = pack_transport_cc_fci(10, 3, [64000, 64250, None, 164000])
+        packet = RtcpRtpfbPacket(
+            fmt=RTCP_RTPFB_TRANSPORT_CC, ssrc=1234, media_ssrc=5678, fci=fci
+        )
+        data = bytes(packet)
+
+        packets = RtcpPacket.parse(data)
+        self.assertEqual(len(packets), 1)
+        self.assertEqual(packets[0], packet)
+        self.assertEqual(packets[0].lost, [])
+        self.assertEqual(bytes(packets[0]), data)
+
     def test_compound(self):
         data = load("rtcp_sr.bin") + load("rtcp_sdes.bin")
 
@@ -369,6 +391,209 @@ class RtpPacketTest(TestCase):
         self.assertEqual(len(packet.payload), 54)
         self.assertEqual(packet.serialize(extensions_map), data)
 
+    def test_with_frame_index(self):
+        extensions_map = rtp.HeaderExtensionsMap()
+        extensions_map.configure(
+            RTCRtpParameters(
+                headerExtensions=[
+                    RTCRtpHeaderExtensionParameters(id=3, uri=rtp.FRAME_INDEX_URI)
+                ]
+            )
+        )
+
+        packet = RtpPacket(payload_type=97, sequence_number=1234, timestamp=5678)
+        packet.extensions.frame_index = 70000
+        packet.payload = b"\x01\x02"
+        data = packet.serialize(extensions_map)
+
+        parsed = RtpPacket.parse(data, extensions_map)
+        self.assertEqual(parsed.extensions, rtp.HeaderExtensions(frame_index=70000))
+        self.assertEqual(parsed.payload, b"\x01\x02")
+        self.assertEqual(parsed.serialize(extensions_map), data)
+
+        # without the extension negotiated, the frame index is not sent
+        self.assertEqual(
+            RtpPacket.parse(packet.serialize(rtp.HeaderExtensionsMap())).extensions,
+            rtp.HeaderExtensions(),
+        )
+
+    def test_with_payload_view(self):
+        extensions_map = rtp.HeaderExtensionsMap()
+        extensions_map.configure(
+            RTCRtpParameters(
+                headerExtensions=[
+                    RTCRtpHeaderExtensionParameters(id=3, uri=rtp.FRAME_INDEX_URI)
+                ]
+            )
+        )
+
+        frame = bytearray(b"\x01\x02\x03\x04\x05")
+        payload = RtpPayload(b"\x90\x80", memoryview(frame)[1:4])
+        self.assertEqual(len(payload), 5)
+        self.assertEqual(bytes(payload), b"\x90\x80\x02\x03\x04")
+
+        packet = RtpPacket(payload_type=97, sequence_number=1234, timestamp=5678)
+        packet.csrc = [1234]
+        packet.extensions.frame_index = 1
+        packet.payload = payload
+        packet.padding_size = 4
+        data = packet.serialize(extensions_map)
+
+        parsed = RtpPacket.parse(data, extensions_map)
+        self.assertEqual(parsed.csrc, [1234])
+        self.assertEqual(parsed.extensions, rtp.HeaderExtensions(frame_index=1))
+        self.assertEqual(parsed.payload, b"\x90\x80\x02\x03\x04")
+        self.assertEqual(parsed.padding_size, 4)
+
+        # the same packet with a plain payload
+        packet.payload = bytes(payload)
+        self.assertEqual(packet.serialize(extensions_map)[:-4], data[:-4])
+
+    def test_lazy_parse(self):
+        extensions_map = rtp.HeaderExtensionsMap()
+        extensions_map.configure(
+            RTCRtpParameters(
+                headerExtensions=[
+                    RTCRtpHeaderExtensionParameters(
+                        id=9, uri="urn:ietf:params:rtp-hdrext:sdes:mid"
+                    )
+                ]
+            )
+        )
+
+        # the header extensions are only decoded when accessed
+        data = bytearray(load("rtp_with_sdes_mid.bin"))
+        packet = RtpPacket.parse(data, extensions_map)
+        self.assertEqual(packet.sequence_number, 14156)
+        self.assertIsNone(packet._extensions)
+        self.assertIsNone(packet._payload)
+        self.assertEqual(packet.extensions, rtp.HeaderExtensions(mid="0"))
+        self.assertEqual(len(packet.payload), 54)
+
+        # malformed header extensions are rejected when parsing
+        data[16] = 0x9F
+        with self.assertRaises(ValueError) as cm:
+            RtpPacket.parse(data, extensions_map)
+        self.assertEqual(
+            str(cm.exception), "RTP one-byte header extension value is truncated"
+        )
+
+        # packets do not accept arbitrary attributes
+        with self.assertRaises(AttributeError):
+            packet.foo = 1
+
+    def test_serialize_into(self):
+        data = load("rtp_with_csrc.bin")
+        packet = RtpPacket.parse(data)
+
+        buffer = bytearray(1500)
+        length = packet.serialize_into(buffer)
+        self.assertEqual(length, len(data))
+        self.assertEqual(buffer[:length], data)
+
+        with self.assertRaises(ValueError) as cm:
+            packet.serialize_into(bytearray(len(data) - 1))
+        self.assertEqual(str(cm.exception), "RTP packet does not fit in the buffer")
+
+    def test_serialize_into_header_length(self):
+        extensions_map = rtp.HeaderExtensionsMap()
+        extensions_map.configure(
+            RTCRtpParameters(
+                headerExtensions=[
+                    RTCRtpHeaderExtensionParameters(
+                        id=1, uri="urn:ietf:params:rtp-hdrext:sdes:mid"
+                    )
+                ]
+            )
+        )
+
+        packet = RtpPacket(payload_type=97, sequence_number=1234, timestamp=5678)
+        packet.extensions.mid = "video"
+        packet.payload = b"\x01\x02"
+        data = packet.serialize(extensions_map)
+        self.assertEqual(packet.header_length(extensions_map), len(data) - 2)
+
+        # a buffer of the exact size is filled completely
+        buffer = bytearray(packet.header_length(extensions_map) + len(packet.payload))
+        self.assertEqual(packet.serialize_into(buffer, extensions_map), len(data))
+        self.assertEqual(buffer, data)
+
+    def test_set_abs_send_time(self):
+        extensions_map = rtp.HeaderExtensionsMap()
+        extensions_map.configure(
+            RTCRtpParameters(
+                headerExtensions=[
+                    RTCRtpHeaderExtensionParameters(
+                        id=1, uri="urn:ietf:params:rtp-hdrext:sdes:mid"
+                    ),
+                    RTCRtpHeaderExtensionParameters(
+                        id=2,
+                        uri="http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time",
+                    ),
+                ]
+            )
+        )
+
+        packet = RtpPacket(payload_type=97, sequence_number=1234, timestamp=5678)
+        packet.extensions.abs_send_time = 0x123456
+        packet.extensions.mid = "video"
+        packet.payload = b"\x01\x02"
+        data = bytearray(packet.serialize(extensions_map))
+        self.assertTrue(extensions_map.set_abs_send_time(data, 0x654321))
+
+        parsed = RtpPacket.parse(data, extensions_map)
+        self.assertEqual(parsed.extensions.abs_send_time, 0x654321)
+        self.assertEqual(parsed.extensions.mid, "video")
+        self.assertEqual(parsed.payload, b"\x01\x02")
+
+        # packets without the extension are left untouched
+        packet.extensions.abs_send_time = None
+        data = bytearray(packet.serialize(extensions_map))
+        self.assertFalse(extensions_map.set_abs_send_time(data, 0x654321))
+        self.assertEqual(data, packet.serialize(extensions_map))
+        data = bytearray(packet.serialize(rtp.HeaderExtensionsMap()))
+        self.assertFalse(extensions_map.set_abs_send_time(data, 0x654321))
+
+    def test_set_transport_sequence_number(self):
+        extensions_map = rtp.HeaderExtensionsMap()
+        extensions_map.configure(
+            RTCRtpParameters(
+                headerExtensions=[
+                    RTCRtpHeaderExtensionParameters(
+                        id=1, uri="urn:ietf:params:rtp-hdrext:sdes:mid"
+                    ),
+                    RTCRtpHeaderExtensionParameters(id=4, uri=TRANSPORT_CC_URI),
+                ]
+            )
+        )
+
+        packet = RtpPacket(payload_type=97, sequence_number=1234, timestamp=5678)
+        packet.extensions.mid = "video"
+        packet.extensions.transport_sequence_number = 0
+        packet.payload = b"\x01\x02"
+        data = bytearray(packet.serialize(extensions_map))
+        self.assertTrue(extensions_map.set_transport_sequence_number(data, 0xABCD))
+
+        parsed = RtpPacket.parse(data, extensions_map)
+        self.assertEqual(parsed.extensions.transport_sequence_number, 0xABCD)
+        self.assertEqual(parsed.extensions.mid, "video")
+        self.assertEqual(parsed.payload, b"\x01\x02")
+
+        self.assertEqual(extensions_map.get_transport_sequence_number(data), 0xABCD)
+
+        # transport-cc was not negotiated
+        self.assertIsNone(
+            rtp.HeaderExtensionsMap().get_transport_sequence_number(data)
+        )
+
+        # packets without the extension
+        packet.extensions.transport_sequence_number = None
+        data = packet.serialize(extensions_map)
+        self.assertFalse(
+            extensions_map.set_transport_sequence_number(bytearray(data), 1)
+        )
+        self.assertIsNone(extensions_map.get_transport_sequence_number(data))
+
     def test_with_sdes_mid_truncated(self):
         data = load("rtp_with_sdes_mid.bin")
 
@@ -386,6 +611,46 @@ class RtpPacketTest(TestCase):
                 str(cm.exception), "RTP packet has truncated extension value"
             )
 
+    def test_with_header_extension_value_truncated(self):
+        header = b"\x90\x00\x00\x01\x00\x00\x00\x00\x00\x00\x04\xd2"
+
+        # one-byte header, the 4-byte value overruns the extension block
+        data = header + b"\xbe\xde\x00\x01\x93\x00\x00\x00" + b"\x01\x02"
+        with self.assertRaises(ValueError) as cm:
+            RtpPacket.parse(data)
+        self.assertEqual(
+            str(cm.exception), "RTP one-byte header extension value is truncated"
+        )
+        self.assertIsNone(find_header_extension(data, 9))
+
+        # two-byte header, the 8-byte value overruns the extension block
+        data = header + b"\x10\x00\x00\x01\x09\x08\x00\x00" + b"\x01\x02"
+        with self.assertRaises(ValueError) as cm:
+            RtpPacket.parse(data)
+        self.assertEqual(
+            str(cm.exception), "RTP two-byte header extension value is truncated"
+        )
+        self.assertIsNone(find_header_extension(data, 9))
+
+    def test_with_header_extension_value_invalid(self):
+        extensions_map = rtp.HeaderExtensionsMap()
+        extensions_map.configure(
+            RTCRtpParameters(
+                headerExtensions=[
+                    RTCRtpHeaderExtensionParameters(id=4, uri=TRANSPORT_CC_URI)
+                ]
+            )
+        )
+
+        # the 1-byte transport-wide sequence number is only decoded on access
+        data = (
+            b"\x90\x00\x00\x01\x00\x00\x00\x00\x00\x00\x04\xd2"
+            + b"\xbe\xde\x00\x01\x40\x01\x00\x00"
+        )
+        packet = RtpPacket.parse(data, extensions_map)
+        with self.assertRaises(ValueError):
+            packet.extensions
+
     def test_truncated(self):
         data = load("rtp.bin")[0:11]
         with self.assertRaises(ValueError) as cm:
@@ -414,6 +679,28 @@ class RtpUtilTest(TestCase):
         self.assertEqual(pack_packets_lost(1), b"\x00\x00\x01")
         self.assertEqual(pack_packets_lost(8388607), b"\x7f\xff\xff")
 
+    def test_pack_red_payload(self):
+        # primary only
+        data = pack_red_payload(120, b"primary", [])
+        self.assertEqual(data, b"\x78primary")
+
+        # with redundant blocks
+        data = pack_red_payload(120, b"primary", [(320, b"old"), (160, b"newer")])
+        self.assertEqual(
+            data,
+            b"\xf8\x05\x00\x03\xf8\x02\x80\x05\x78oldnewerprimary",
+        )
+
+        # block which does not fit
+        with self.assertRaises(ValueError) as cm:
+            pack_red_payload(120, b"primary", [(0x4000, b"old")])
+        self.assertEqual(
+            str(cm.exception), "Redundant block timestamp offset is too large"
+        )
+        with self.assertRaises(ValueError) as cm:
+            pack_red_payload(120, b"primary", [(160, b"x" * 1024)])
+        self.assertEqual(str(cm.exception), "Redundant block is too long")
+
     def test_pack_remb_fci(self):
         # exponent = 0, mantissa = 0
         data = pack_remb_fci(0, [2529072847])
@@ -441,6 +728,26 @@ class RtpUtilTest(TestCase):
         self.assertEqual(unpack_packets_lost(b"\x00\x00\x01"), 1)
         self.assertEqual(unpack_packets_lost(b"\x7f\xff\xff"), 8388607)
 
+    def test_unpack_red_payload(self):
+        self.assertEqual(unpack_red_payload(b"\x78primary"), [(120, 0, b"primary")])
+
+        data = b"\xf8\x05\x00\x03\xf8\x02\x80\x05\x78oldnewerprimary"
+        self.assertEqual(
+            unpack_red_payload(data),
+            [(120, 320, b"old"), (120, 160, b"newer"), (120, 0, b"primary")],
+        )
+
+        # truncated
+        with self.assertRaises(ValueError) as cm:
+            unpack_red_payload(b"")
+        self.assertEqual(str(cm.exception), "RED header is truncated")
+        with self.assertRaises(ValueError) as cm:
+            unpack_red_payload(data[0:3])
+        self.assertEqual(str(cm.exception), "RED header is truncated")
+        with self.assertRaises(ValueError) as cm:
+            unpack_red_payload(data[0:11])
+        self.assertEqual(str(cm.exception), "RED block is truncated")
+
     def test_unpack_remb_fci(self):
         # junk
         with self.assertRaises(ValueError):
@@ -471,6 +778,55 @@ class RtpUtilTest(TestCase):
         self.assertEqual(bitrate, 0x3FFFF << 63)
         self.assertEqual(ssrcs, [2529072847])
 
+    def test_pack_transport_cc_fci(self):
+        # status vector chunk with a small and a large delta
+        data = pack_transport_cc_fci(10, 3, [64000, 64250, None, 164000])
+        self.assertEqual(
+            data,
+            b"\x00\x0a\x00\x04\x00\x00\x01\x03\xd4\x80\x00\x01\x01\x8f\x00\x00",
+        )
+        self.assertEqual(
+            unpack_transport_cc_fci(data),
+            (10, 3, [(10, 64000), (11, 64250), (12, None), (13, 164000)]),
+        )
+
+        # run length chunks
+        arrival_times = [128000 + 1000 * i for i in range(20)] + [None] * 10
+        arrival_times.append(168000)
+        data = pack_transport_cc_fci(65530, 255, arrival_times)
+        self.assertEqual(data[8:14], b"\x20\x14\x00\x0a\xd0\x00")
+        base, feedback_count, packets = unpack_transport_cc_fci(data)
+        self.assertEqual(base, 65530)
+        self.assertEqual(feedback_count, 255)
+        self.assertEqual(
+            packets,
+            [((65530 + i) & 0xFFFF, t) for i, t in enumerate(arrival_times)],
+        )
+
+        # receive delta out of range
+        with self.assertRaises(ValueError):
+            pack_transport_cc_fci(0, 0, [0, 10000000])
+
+    def test_unpack_transport_cc_fci(self):
+        # one-bit status vector chunk
+        data = b"\x00\x00\x00\x03\x00\x00\x00\x00\xa8\x00\x04\x08"
+        self.assertEqual(
+            unpack_transport_cc_fci(data), (0, 0, [(0, 1000), (1, None), (2, 3000)])
+        )
+
+        # truncated
+        with self.assertRaises(ValueError) as cm:
+            unpack_transport_cc_fci(data[0:7])
+        self.assertEqual(str(cm.exception), "Transport-cc feedback length is invalid")
+        with self.assertRaises(ValueError) as cm:
+            unpack_transport_cc_fci(data[0:9])
+        self.assertEqual(
+            str(cm.exception), "Transport-cc packet status chunk is truncated"
+        )
+        with self.assertRaises(ValueError) as cm:
+            unpack_transport_cc_fci(data[0:11])
+        self.assertEqual(str(cm.exception), "Transport-cc receive delta is truncated")
+
     def test_unpack_header_extensions(self):
         # none
         self.assertEqual(unpack_header_extensions(0, None), [])
@@ -666,3 +1022,48 @@ class RtpUtilTest(TestCase):
         self.assertEqual(recovered.csrc, packet.csrc)
         self.assertEqual(recovered.extensions, packet.extensions)
         self.assertEqual(recovered.payload, packet.payload)
+
+    def test_rtx_data(self):
+        extensions_map = rtp.HeaderExtensionsMap()
+        extensions_map.configure(
+            RTCRtpParameters(
+                headerExtensions=[
+                    RTCRtpHeaderExtensionParameters(
+                        id=9, uri="urn:ietf:params:rtp-hdrext:sdes:mid"
+                    )
+                ]
+            )
+        )
+
+        for name in ["rtp.bin", "rtp_with_csrc.bin", "rtp_with_sdes_mid.bin"]:
+            data = load(name)
+            packet = RtpPacket.parse(data, extensions_map)
+
+            # wrapping the serialized packet matches wrapping the parsed packet
+            rtx_data = wrap_rtx_data(
+                data, payload_type=112, sequence_number=12345, ssrc=1234
+            )
+            rtx = wrap_rtx(packet, payload_type=112, sequence_number=12345, ssrc=1234)
+            self.assertEqual(rtx_data, rtx.serialize(extensions_map), name)
+
+            recovered = unwrap_rtx(
+                RtpPacket.parse(rtx_data, extensions_map),
+                payload_type=packet.payload_type,
+                ssrc=packet.ssrc,
+            )
+            self.assertEqual(recovered.sequence_number, packet.sequence_number)
+            self.assertEqual(recovered.extensions, packet.extensions)
+            self.assertEqual(recovered.payload, packet.payload)
+
+    def test_rtx_data_with_padding(self):
+        packet = RtpPacket(payload_type=96, sequence_number=4567, ssrc=2345)
+        packet.payload = b"\x01\x02\x03"
+        packet.padding_size = 5
+
+        rtx_data = wrap_rtx_data(
+            packet.serialize(), payload_type=97, sequence_number=123, ssrc=1234
+        )
+        rtx = RtpPacket.parse(rtx_data)
+        self.assertEqual(rtx.payload_type, 97)
+        self.assertEqual(rtx.padding_size, 0)
+        self.assertEqual(rtx.payload, b"\x11\xd7\x01\x02\x03")
@@ -1,6 +1,8 @@
+import threading
 from unittest import TestCase
 
 from aiortc.utils import (
+    DropOldestQueue,
     uint16_add,
     uint16_gt,
     uint16_gte,
@@ -58,3 +60,56 @@ class UtilsTest(TestCase):
         self.assertTrue(uint32_gte(2147483648, 1))
         self.assertFalse(uint32_gte(2147483649, 1))
         self.assertFalse(uint32_gte(4294967295, 1))
+
+
+class DropOldestQueueTest(TestCase):
+    def test_put_get(self):
+        q = DropOldestQueue(maxsize=4)
+        for i in range(3):
+            self.assertEqual(q.put(i), 0)
+        self.assertEqual(q.depth, 3)
+        self.assertEqual([q.get() for i in range(3)], [0, 1, 2])
+        self.assertEqual(q.depth, 0)
+        self.assertEqual(q.dropped, 0)
+        self.assertEqual(q.max_depth, 3)
+        self.assertIs(q.get_nowait(), DropOldestQueue.EMPTY)
+
+    def test_drop_oldest(self):
+        q = DropOldestQueue(maxsize=4)
+        for i in range(4):
+            q.put(i)
+        self.assertEqual(q.put(4), 1)
+        self.assertEqual(q.put(5), 1)
+        self.assertEqual(q.dropped, 2)
+        self.assertEqual(q.max_depth, 4)
+
+        # the end marker does not drop frames
+        self.assertEqual(q.put(None), 0)
+        self.assertEqual([q.get() for i in range(5)], [2, 3, 4, 5, None])
+
+    def test_unbounded(self):
+        q = DropOldestQueue(maxsize=None)
+        for i in range(20):
+            self.assertEqual(q.put(i), 0)
+        self.assertEqual(q.dropped, 0)
+        self.assertEqual(q.max_depth, 20)
+        self.assertEqual(q.get(), 0)
+
+    def test_get_from_thread(self):
+        q = DropOldestQueue(maxsize=8)
+        items = []
+
+        def worker():
+            while True:
+                item = q.get()
+                if item is None:
+                    break
+                items.append(item)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        for i in range(5):
+            q.put(i)
+        q.put(None)
+        thread.join()
+        self.assertEqual(items, [0, 1, 2, 3, 4])
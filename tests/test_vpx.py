@@ -8,6 +8,8 @@ from aiortc.codecs.vpx import (
     VpxPayloadDescriptor,
     _vpx_assert,
     number_of_threads,
+    vp8_depayload,
+    vpx_packetize,
 )
 from aiortc.rtcrtpparameters import RTCRtpCodecParameters
 
@@ -246,6 +248,23 @@ class Vp8Test(CodecTestCase):
         self.assertEqual(number_of_threads(1920 * 1080, 4), 2)
         self.assertEqual(number_of_threads(1920 * 1080, 2), 1)
 
+    def test_packetize(self):
+        data = bytes(range(256)) * 12
+        payloads = vpx_packetize(data, picture_id=4711)
+        self.assertEqual([len(p) for p in payloads], [1300, 1300, 484])
+
+        # only the first payload starts the partition
+        descr, rest = VpxPayloadDescriptor.parse(bytes(payloads[0]))
+        self.assertEqual(descr.partition_start, 1)
+        self.assertEqual(descr.picture_id, 4711)
+        descr, rest = VpxPayloadDescriptor.parse(bytes(payloads[1]))
+        self.assertEqual(descr.partition_start, 0)
+
+        # the payloads are views on the frame
+        for payload in payloads:
+            self.assertIs(payload.data.obj, data)
+        self.assertEqual(b"".join(vp8_depayload(p) for p in payloads), data)
+
     def test_roundtrip_1280_720(self):
         self.roundtrip_video(VP8_CODEC, 1280, 720)
 
@@ -2,6 +2,7 @@ import asyncio
 import logging
 import os
 
+from aiortc import clock
 from aiortc.rtcdtlstransport import RTCCertificate, RTCDtlsTransport
 
 
@@ -31,6 +32,16 @@ class DummyConnection:
             raise ConnectionError
         return data
 
+    def recv_pending(self, limit):
+        datagrams = []
+        while len(datagrams) < limit and not self.rx_queue.empty():
+            data = self.rx_queue.get_nowait()
+            if data is None:
+                self.rx_queue.put_nowait(data)
+                break
+            datagrams.append(data)
+        return datagrams
+
     async def send(self, data):
         if self.closed:
             raise ConnectionError
@@ -55,6 +66,14 @@ class DummyIceTransport:
     async def _recv(self):
         return await self._connection.recv()
 
+    async def _recv_timed(self):
+        data = await self._connection.recv()
+        return data, clock.current_ms()
+
+    def _recv_pending(self, limit):
+        now = clock.current_ms()
+        return [(data, now) for data in self._connection.recv_pending(limit)]
+
     async def _send(self, data):
         await self._connection.send(data)
 